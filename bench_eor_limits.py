@@ -0,0 +1,251 @@
+import os
+import sys
+import json
+import copy
+import time
+import platform
+import statistics
+import tempfile
+import numpy as np
+import yaml
+import eor_limits
+import plot_eor_limits
+
+##################################################################
+#####                Synthetic catalog generator             #####
+##################################################################
+
+# Catalog sizes to benchmark: number of files, z-bins per file and k-bins per z-bin.
+# 'current' is roughly today's data/ catalog, the others are growth scenarios.
+SCALES = {
+    'current': {'n_datasets': 30, 'n_z': 4, 'n_k': 20},
+    'many_datasets': {'n_datasets': 2000, 'n_z': 4, 'n_k': 20},
+    'many_k': {'n_datasets': 1, 'n_z': 10, 'n_k': 10000},
+}
+
+def _flow(values) -> str:
+    # YAML flow sequence, with floats written in full precision (17 significant digits, so the tiny
+    # offsets that keep k increasing survive) and always with a decimal point so PyYAML reads them as floats
+    if isinstance(values[0], (list, np.ndarray)):
+        return '[' + ',\n         '.join(_flow(row) for row in values) + ']'
+    return '[' + ', '.join(f'{v:.16e}' for v in values) + ']'
+
+def generate_catalog(out_dir: str, n_datasets: int, n_z: int, n_k: int, seed: int = 0) -> list[str]:
+    """
+    Write n_datasets random YAML files in the example.yaml schema, each with n_z z-bins of n_k k-bins,
+    that pass strict validation. Returns the dataset names.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    names = []
+    for i in range(n_datasets):
+        telescope = f'Telescope{i % 10}'
+        author, year = f'Synthetic{i}', 2010 + i % 20
+        z = np.sort(rng.uniform(6, 25, n_z))
+        log_k = np.sort(rng.uniform(-2.5, 1.5, (n_z, n_k)), axis=1) + np.arange(n_k) * 1e-9
+        k = 10**log_k
+        width = 10**rng.uniform(-3, -1.5, (n_z, n_k))
+        delta_squared = 10**rng.uniform(1, 8, (n_z, n_k))
+        content = (f"telescope: {telescope}\nauthor: {author}\nyear: {year}\ndoi: 10.0000/synthetic.{i}\n"
+                   f"notes:\n    - Synthetic dataset generated by bench_eor_limits.py.\n"
+                   f"data:\n"
+                   f"    delta_squared:\n        {_flow(delta_squared)}\n"
+                   f"    k:\n        {_flow(k)}\n"
+                   f"    k_lower:\n        {_flow(k * (1 - width))}\n"
+                   f"    k_upper:\n        {_flow(k * (1 + width))}\n"
+                   f"    z: {_flow(z)}\n"
+                   f"    z_lower: {_flow(z - 0.25)}\n"
+                   f"    z_upper: {_flow(z + 0.25)}\n"
+                   f"    z_tags: {json.dumps([f'Band {j+1}' for j in range(n_z)])}\n")
+        name = f'{author}{year}'
+        with open(os.path.join(out_dir, name + '.yaml'), 'w') as file:
+            file.write(content)
+        names.append(name)
+    return names
+
+##################################################################
+#####                       Benchmarks                       #####
+##################################################################
+
+def _time(func, repeat: int, setup=None) -> dict:
+    # Best and median wall time over repeat calls; setup() runs untimed and returns func's arguments
+    times = []
+    for _ in range(repeat):
+        args = setup() if setup is not None else None
+        args = () if args is None else args
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+    return {'min': min(times), 'median': statistics.median(times), 'repeat': repeat}
+
+def _forget_cache(data_dir: str, keep_file: bool = False) -> None:
+    # Drop the in-memory catalog cache and, unless keep_file, the compiled cache file too
+    for mmap in [False, True]:
+        eor_limits._catalog_caches.pop((os.path.abspath(data_dir), mmap), None)
+    if keep_file:
+        return
+    path = os.path.join(data_dir, eor_limits.CATALOG_CACHE_FILE)
+    if os.path.exists(path):
+        os.remove(path)
+
+def run_stages(data_dir: str, repeat: int = 3) -> dict:
+    """
+    Time every stage of the pipeline on the catalog in data_dir. Returns {stage: timings}.
+    """
+    names = sorted(eor_limits.get_available_datasets(data_dir))
+    yaml_dicts = []
+    for name in names:
+        with open(os.path.join(data_dir, name + '.yaml'), 'r') as file:
+            yaml_dicts.append(yaml.safe_load(file).get('data', {}))
+    processed = copy.deepcopy(yaml_dicts)
+    for d in processed:
+        eor_limits.process_data(d)
+
+    def process_all(dicts):
+        for d in dicts:
+            eor_limits.process_data(d)
+
+    def validate_all(mode):
+        for d in processed:
+            eor_limits.validate_data(d, mode=mode)
+
+    stages = {}
+    stages['load_dataset'] = _time(lambda: [eor_limits.load_dataset(n, use_cache=False, data_dir=data_dir) for n in names], repeat)
+    stages['compile_catalog'] = _time(lambda: eor_limits.compile_catalog(data_dir), repeat,
+                                      setup=lambda: _forget_cache(data_dir))
+    stages['load_dataset_cached'] = _time(lambda: [eor_limits.load_dataset(n, data_dir=data_dir) for n in names], repeat,
+                                          setup=lambda: _forget_cache(data_dir, keep_file=True))
+    stages['process_data'] = _time(process_all, repeat, setup=lambda: (copy.deepcopy(yaml_dicts),))
+    stages['validate_data'] = _time(lambda: validate_all('fast'), repeat)
+    stages['validate_data_strict'] = _time(lambda: validate_all('strict'), repeat)
+    stages['to_pandas_df'] = _time(lambda: [eor_limits.to_pandas_df(d) for d in processed], repeat)
+
+    datasets = [eor_limits.load_dataset(n, data_dir=data_dir) for n in names]
+    stages['lowest_limits'] = _time(lambda: [eor_limits.reduce_dataset(d, 'lowest') for d in datasets], repeat)
+    for render_mode in plot_eor_limits.RENDER_MODES:
+        stages[f'plot_{render_mode}'] = _time(lambda: plot_eor_limits.plot(datasets, render_mode=render_mode, use_cache=False), repeat)
+    stages['plot_envelope'] = _time(lambda: plot_eor_limits.plot(datasets, plot_type='envelope'), repeat)
+    return stages
+
+def run(scales: list[str], repeat: int = 3, data_dir: str = None, seed: int = 0) -> dict:
+    """
+    Benchmark each synthetic scale (or the catalog in data_dir) and return the JSON report.
+    """
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'results': {},
+    }
+    if data_dir is not None:
+        report['results']['data_dir'] = {'scale': {'data_dir': os.path.abspath(data_dir)},
+                                         'stages': run_stages(data_dir, repeat)}
+    for scale in scales:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            generate_catalog(tmp_dir, seed=seed, **SCALES[scale])
+            report['results'][scale] = {'scale': SCALES[scale], 'stages': run_stages(tmp_dir, repeat)}
+            _forget_cache(tmp_dir, keep_file=True)
+    return report
+
+def smoke(scales: list[str], max_datasets: int = 3, seed: int = 0) -> list[str]:
+    """
+    Quick check that every scale generates a catalog that loads with strict validation and plots,
+    using at most max_datasets files per scale. Returns the failures.
+    """
+    failures = []
+    for scale in scales:
+        params = dict(SCALES[scale], n_datasets=min(SCALES[scale]['n_datasets'], max_datasets))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            names = generate_catalog(tmp_dir, seed=seed, **params)
+            results = eor_limits.load_datasets(names, validation='strict', use_cache=False, data_dir=tmp_dir)
+            failures += [f'{scale}/{result.name}: {result.error}' for result in results if not result.ok]
+            try:
+                plot_eor_limits.plot([result.dataset for result in results if result.ok], use_cache=False)
+            except Exception as e:
+                failures.append(f'{scale}/plot: {e}')
+        print(f'{scale:>16}: {"ok" if not failures else "FAILED"}')
+    return failures
+
+def compare(baseline: dict, current: dict, threshold: float = 0.25, min_time: float = 1e-3) -> list[str]:
+    """
+    Stages whose best time in current is more than (1 + threshold) times the baseline.
+    Stages faster than min_time in both reports are ignored, as their timings are mostly noise.
+    """
+    regressions = []
+    for scale, result in current['results'].items():
+        base_stages = baseline['results'].get(scale, {}).get('stages', {})
+        for stage, timing in result['stages'].items():
+            if stage not in base_stages:
+                continue
+            old, new = base_stages[stage]['min'], timing['min']
+            ratio = new / old if old > 0 else np.inf
+            status = 'ok'
+            if max(old, new) >= min_time and ratio > 1 + threshold:
+                status = 'REGRESSION'
+                regressions.append(f'{scale}/{stage}')
+            print(f'{scale:>16} {stage:>22}: {old*1e3:10.2f} ms -> {new*1e3:10.2f} ms ({ratio:5.2f}x) {status}')
+    return regressions
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark the eor_limits pipeline on synthetic catalogs.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="Run the benchmarks and write a JSON report.")
+    run_parser.add_argument('--scales', nargs='*', default=['current'], choices=list(SCALES),
+                            help="Synthetic catalog scales to benchmark.")
+    run_parser.add_argument('--data-dir', default=None, help="Also benchmark the catalog in this directory.")
+    run_parser.add_argument('--repeat', type=int, default=3, help="Number of timed repetitions per stage.")
+    run_parser.add_argument('--seed', type=int, default=0, help="Random seed of the synthetic catalogs.")
+    run_parser.add_argument('--output', default=None, help="JSON report path (default: print to stdout).")
+
+    compare_parser = subparsers.add_parser('compare', help="Compare two JSON reports, failing on regressions.")
+    compare_parser.add_argument('baseline', help="JSON report of the reference run.")
+    compare_parser.add_argument('current', help="JSON report of the run to check.")
+    compare_parser.add_argument('--threshold', type=float, default=0.25,
+                                help="Allowed slowdown as a fraction of the baseline time (default: 0.25).")
+    compare_parser.add_argument('--min-time', type=float, default=1e-3,
+                                help="Ignore stages faster than this many seconds in both reports.")
+
+    smoke_parser = subparsers.add_parser('smoke', help="Check that every scale generates, validates and plots.")
+    smoke_parser.add_argument('--scales', nargs='*', default=list(SCALES), choices=list(SCALES))
+    smoke_parser.add_argument('--max-datasets', type=int, default=3, help="Files generated per scale.")
+
+    generate_parser = subparsers.add_parser('generate', help="Only write a synthetic catalog.")
+    generate_parser.add_argument('out_dir', help="Directory to write the YAML files to.")
+    generate_parser.add_argument('--scale', default='current', choices=list(SCALES))
+    generate_parser.add_argument('--n-datasets', type=int, default=None)
+    generate_parser.add_argument('--n-z', type=int, default=None)
+    generate_parser.add_argument('--n-k', type=int, default=None)
+    generate_parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        report = run(args.scales, repeat=args.repeat, data_dir=args.data_dir, seed=args.seed)
+        if args.output:
+            with open(args.output, 'w') as file:
+                json.dump(report, file, indent=2)
+        else:
+            print(json.dumps(report, indent=2))
+    elif args.command == 'compare':
+        with open(args.baseline, 'r') as file:
+            baseline = json.load(file)
+        with open(args.current, 'r') as file:
+            current = json.load(file)
+        regressions = compare(baseline, current, threshold=args.threshold, min_time=args.min_time)
+        if regressions:
+            print(f"{len(regressions)} stage(s) regressed by more than {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1 if regressions else 0)
+    elif args.command == 'smoke':
+        failures = smoke(args.scales, max_datasets=args.max_datasets)
+        for failure in failures:
+            print(failure)
+        sys.exit(1 if failures else 0)
+    else:
+        scale = dict(SCALES[args.scale])
+        for key in ['n_datasets', 'n_z', 'n_k']:
+            if getattr(args, key) is not None:
+                scale[key] = getattr(args, key)
+        names = generate_catalog(args.out_dir, seed=args.seed, **scale)
+        print(f"Wrote {len(names)} datasets to {args.out_dir}")
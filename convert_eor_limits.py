@@ -0,0 +1,42 @@
+import os
+import sys
+import eor_limits
+
+def convert(source: str, output: str, validation: str = 'fast') -> eor_limits.DataSet:
+    """
+    Convert one dataset file between the YAML, CSV and npz formats (taken from the file extensions),
+    reading it into a DataSet and writing that back out.
+    """
+    dataset = eor_limits.read_dataset(source, validation=validation)
+    eor_limits.write_dataset(dataset, output)
+    return dataset
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Convert EoR limit datasets between YAML, CSV and npz.")
+    parser.add_argument('inputs', nargs='+', help="Dataset files to convert (.yaml, .csv or .npz).")
+    parser.add_argument('--to', required=True, choices=eor_limits.DATASET_FORMATS, help="Output format.")
+    parser.add_argument('--output-dir', default=None, help="Directory for the outputs (default: next to each input).")
+    parser.add_argument('--validation', default='strict', choices=eor_limits.VALIDATION_MODES,
+                        help="Validation mode applied to every input.")
+    args = parser.parse_args()
+
+    n_failed = 0
+    for source in args.inputs:
+        stem = os.path.splitext(os.path.basename(source))[0]
+        output_dir = args.output_dir if args.output_dir is not None else os.path.dirname(source)
+        output = os.path.join(output_dir, f'{stem}.{args.to}')
+        if os.path.abspath(output) == os.path.abspath(source):
+            print(f"{source}: skipped, already in {args.to} format")
+            continue
+        try:
+            os.makedirs(output_dir or '.', exist_ok=True)
+            convert(source, output, validation=args.validation)
+            print(f"{source} -> {output}")
+        except (OSError, ValueError) as e:
+            n_failed += 1
+            print(f"{source}: FAILED")
+            for violation in getattr(e, 'violations', [str(e)]):
+                print(f"    {violation}")
+    print(f"{len(args.inputs) - n_failed}/{len(args.inputs)} files converted.")
+    sys.exit(1 if n_failed else 0)
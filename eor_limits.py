@@ -2,117 +2,526 @@ import attrs
 import numpy as np
 import yaml
 import os
+import json
+import hashlib
+import io
+import struct
+import zipfile
+import threading
+import collections
+import ast
+import operator
+import functools
+import contextlib
+import logging
+import time
+import atexit
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+##################################################################
+#####                      Timing spans                      #####
+##################################################################
+
+# Set EOR_LIMITS_TIMING=1 to log every span as a JSON line on the 'eor_limits.timing' logger.
+# When timing is off and no recorder is active, span() and @timed cost one flag check.
+TIMING_ENV_VAR = 'EOR_LIMITS_TIMING'
+timing_logger = logging.getLogger('eor_limits.timing')
+_timing_enabled = os.environ.get(TIMING_ENV_VAR, '') not in ('', '0')
+_timing_local = threading.local()
+
+def set_timing(enabled: bool) -> None:
+    global _timing_enabled
+    _timing_enabled = enabled
+    if enabled and not timing_logger.handlers:
+        timing_logger.addHandler(logging.StreamHandler())
+        timing_logger.setLevel(logging.INFO)
+
+def timing_enabled() -> bool:
+    return _timing_enabled
+
+def _timing_active() -> bool:
+    return _timing_enabled or getattr(_timing_local, 'records', None) is not None
+
+class _Span:
+    __slots__ = ('name', 'fields', 'start')
+    
+    def __init__(self, name: str, fields: dict):
+        self.name = name
+        self.fields = fields
+        
+    def __enter__(self):
+        _timing_local.depth = getattr(_timing_local, 'depth', 0) + 1
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc_info):
+        duration = time.perf_counter() - self.start
+        _timing_local.depth -= 1
+        record = {'span': self.name, 'ms': round(duration * 1e3, 3), 'depth': _timing_local.depth, **self.fields}
+        records = getattr(_timing_local, 'records', None)
+        if records is not None:
+            records.append(record)
+        if _timing_enabled:
+            timing_logger.info(json.dumps(record, default=str))
+        return False
+
+class _NullSpan:
+    __slots__ = ()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+def span(name: str, **fields):
+    """
+    Context manager timing the enclosed block as a span called name, with extra fields in its record.
+    """
+    return _Span(name, fields) if _timing_active() else _NULL_SPAN
+
+def timed(name: str = None):
+    """
+    Decorator timing every call of a function as a span (named after the function by default).
+    """
+    def decorator(func):
+        label = name or func.__name__
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _timing_active():
+                return func(*args, **kwargs)
+            with _Span(label, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+@contextlib.contextmanager
+def record_spans():
+    """
+    Collect the records of all spans finished in this thread while the block runs, 
+    whether or not timing logs are enabled. Yields the list that records are appended to.
+    """
+    previous = getattr(_timing_local, 'records', None)
+    _timing_local.records = []
+    try:
+        yield _timing_local.records
+    finally:
+        _timing_local.records = previous
+
+if _timing_enabled:
+    set_timing(True)
 
 ##################################################################
 #####            Converter and Validator functions           #####
 ##################################################################
 
+# Arithmetic allowed in numeric strings, e.g. "21**2" or "-1.5e3/2". Operands are converted 
+# to float before every operation, so large powers overflow quickly instead of growing huge integers.
+_AST_BINARY_OPS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.Pow: operator.pow,
+}
+_AST_UNARY_OPS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+_AST_NAMES = {'nan': np.nan, 'inf': np.inf}
+
+@functools.lru_cache(maxsize=65536)
+def _eval_expression(expr: str) -> float:
+    
+    def eval_node(node):
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+            return float(node.value)
+        elif isinstance(node, ast.BinOp) and type(node.op) in _AST_BINARY_OPS:
+            return float(_AST_BINARY_OPS[type(node.op)](eval_node(node.left), eval_node(node.right)))
+        elif isinstance(node, ast.UnaryOp) and type(node.op) in _AST_UNARY_OPS:
+            return _AST_UNARY_OPS[type(node.op)](eval_node(node.operand))
+        elif isinstance(node, ast.Name) and node.id.lower() in _AST_NAMES:
+            return _AST_NAMES[node.id.lower()]
+        raise ValueError("only numbers, + - * / ** and parentheses are allowed")
+    
+    return eval_node(ast.parse(expr.strip(), mode='eval').body)
+
+def _parse_item(item) -> float:
+    if item is None:
+        return np.nan
+    elif isinstance(item, str):
+        try:
+            return float(item)
+        except ValueError:
+            return _eval_expression(item)
+    elif isinstance(item, (int, float)):
+        return float(item)
+    raise TypeError(f"expected a number or an expression string, got {type(item).__name__}")
+
+def _parse_numeric(values, field: str, row: int = None):
+    """
+    Convert a list of numbers, numeric strings and arithmetic expression strings to a float64 array.
+    Lists that are already numeric are converted in one np.asarray call. Non-list values are
+    converted as single items (the shape is checked by validate_data).
+    """
+    if not isinstance(values, (list, tuple, np.ndarray)):
+        where = f" at row {row}" if row is not None else ""
+        try:
+            return _parse_item(values)
+        except (ValueError, TypeError, SyntaxError, ZeroDivisionError, OverflowError) as e:
+            raise ValueError(f"Could not parse {values!r} in field '{field}'{where}: {e}") from None
+    
+    # Fast path for numbers and plain numeric strings
+    try:
+        return np.asarray(values, dtype=np.float64)
+    except (ValueError, TypeError):
+        pass
+    
+    # Slow path, item by item
+    parsed = np.empty(len(values))
+    for col, item in enumerate(values):
+        try:
+            parsed[col] = _parse_item(item)
+        except (ValueError, TypeError, SyntaxError, ZeroDivisionError, OverflowError) as e:
+            where = f"row {row}, column {col}" if row is not None else f"index {col}"
+            raise ValueError(f"Could not parse {item!r} in field '{field}' at {where}: {e}") from None
+    return parsed
+
+@timed()
 def process_data(d: dict) -> dict:
         
-    # Checking if empty 
-    def to_empty(arr):
-        return [] if arr is [] or arr is None else arr
-        
-    # Evaluating expressions
-    def to_eval(arr):
-        # Eval an item. Allows for "21**2" type expressions
-        def eval_item(item):
-            # Only allow safe evaluation of math expressions
-            if item=='nan':
-                return np.nan
-            elif isinstance(item, str):
-                item = eval(str(item), {"__builtins__": None}, {})
-                return float(item)
-            elif isinstance(item, (int, float)):
-                return float(item)
-
-        # Process the list recursively (handles nested lists)
-        if isinstance(arr, (list, np.ndarray)):
-            return [to_eval(x) for x in arr]
-        else:
-            return eval_item(arr)
-        
     # Mandatory fields
     mandatory_fields = ['delta_squared', 'z', 'k']
     for field in mandatory_fields:
         if field not in d:
             raise ValueError(f"Mandatory field '{field}' is missing in data.")
     
-    # Process each attribute
+    # Process each attribute: 1D fields become lists of floats, 2D fields lists of float64 rows
     for attr_name in ['z', 'z_lower', 'z_upper', 'k', 'k_lower', 'k_upper', 'delta_squared', 'z_tags']:
         arr = d.get(attr_name, [])
-        arr = to_empty(arr)
-        if attr_name != 'z_tags':
-            arr = to_eval(arr)
+        if arr is None:
+            arr = []
+        if attr_name in ['z', 'z_lower', 'z_upper']:
+            arr = _parse_numeric(arr, attr_name)
+            arr = arr.tolist() if isinstance(arr, np.ndarray) else arr
+        elif attr_name in ['k', 'k_lower', 'k_upper', 'delta_squared']:
+            if not isinstance(arr, (list, tuple, np.ndarray)):
+                raise ValueError(f"{attr_name} must be a 2D array of numbers.")
+            arr = [_parse_numeric(row, attr_name, i) for i, row in enumerate(arr)]
         d[attr_name] = arr
         
-def validate_data(d: dict) -> None:
+class DataValidationError(ValueError):
+    """
+    Raised by validate_data with every violation found, available as a list in .violations.
+    """
     
-    def is_allowed(arr, allowed_types):
-        return all(isinstance(x, allowed_types) for x in arr)
-    
-    def is_same_length(arr1, arr2):
-        if isinstance(arr1, (list, np.ndarray)) and isinstance(arr2, (list, np.ndarray)):
-            if len(arr1) != len(arr2):
-                return False
-            return all(is_same_length(a1, a2) for a1, a2 in zip(arr1, arr2))
-        else:
-            return True
+    def __init__(self, violations: list[str]):
+        self.violations = list(violations)
+        super().__init__("\n".join(self.violations))
         
+    def __reduce__(self):
+        # Keep the violations list intact when sent back from a worker process
+        return (DataValidationError, (self.violations,))
+
+VALIDATION_MODES = ['fast', 'strict']
+
+def _as_1d(arr) -> np.ndarray:
+    # Float array of a 1D field, or None if it is not a flat list of numbers
+    try:
+        values = np.asarray(arr)
+    except ValueError:
+        return None
+    if values.ndim != 1 or (len(values) and values.dtype.kind not in 'fiu'):
+        return None
+    return values.astype(np.float64)
+
+def _as_ragged(rows) -> tuple[np.ndarray, np.ndarray]:
+    # Flat float array and row lengths of a 2D field, or (None, None) if it is not a list of numeric rows
+    if not isinstance(rows, (list, tuple, np.ndarray)):
+        return None, None
+    arrays = [np.asarray(row) if isinstance(row, (list, tuple, np.ndarray)) else None for row in rows]
+    if any(a is None or a.ndim != 1 or (len(a) and a.dtype.kind not in 'fiu') for a in arrays):
+        return None, None
+    lengths = np.fromiter((len(a) for a in arrays), dtype=np.int64, count=len(arrays))
+    flat = np.concatenate(arrays).astype(np.float64) if arrays else np.zeros(0)
+    return flat, lengths
+
+def _locate(mask: np.ndarray, lengths: np.ndarray = None, max_shown: int = 3) -> str:
+    # Human readable positions of the True entries of a flat mask, e.g. "row 2, column 5 and 3 more"
+    where = np.flatnonzero(mask)
+    if lengths is not None:
+        row_starts = np.concatenate([[0], np.cumsum(lengths)])
+        rows = np.searchsorted(row_starts, where, side='right') - 1
+        positions = [f"row {r}, column {i - row_starts[r]}" for r, i in zip(rows[:max_shown], where[:max_shown])]
+    else:
+        positions = [f"index {i}" for i in where[:max_shown]]
+    text = "; ".join(positions)
+    if len(where) > max_shown:
+        text += f" and {len(where) - max_shown} more"
+    return text
+
+@timed()
+def validate_data(d: dict, mode: str = 'fast') -> None:
+    """
+    Check a processed data dict against the schema of example.yaml, collecting every violation
+    before raising a DataValidationError.
+    mode: 'fast' checks types and shapes only. 'strict' also checks that k > 0 and increases along
+          each row, that delta_squared > 0, and that k_lower <= k <= k_upper and z_lower <= z <= z_upper
+          (NaNs are allowed everywhere).
+    """
+    if mode not in VALIDATION_MODES:
+        raise ValueError(f"Invalid validation mode '{mode}'. Use one of {VALIDATION_MODES}.")
+    errors = []
+    def is_present(field):
+        return d.get(field) is not None and len(d[field]) != 0
+    
     # Check types
-    if not is_allowed(d['z'], (int, float)):
-        raise ValueError("z must be a 1D array of numbers.")
-    if len(d['z_lower']) !=0 and not is_allowed(d['z_lower'], (int, float)):
-        raise ValueError("z_lower must be a 1D array of numbers.")
-    if len(d['z_upper']) !=0 and not is_allowed(d['z_upper'], (int, float)):
-        raise ValueError("z_upper must be a 1D array of numbers.")
-    if len(d['z_tags']) !=0 and not is_allowed(d['z_tags'], str):
-        raise ValueError("z_tags must be a 1D array of strings.")
-    if not is_allowed(d['k'], (list, np.ndarray)):
-        raise ValueError("k must be a 2D array of numbers.")
-    if not is_allowed(d['k_lower'], (list, np.ndarray)):
-        raise ValueError("k_lower must be a 2D array of numbers.")
-    if not is_allowed(d['k_upper'], (list, np.ndarray)):
-        raise ValueError("k_upper must be a 2D array of numbers.")
-    if not is_allowed(d['delta_squared'], (list, np.ndarray)):
-        raise ValueError("delta_squared must be a 2D array of numbers.")
+    z_fields = {}
+    for field in ['z', 'z_lower', 'z_upper']:
+        if field == 'z' or is_present(field):
+            z_fields[field] = _as_1d(d.get(field, []))
+            if z_fields[field] is None:
+                errors.append(f"{field} must be a 1D array of numbers.")
+    if is_present('z_tags') and not all(isinstance(tag, str) for tag in d['z_tags']):
+        errors.append("z_tags must be a 1D array of strings.")
+    k_fields = {}
+    for field in ['k', 'k_lower', 'k_upper', 'delta_squared']:
+        if field in ['k', 'delta_squared'] or is_present(field):
+            k_fields[field] = _as_ragged(d.get(field, []))
+            if k_fields[field][0] is None:
+                errors.append(f"{field} must be a 2D array of numbers.")
     
     # Check lengths
-    if d['z_lower'] and not is_same_length(d['z_lower'], d['z']):
-        raise ValueError("z_lower must be the same shape as z.")
-    if d['z_upper'] and not is_same_length(d['z_upper'], d['z']):
-        raise ValueError("z_upper must be the same shape as z.")
-    if d['z_tags'] and not is_same_length(d['z_tags'], d['z']):
-        raise ValueError("z_tags must be the same shape as z.")
-    if d['k_lower'] and not is_same_length(d['k_lower'], d['k']):
-        raise ValueError("k_lower must be the same shape as k.")
-    if d['k_upper'] and not is_same_length(d['k_upper'], d['k']):
-        raise ValueError("k_upper must be the same shape as k.")
-    if not is_same_length(d['delta_squared'], d['k']):
-        raise ValueError("delta_squared must be the same shape as k.")
+    z = z_fields['z']
+    if z is not None:
+        for field in ['z_lower', 'z_upper']:
+            if z_fields.get(field) is not None and len(z_fields[field]) != len(z):
+                errors.append(f"{field} must be the same shape as z.")
+        if is_present('z_tags') and len(d['z_tags']) != len(z):
+            errors.append("z_tags must be the same shape as z.")
+    k, lengths = k_fields['k']
+    if k is not None:
+        if z is not None and len(lengths) != len(z):
+            errors.append("k must have one row per z value.")
+        for field in ['k_lower', 'k_upper', 'delta_squared']:
+            if field in k_fields and k_fields[field][0] is not None and not np.array_equal(k_fields[field][1], lengths):
+                errors.append(f"{field} must be the same shape as k.")
+    
+    # Check values
+    if mode == 'strict' and not errors:
+        with np.errstate(invalid='ignore'):
+            if np.any(k <= 0):
+                errors.append(f"k must be positive (at {_locate(k <= 0, lengths)}).")
+            decreasing = np.zeros(len(k), dtype=bool)
+            decreasing[1:] = np.diff(k) <= 0
+            row_starts = np.cumsum(lengths)[:-1]
+            decreasing[row_starts[row_starts < len(k)]] = False # Row boundaries (empty rows start past the end)
+            if np.any(decreasing):
+                errors.append(f"k must be increasing along each row (at {_locate(decreasing, lengths)}).")
+            dsq = k_fields['delta_squared'][0]
+            if np.any(dsq <= 0):
+                errors.append(f"delta_squared must be positive (at {_locate(dsq <= 0, lengths)}).")
+            for field, bad in [('k_lower', lambda bound: bound > k), ('k_upper', lambda bound: bound < k)]:
+                if field in k_fields and np.any(bad(k_fields[field][0])):
+                    errors.append(f"k_lower <= k <= k_upper must hold (violated by {field} at {_locate(bad(k_fields[field][0]), lengths)}).")
+            for field, bad in [('z_lower', lambda bound: bound > z), ('z_upper', lambda bound: bound < z)]:
+                if field in z_fields and np.any(bad(z_fields[field])):
+                    errors.append(f"z_lower <= z <= z_upper must hold (violated by {field} at {_locate(bad(z_fields[field]))}).")
+    
+    if errors:
+        raise DataValidationError(errors)
     
 def to_pandas_df(d: dict) -> pd.DataFrame:
     # Create DataFrame row by row for each z value
-    rows = []
-    for i in range(len(d['z'])):
-        row = {
-            'z': d['z'][i],
-            'z_lower': d['z_lower'][i] if len(d['z_lower'])!=0 else np.nan,
-            'z_upper': d['z_upper'][i] if len(d['z_upper'])!=0 else np.nan,
-            'z_tags': d['z_tags'][i] if len(d['z_tags'])!=0 else '',
-            'k': np.array(d['k'][i]),
-            'k_lower': np.array(d['k_lower'][i]) if len(d['k_lower'])!=0 else np.nan,
-            'k_upper': np.array(d['k_upper'][i]) if len(d['k_upper'])!=0 else np.nan,
-            'delta_squared': np.array(d['delta_squared'][i])
-        }
-        rows.append(row)
-    return pd.DataFrame(rows)
+    return RaggedData.from_dict(d).to_frame()
+
+##################################################################
+#####                  Ragged columnar storage               #####
+##################################################################
+
+_Z_FIELDS = ['z', 'z_lower', 'z_upper']
+_K_FIELDS = ['k', 'k_lower', 'k_upper', 'delta_squared']
+_RAGGED_ARRAY_FIELDS = _Z_FIELDS + ['z_tags', 'offsets'] + _K_FIELDS
+
+def _to_float_array(arr) -> np.ndarray:
+    return None if arr is None else np.asarray(arr, dtype=np.float64)
+
+def _to_offsets(arr) -> np.ndarray:
+    return np.asarray(arr, dtype=np.int64)
+
+def _to_tags(arr) -> np.ndarray:
+    return None if arr is None else np.asarray(arr, dtype=str)
+
+@attrs.define(eq=False)
+class RaggedData:
+    """
+    CSR-style storage of the spectra of a dataset. The z fields have shape (N_z,), and
+    the k fields are contiguous arrays where row i spans offsets[i]:offsets[i+1].
+    Optional fields missing in the source are stored as NaN (or '' for z_tags).
+    """
+    z: np.ndarray = attrs.field(factory=lambda: np.zeros(0), converter=_to_float_array)
+    offsets: np.ndarray = attrs.field(factory=lambda: np.zeros(1, dtype=np.int64), converter=_to_offsets)
+    k: np.ndarray = attrs.field(factory=lambda: np.zeros(0), converter=_to_float_array)
+    delta_squared: np.ndarray = attrs.field(factory=lambda: np.zeros(0), converter=_to_float_array)
+    z_lower: np.ndarray = attrs.field(default=None, converter=_to_float_array)
+    z_upper: np.ndarray = attrs.field(default=None, converter=_to_float_array)
+    z_tags: np.ndarray = attrs.field(default=None, converter=_to_tags)
+    k_lower: np.ndarray = attrs.field(default=None, converter=_to_float_array)
+    k_upper: np.ndarray = attrs.field(default=None, converter=_to_float_array)
+    _fingerprint: str = attrs.field(default=None, init=False, repr=False)
+    
+    def __attrs_post_init__(self):
+        n_z, n_k = len(self.z), len(self.k)
+        for field in ['z_lower', 'z_upper']:
+            if getattr(self, field) is None:
+                setattr(self, field, np.full(n_z, np.nan))
+        if self.z_tags is None:
+            self.z_tags = np.full(n_z, '', dtype=str)
+        for field in ['k_lower', 'k_upper']:
+            if getattr(self, field) is None:
+                setattr(self, field, np.full(n_k, np.nan))
+        if len(self.offsets) != n_z + 1 or self.offsets[0] != 0 or self.offsets[-1] != n_k \
+                or np.any(np.diff(self.offsets) < 0):
+            raise ValueError("offsets must have shape (N_z+1,), start at 0, never decrease and end at the number of k-points.")
+        for field in _Z_FIELDS + ['z_tags']:
+            if len(getattr(self, field)) != n_z:
+                raise ValueError(f"{field} must be the same shape as z.")
+        for field in _K_FIELDS:
+            if len(getattr(self, field)) != n_k:
+                raise ValueError(f"{field} must be the same shape as k.")
+    
+    @property
+    def n_z(self) -> int:
+        return len(self.z)
+    
+    @property
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+    
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, field).nbytes for field in _RAGGED_ARRAY_FIELDS)
+    
+    def fingerprint(self) -> str:
+        # Content hash of the arrays, computed once (the arrays are treated as immutable)
+        if self._fingerprint is None:
+            sha1 = hashlib.sha1()
+            for field in _RAGGED_ARRAY_FIELDS:
+                sha1.update(np.ascontiguousarray(getattr(self, field)).tobytes())
+            self._fingerprint = sha1.hexdigest()
+        return self._fingerprint
+    
+    def row_slice(self, iz: int) -> slice:
+        return slice(self.offsets[iz], self.offsets[iz+1])
+    
+    def point_z_index(self) -> np.ndarray:
+        # Index of the z-row each k-point belongs to
+        return np.repeat(np.arange(self.n_z), self.lengths)
+    
+    def has(self, field: str) -> bool:
+        # Whether an optional field was given in the source data
+        if field == 'z_tags':
+            return bool(np.any(self.z_tags != ''))
+        return not np.all(np.isnan(getattr(self, field)))
+    
+    @classmethod
+    def from_dict(cls, d: dict) -> 'RaggedData':
+        # From the processed (N_z,) and (N_z, N_k) nested lists of a data dict
+        lengths = [len(row) for row in d['k']]
+        offsets = np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)])
+        def flatten(rows):
+            if len(rows) == 0:
+                return None
+            return np.concatenate([np.asarray(row, dtype=np.float64) for row in rows]) if lengths else np.zeros(0)
+        return cls(
+            z=d['z'],
+            offsets=offsets,
+            k=flatten(d['k']),
+            delta_squared=flatten(d['delta_squared']),
+            z_lower=d['z_lower'] if len(d.get('z_lower', [])) != 0 else None,
+            z_upper=d['z_upper'] if len(d.get('z_upper', [])) != 0 else None,
+            z_tags=d['z_tags'] if len(d.get('z_tags', [])) != 0 else None,
+            k_lower=flatten(d.get('k_lower', [])),
+            k_upper=flatten(d.get('k_upper', [])),
+            )
+    
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> 'RaggedData':
+        # From the one-row-per-z DataFrame view (k fields are arrays, or NaN if absent)
+        lengths = [len(np.atleast_1d(row)) for row in df['k']]
+        offsets = np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)])
+        def flatten(column):
+            rows = [np.atleast_1d(np.asarray(row, dtype=np.float64)) for row in df[column]]
+            rows = [np.full(n, np.nan) if len(row) != n else row for row, n in zip(rows, lengths)]
+            return np.concatenate(rows) if rows else np.zeros(0)
+        return cls(
+            z=df['z'].to_numpy(dtype=np.float64),
+            offsets=offsets,
+            k=flatten('k'),
+            delta_squared=flatten('delta_squared'),
+            z_lower=df['z_lower'].to_numpy(dtype=np.float64) if 'z_lower' in df else None,
+            z_upper=df['z_upper'].to_numpy(dtype=np.float64) if 'z_upper' in df else None,
+            z_tags=df['z_tags'].fillna('').astype(str).to_numpy() if 'z_tags' in df else None,
+            k_lower=flatten('k_lower') if 'k_lower' in df else None,
+            k_upper=flatten('k_upper') if 'k_upper' in df else None,
+            )
+    
+    def to_dict(self) -> dict:
+        # Processed data dict, as produced by process_data (absent optional fields are empty lists)
+        def split(field):
+            if field in ['k_lower', 'k_upper'] and not self.has(field):
+                return []
+            return np.split(getattr(self, field), self.offsets[1:-1]) if self.n_z else []
+        return {
+            'z': self.z.tolist(),
+            'z_lower': self.z_lower.tolist() if self.has('z_lower') else [],
+            'z_upper': self.z_upper.tolist() if self.has('z_upper') else [],
+            'z_tags': self.z_tags.tolist() if self.has('z_tags') else [],
+            'k': split('k'),
+            'k_lower': split('k_lower'),
+            'k_upper': split('k_upper'),
+            'delta_squared': split('delta_squared'),
+            }
+    
+    @timed('to_pandas_df')
+    def to_frame(self) -> pd.DataFrame:
+        # One row per z value, with the k fields as arrays (or NaN if absent)
+        def split(field):
+            if field in ['k_lower', 'k_upper'] and not self.has(field):
+                return [np.nan] * self.n_z
+            return np.split(getattr(self, field), self.offsets[1:-1]) if self.n_z else []
+        return pd.DataFrame({
+            'z': self.z,
+            'z_lower': self.z_lower,
+            'z_upper': self.z_upper,
+            'z_tags': self.z_tags.astype(object),
+            'k': split('k'),
+            'k_lower': split('k_lower'),
+            'k_upper': split('k_upper'),
+            'delta_squared': split('delta_squared'),
+            })
+
+def to_ragged_data(data) -> RaggedData:
+    if isinstance(data, RaggedData):
+        return data
+    elif isinstance(data, pd.DataFrame):
+        return RaggedData.from_frame(data) if len(data.columns) else RaggedData()
+    elif isinstance(data, dict):
+        return RaggedData.from_dict(data)
+    raise ValueError("data must be a RaggedData, a pandas DataFrame or a processed data dict.")
 
 ##################################################################
 #####                     DataSet class                      #####
 ##################################################################
     
+def _dataset_key(author: str, year: int) -> str:
+    return f'{author}{year}' if 'HERA' not in author else f'HERA{year}'
+
 @attrs.define
 class DataSet:
     telescope: str = attrs.field(default='', validator=attrs.validators.instance_of(str))
@@ -120,8 +529,32 @@ class DataSet:
     year: int = attrs.field(default=0, validator=attrs.validators.instance_of(int))
     doi: str = attrs.field(default='', validator=attrs.validators.instance_of(str))
     notes: list = attrs.field(default=[], validator=attrs.validators.instance_of(list))
-    data: pd.DataFrame = attrs.field(default=pd.DataFrame(), converter=to_pandas_df, 
-                                    validator=attrs.validators.instance_of(pd.DataFrame))
+    ragged: RaggedData = attrs.field(factory=RaggedData, converter=to_ragged_data, alias='data',
+                                    validator=attrs.validators.instance_of(RaggedData))
+    _frame: pd.DataFrame = attrs.field(default=None, init=False, repr=False, eq=False)
+    
+    @property
+    def data(self) -> pd.DataFrame:
+        # DataFrame view of the ragged data, only built when first needed
+        if self._frame is None:
+            self._frame = self.ragged.to_frame()
+        return self._frame
+    
+    @data.setter
+    def data(self, value) -> None:
+        self.ragged = value
+        self._frame = None
+    
+    @property
+    def key(self) -> str:
+        # Short identifier used for labels and plot_kwargs_dict, e.g. 'Mertens2020' or 'HERA2023'
+        return _dataset_key(self.author, self.year)
+    
+    @property
+    def fingerprint(self) -> str:
+        # Identity of the dataset content, used to key caches of derived views and plot traces
+        header = json.dumps([self.telescope, self.author, self.year, self.doi, self.notes])
+        return hashlib.sha1((header + self.ragged.fingerprint()).encode()).hexdigest()
     
     def __str__(self) -> str:
         text = f"DataSet: telescope={self.telescope}, author={self.author}, year={self.year}, doi={self.doi}"
@@ -137,28 +570,358 @@ class DataSet:
     def __repr__(self) -> str:
         return self.__str__()
     
-def get_available_datasets() -> list[str]:
+##################################################################
+#####                       LRU cache                        #####
+##################################################################
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache holding at most maxsize entries.
+    Keeps hit/miss counts for diagnostics.
+    """
+    
+    def __init__(self, maxsize: int = 128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+        
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+        
+    def put(self, key, value) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+        
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+            
+    def stats(self) -> dict:
+        with self._lock:
+            return {'size': len(self._data), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+    
+    def keys(self) -> list:
+        with self._lock:
+            return list(self._data.keys())
+        
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return key in self._data
+        
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+##################################################################
+#####                  Binary catalog cache                  #####
+##################################################################
+
+# The whole data/ catalog is compiled into one uncompressed .npz file holding
+# columnar float64 arrays, plus a JSON header with the per-dataset metadata,
+# offsets and the (mtime, size, sha256) of the YAML file each entry came from.
+CATALOG_CACHE_FILE = '.catalog_cache.npz'
+_CACHE_FORMAT_VERSION = 2
+_CACHE_Z_COLUMNS = _Z_FIELDS + ['z_tags']
+_CACHE_K_COLUMNS = _K_FIELDS
+# Entries refreshed one by one (cache misses) are written out at most once per interval, and at exit
+CACHE_WRITE_INTERVAL = 5.0 # seconds
+
+@timed('yaml_load')
+def _load_yaml(stream):
+    return yaml.safe_load(stream)
+
+def _yaml_to_entry(yaml_data: dict, validation: str = 'fast') -> dict:
+    
+    # Process and validate data
+    data_dict = yaml_data.get('data', {})
+    process_data(data_dict)
+    validate_data(data_dict, mode=validation)
+    
+    meta = {
+        'telescope': yaml_data.get('telescope', ''),
+        'author': yaml_data.get('author', ''),
+        'year': yaml_data.get('year', 0),
+        'doi': yaml_data.get('doi', ''),
+        'notes': yaml_data.get('notes', []),
+    }
+    return {'meta': meta, 'ragged': _read_only(RaggedData.from_dict(data_dict))}
+
+def _parse_entry(data_dir: str, fname: str, validation: str = 'fast') -> dict:
+    # Full cache entry for one YAML file, stamped with the file's mtime, size and hash
+    path = os.path.join(data_dir, fname + '.yaml')
+    stat = os.stat(path)
+    with open(path, 'rb') as file:
+        content = file.read()
+    entry = _yaml_to_entry(_load_yaml(content), validation)
+    entry['meta'].update(sha256=hashlib.sha256(content).hexdigest(), mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+    return entry
+
+def _entry_header(entry: dict) -> dict:
+    # DataSet keyword arguments from an entry's metadata, dropping the cache bookkeeping
+    header = {key: entry['meta'][key] for key in ['telescope', 'author', 'year', 'doi']}
+    header['notes'] = list(entry['meta']['notes'])
+    return header
+
+def _read_only(ragged: RaggedData) -> RaggedData:
+    # Cached arrays are shared by every DataSet loaded from the cache
+    for field in _RAGGED_ARRAY_FIELDS:
+        getattr(ragged, field).setflags(write=False)
+    return ragged
+
+_NPY_HEADER_READERS = {(1, 0): np.lib.format.read_array_header_1_0, (2, 0): np.lib.format.read_array_header_2_0}
+
+def _mmap_npz(file, names: list[str]) -> dict:
+    """
+    Memory-map members of an uncompressed .npz file (as written by np.savez). Each member is a .npy
+    file stored as-is in the zip archive, so its array data sits at a fixed offset in the file.
+    """
+    arrays = {}
+    with zipfile.ZipFile(file) as archive:
+        for name in names:
+            info = archive.getinfo(name + '.npy')
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"Member '{name}' is compressed and cannot be memory-mapped.")
+            # Local file header: 30 bytes, then the file name and extra field of the given lengths
+            file.seek(info.header_offset)
+            name_length, extra_length = struct.unpack('<HH', file.read(30)[26:30])
+            file.seek(info.header_offset + 30 + name_length + extra_length)
+            shape, fortran_order, dtype = _NPY_HEADER_READERS[np.lib.format.read_magic(file)](file)
+            if dtype.hasobject:
+                raise ValueError(f"Member '{name}' holds Python objects and cannot be memory-mapped.")
+            if np.prod(shape) == 0:
+                arrays[name] = np.zeros(shape, dtype=dtype)
+            else:
+                arrays[name] = np.asarray(np.memmap(file, dtype=dtype, mode='r', shape=shape, 
+                                                    order='F' if fortran_order else 'C', offset=file.tell()))
+    return arrays
+
+class _CatalogCache:
+    """
+    In-memory view of the compiled catalog for one data directory.
+    Entries are rebuilt from YAML whenever the file's mtime/size and content hash change; entries
+    refreshed by get() are written out in batches (see CACHE_WRITE_INTERVAL and flush()). With mmap, entries read from the cache file are read-only views of a memory map of it,
+    so processes on the same host share their pages.
+    """
+    
+    def __init__(self, data_dir: str, mmap: bool = False):
+        self.data_dir = data_dir
+        self.path = os.path.join(data_dir, CATALOG_CACHE_FILE)
+        self.mmap = mmap
+        self.entries = {}
+        self.lock = threading.RLock()
+        self._dirty = False # entries changed since the last write
+        self._last_write = -np.inf
+        self._read()
+        
+    def _read(self) -> None:
+        # Any problem with the cache file simply means starting from an empty cache.
+        # The file is opened once so the header and the arrays come from the same version of it.
+        names = ['offsets'] + _CACHE_Z_COLUMNS + _CACHE_K_COLUMNS
+        try:
+            with open(self.path, 'rb') as file:
+                with np.load(file, allow_pickle=False) as npz:
+                    header = json.loads(str(npz['header']))
+                    if header.get('version') != _CACHE_FORMAT_VERSION:
+                        return
+                    columns = _mmap_npz(file, names) if self.mmap else {name: npz[name] for name in names}
+        except Exception:
+            return
+        for fname, meta in header['entries'].items():
+            z0, z1 = meta.pop('z_span')
+            k0, k1 = meta.pop('k_span')
+            index = meta.pop('index')
+            arrays = {field: columns[field][z0:z1] for field in _CACHE_Z_COLUMNS}
+            arrays.update({field: columns[field][k0:k1] for field in _CACHE_K_COLUMNS})
+            arrays['offsets'] = columns['offsets'][z0+index:z1+index+1] - k0
+            self.entries[fname] = {'meta': meta, 'ragged': _read_only(RaggedData(**arrays))}
+            
+    def _write(self) -> None:
+        # Concatenate all entries into single columns, recording each entry's spans
+        self._dirty, self._last_write = False, time.monotonic()
+        header = {'version': _CACHE_FORMAT_VERSION, 'entries': {}}
+        columns = {name: [] for name in ['offsets'] + _CACHE_Z_COLUMNS + _CACHE_K_COLUMNS}
+        n_z, n_k = 0, 0
+        for index, (fname, entry) in enumerate(sorted(self.entries.items())):
+            ragged = entry['ragged']
+            nz_entry, nk_entry = len(ragged.z), len(ragged.k)
+            meta = dict(entry['meta'], z_span=[n_z, n_z+nz_entry], k_span=[n_k, n_k+nk_entry], index=index)
+            header['entries'][fname] = meta
+            for field in _CACHE_Z_COLUMNS + _CACHE_K_COLUMNS:
+                columns[field].append(getattr(ragged, field))
+            columns['offsets'].append(ragged.offsets + n_k)
+            n_z, n_k = n_z + nz_entry, n_k + nk_entry
+        columns = {name: np.concatenate(arrs) if arrs else np.zeros(0) for name, arrs in columns.items()}
+        columns['offsets'] = columns['offsets'].astype(np.int64)
+        columns['z_tags'] = columns['z_tags'].astype(str)
+        
+        # Write atomically so concurrent readers never see a partial file.
+        # A read-only data directory just means the cache stays in memory.
+        tmp_path = f'{self.path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as file:
+                np.savez(file, header=np.array(json.dumps(header)), **columns)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    
+    def is_fresh(self, fname: str) -> bool:
+        # Cheap check: the YAML file has the same mtime and size as when it was cached
+        with self.lock:
+            entry = self.entries.get(fname)
+            if entry is None:
+                return False
+            stat = os.stat(os.path.join(self.data_dir, fname + '.yaml'))
+            return entry['meta']['mtime_ns'] == stat.st_mtime_ns and entry['meta']['size'] == stat.st_size
+    
+    def _refresh_entry(self, fname: str) -> bool:
+        # Returns True if the entry metadata changed and the cache needs to be written
+        if self.is_fresh(fname):
+            return False
+        path = os.path.join(self.data_dir, fname + '.yaml')
+        stat = os.stat(path)
+        entry = self.entries.get(fname)
+        with open(path, 'rb') as file:
+            content = file.read()
+        sha256 = hashlib.sha256(content).hexdigest()
+        if entry is None or entry['meta']['sha256'] != sha256:
+            entry = _yaml_to_entry(_load_yaml(content))
+            entry['meta']['sha256'] = sha256
+        entry['meta']['mtime_ns'] = stat.st_mtime_ns
+        entry['meta']['size'] = stat.st_size
+        self.entries[fname] = entry
+        return True
+    
+    def get(self, fname: str) -> tuple[dict, RaggedData]:
+        with self.lock:
+            # Only the requested file is parsed on a miss, so other (possibly broken) files cannot fail it
+            if self._refresh_entry(fname):
+                self._dirty = True
+                if time.monotonic() - self._last_write >= CACHE_WRITE_INTERVAL:
+                    self._write()
+            return _entry_header(self.entries[fname]), self.entries[fname]['ragged']
+        
+    def add(self, entries: dict) -> None:
+        # Entries parsed elsewhere (e.g. by load_datasets workers) are stored with a single write
+        with self.lock:
+            for fname, entry in entries.items():
+                self.entries[fname] = {'meta': entry['meta'], 'ragged': _read_only(entry['ragged'])}
+            self._write()
     
-    files = [os.path.basename(f)[:-5] for f in os.listdir('data') if f.endswith('.yaml')]
+    def compile(self, force_write: bool = False) -> tuple[int, dict[str, Exception]]:
+        """
+        Bring every entry up to date. Files that fail to parse are left out of the cache and
+        returned with their errors, as (number of entries rebuilt or re-stamped, {fname: error}).
+        """
+        with self.lock:
+            available = get_available_datasets(self.data_dir)
+            stale = [fname for fname in self.entries if fname not in available]
+            for fname in stale:
+                del self.entries[fname]
+            n_changed, errors = 0, {}
+            for fname in available:
+                try:
+                    n_changed += self._refresh_entry(fname)
+                except Exception as e:
+                    errors[fname] = e
+                    stale += [fname] if self.entries.pop(fname, None) is not None else []
+            if n_changed or stale or force_write or self._dirty or not os.path.exists(self.path):
+                self._write()
+            return n_changed, errors
+    
+    def flush(self) -> None:
+        # Write out entries refreshed since the last write
+        with self.lock:
+            if self._dirty:
+                self._write()
+
+_catalog_caches = {}
+_catalog_caches_lock = threading.Lock()
+
+def _get_catalog_cache(data_dir: str, mmap: bool = False) -> _CatalogCache:
+    with _catalog_caches_lock:
+        key = (os.path.abspath(data_dir), mmap)
+        if key not in _catalog_caches:
+            _catalog_caches[key] = _CatalogCache(data_dir, mmap=mmap)
+        return _catalog_caches[key]
+
+@atexit.register
+def _flush_catalog_caches() -> None:
+    for cache in list(_catalog_caches.values()):
+        cache.flush()
+
+@timed()
+def compile_catalog(data_dir: str = DATA_DIR, workers: int | None = 1) -> tuple[int, dict[str, Exception]]:
+    """
+    Compile every YAML file in data_dir into the binary catalog cache.
+    With workers other than 1, out-of-date files are parsed in parallel processes first.
+    Files that fail to parse are skipped. Returns the number of entries that were (re)built or
+    re-stamped, and the errors of the skipped files by name.
+    """
+    cache = _get_catalog_cache(data_dir)
+    if workers == 1:
+        return cache.compile()
+    stale = [fname for fname in get_available_datasets(data_dir) if not cache.is_fresh(fname)]
+    errors = {result.name: result.error 
+              for result in load_datasets(stale, workers=workers, executor='process', data_dir=data_dir) if not result.ok}
+    # compile stores the parsed entries with one write; the failed files fail again there and are skipped
+    n_changed, compile_errors = cache.compile()
+    errors.update(compile_errors)
+    return len(stale) - len(errors), errors
+
+##################################################################
+#####                     Loading functions                  #####
+##################################################################
+
+def get_available_datasets(data_dir: str = DATA_DIR) -> list[str]:
+    
+    files = [os.path.basename(f)[:-5] for f in os.listdir(data_dir) if f.endswith('.yaml')]
     return files
 
-def load_dataset(fname: str, if_yaml_str: bool=False) -> DataSet:
+@timed()
+def load_dataset(fname: str, if_yaml_str: bool=False, use_cache: bool=True, validation: str='fast',
+                 data_dir: str=DATA_DIR) -> DataSet:
 
     if if_yaml_str:
-        yaml_data = yaml.safe_load(fname)
+        yaml_data = _load_yaml(fname)
+        # Process and validate data
+        data_dict = yaml_data.get('data', {})
+        process_data(data_dict)
+        validate_data(data_dict, mode=validation)
     else:
         fname = fname[:-5] if fname.endswith('.yaml') else fname
-        if fname in get_available_datasets():
+        if fname in get_available_datasets(data_dir):
             pass
         else:
-            raise ValueError(f"Dataset '{fname}' not found. Available datasets: {get_available_datasets()}")
-        with open('data/' + fname + '.yaml', 'r') as file:
-            yaml_data = yaml.safe_load(file)
-            
-    # Process and validate data
-    data_dict = yaml_data.get('data', {})
-    process_data(data_dict)
-    validate_data(data_dict)
+            raise ValueError(f"Dataset '{fname}' not found. Available datasets: {get_available_datasets(data_dir)}")
+        # Cached entries were only checked with fast validation, so stricter modes re-parse the file
+        if use_cache and validation == 'fast':
+            header, ragged = _get_catalog_cache(data_dir).get(fname)
+            return DataSet(data=ragged, **header)
+        else:
+            with open(os.path.join(data_dir, fname + '.yaml'), 'r') as file:
+                yaml_data = _load_yaml(file)
+            # Process and validate data
+            data_dict = yaml_data.get('data', {})
+            process_data(data_dict)
+            validate_data(data_dict, mode=validation)
         
     return DataSet(
         telescope=yaml_data.get('telescope', ''),
@@ -166,48 +929,901 @@ def load_dataset(fname: str, if_yaml_str: bool=False) -> DataSet:
         year=yaml_data.get('year', 0),
         doi=yaml_data.get('doi', ''),
         notes=yaml_data.get('notes', []),
-        data=to_pandas_df(data_dict)
+        data=RaggedData.from_dict(data_dict)
         )
     
 # WARNING: This might be over-estimating the lowest limit, if the lowest k-bin is erroneously low.
-def load_dataset_lowest_limits(fname: str, if_yaml_str: bool=False) -> DataSet:
-
-    dataset = load_dataset(fname, if_yaml_str=if_yaml_str)
-    
-    # For all unique z values, find the lowest limit
-    z_L, z_lower_L, z_upper_L, z_tags_L, k_L, k_lower_L, k_upper_L, dsq_L = [], [], [], [], [], [], [], []
-    unique_z = dataset.data['z'].unique()
-    for z_val in unique_z:
-        subset = dataset.data[dataset.data['z'] == z_val]
-        min_dsq = np.inf
-        min_row = None
-        for _, row in subset.iterrows():
-            ik = np.nanargmin(row['delta_squared'])
-            curr_dsq = np.nanmin(row['delta_squared'])
-            if curr_dsq < min_dsq:
-                min_dsq = curr_dsq
-                min_row = (row, ik)
-        if min_row is not None:
-            row, ik = min_row
-            z_L.append(row['z'])
-            z_lower_L.append(row['z_lower'] if not pd.isna(row['z_lower']) else np.nan)
-            z_upper_L.append(row['z_upper'] if not pd.isna(row['z_upper']) else np.nan)
-            z_tags_L.append(row['z_tags'] if row['z_tags'] != '' else '')
-            k_L.append([row['k'][ik]])
-            k_lower_L.append([row['k_lower'][ik]] if not pd.isna(row['k_lower']).all() else np.nan)
-            k_upper_L.append([row['k_upper'][ik]] if not pd.isna(row['k_upper']).all() else np.nan)
-            dsq_L.append([row['delta_squared'][ik]])
-
-    # Create new DataFrame
-    dataset.data = pd.DataFrame({
-        'z': z_L,
-        'z_lower': z_lower_L,
-        'z_upper': z_upper_L,
-        'z_tags': z_tags_L,
-        'k': k_L,
-        'k_lower': k_lower_L,
-        'k_upper': k_upper_L,
-        'delta_squared': dsq_L
-        })
-    
-    return dataset
\ No newline at end of file
+def load_dataset_lowest_limits(fname: str, if_yaml_str: bool=False, use_cache: bool=True,
+                               validation: str='fast', data_dir: str=DATA_DIR) -> DataSet:
+
+    dataset = load_dataset(fname, if_yaml_str=if_yaml_str, use_cache=use_cache, validation=validation,
+                           data_dir=data_dir)
+    return reduce_dataset(dataset, 'lowest')
+
+##################################################################
+#####                    Parallel loading                    #####
+##################################################################
+
+LOAD_EXECUTORS = ['thread', 'process']
+
+@attrs.define
+class LoadResult:
+    """
+    Outcome of loading one file with load_datasets: either dataset or error is set.
+    """
+    name: str
+    dataset: DataSet | None = None
+    error: Exception | None = None
+    
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+def _parse_entry_safe(data_dir: str, fname: str, validation: str) -> tuple[dict | None, Exception | None]:
+    # Worker function: errors are returned rather than raised so one bad file cannot fail the batch
+    try:
+        return _parse_entry(data_dir, fname, validation), None
+    except Exception as e:
+        return None, e
+
+@timed()
+def load_datasets(names: list[str] | None = None, workers: int | None = None, executor: str = 'process',
+                  use_cache: bool = True, validation: str = 'fast', data_dir: str = DATA_DIR,
+                  mmap: bool = False) -> list[LoadResult]:
+    """
+    Load several datasets at once, parsing and validating files across a pool of workers.
+    Returns one LoadResult per name (all available datasets if names is None), in the given order.
+    Files that are fresh in the catalog cache are read from it directly; only the rest go to the pool,
+    and with use_cache the newly parsed entries are written back to the cache in one go.
+    """
+    if executor not in LOAD_EXECUTORS:
+        raise ValueError(f"Invalid executor '{executor}'. Use one of {LOAD_EXECUTORS}.")
+    if validation not in VALIDATION_MODES:
+        raise ValueError(f"Invalid validation mode '{validation}'. Use one of {VALIDATION_MODES}.")
+    available = set(get_available_datasets(data_dir))
+    names = sorted(available) if names is None else [n[:-5] if n.endswith('.yaml') else n for n in names]
+    
+    # Cached entries were only checked with fast validation, so stricter modes re-parse everything
+    cache = _get_catalog_cache(data_dir, mmap) if use_cache else None
+    results, to_parse = {}, []
+    for name in names:
+        if name in results or name in to_parse:
+            continue
+        if name not in available:
+            results[name] = LoadResult(name, error=ValueError(f"Dataset '{name}' not found."))
+        elif cache is not None and validation == 'fast' and cache.is_fresh(name):
+            header, ragged = cache.get(name)
+            results[name] = LoadResult(name, dataset=DataSet(data=ragged, **header))
+        else:
+            to_parse.append(name)
+            
+    if to_parse:
+        pool_class = ProcessPoolExecutor if executor == 'process' else ThreadPoolExecutor
+        n = len(to_parse)
+        if workers == 1 or n == 1:
+            parsed = list(map(_parse_entry_safe, [data_dir]*n, to_parse, [validation]*n))
+        else:
+            with pool_class(max_workers=workers) as pool:
+                parsed = list(pool.map(_parse_entry_safe, [data_dir]*n, to_parse, [validation]*n))
+        new_entries = {}
+        for name, (entry, error) in zip(to_parse, parsed):
+            if error is not None:
+                results[name] = LoadResult(name, error=error)
+                continue
+            new_entries[name] = entry
+            results[name] = LoadResult(name, dataset=DataSet(data=entry['ragged'], **_entry_header(entry)))
+        if cache is not None and new_entries:
+            cache.add(new_entries)
+            
+    return [results[name] for name in names]
+
+##################################################################
+#####                      File formats                      #####
+##################################################################
+
+# Besides the YAML schema of example.yaml, datasets can be read from and written to:
+#  - CSV in long format, one row per k-point with columns z_bin, z, z_lower, z_upper, k, k_lower, k_upper,
+#    delta_squared, tag (only z, k and delta_squared are mandatory). Consecutive rows with the same z_bin
+#    form one z-bin; without a z_bin column, consecutive rows with the same z, z_lower, z_upper and tag do.
+#    The header fields are YAML in '#' lines at the top.
+#  - NumPy .npz with the RaggedData arrays and the header fields as a JSON string member 'header'.
+DATASET_FORMATS = ['yaml', 'csv', 'npz']
+CSV_COLUMNS = ['z_bin', 'z', 'z_lower', 'z_upper', 'k', 'k_lower', 'k_upper', 'delta_squared', 'tag']
+CSV_CHUNK_SIZE = 100000
+
+def dataset_format(path: str) -> str:
+    ext = os.path.splitext(path)[1].lstrip('.').lower()
+    fmt = 'yaml' if ext == 'yml' else ext
+    if fmt not in DATASET_FORMATS:
+        raise ValueError(f"Unknown dataset format '{ext}'. Use one of {DATASET_FORMATS}.")
+    return fmt
+
+def _header_dict(dataset: DataSet) -> dict:
+    return {'telescope': dataset.telescope, 'author': dataset.author, 'year': dataset.year,
+            'doi': dataset.doi, 'notes': list(dataset.notes)}
+
+def _differs(arr: np.ndarray) -> np.ndarray:
+    # Whether each element differs from the previous one, treating NaNs as equal
+    changed = arr[1:] != arr[:-1]
+    if arr.dtype.kind == 'f':
+        changed &= ~(np.isnan(arr[1:]) & np.isnan(arr[:-1]))
+    return changed
+
+@timed('read_csv')
+def _read_csv(file) -> tuple[dict, RaggedData]:
+    # Header lines first, then the table in chunks straight into column arrays
+    header_lines = []
+    while True:
+        position = file.tell()
+        line = file.readline()
+        if not line.startswith('#'):
+            file.seek(position)
+            break
+        header_lines.append(line[2:] if line.startswith('# ') else line[1:])
+    meta = yaml.safe_load(''.join(header_lines)) or {}
+    
+    chunks = collections.defaultdict(list)
+    for chunk in pd.read_csv(file, chunksize=CSV_CHUNK_SIZE, dtype={'tag': str}, float_precision='round_trip'):
+        unknown = set(chunk.columns) - set(CSV_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown CSV columns {sorted(unknown)}. Allowed columns: {CSV_COLUMNS}")
+        for column in chunk.columns:
+            if column == 'tag':
+                chunks[column].append(chunk[column].fillna('').to_numpy(dtype=str))
+            else:
+                chunks[column].append(pd.to_numeric(chunk[column]).to_numpy(dtype=np.float64))
+    columns = {column: np.concatenate(arrays) for column, arrays in chunks.items()}
+    for column in ['z', 'k', 'delta_squared']:
+        if column not in columns:
+            raise ValueError(f"Mandatory column '{column}' is missing in CSV.")
+    
+    # A new z-bin starts wherever z_bin changes, or if there is none, wherever any of the z columns or the tag changes
+    n = len(columns['k'])
+    starts = np.zeros(n, dtype=bool)
+    starts[:1] = True
+    for column in ['z_bin'] if 'z_bin' in columns else ['z', 'z_lower', 'z_upper', 'tag']:
+        if column in columns:
+            starts[1:] |= _differs(columns[column])
+    starts = np.flatnonzero(starts)
+    ragged = RaggedData(
+        z=columns['z'][starts],
+        offsets=np.append(starts, n),
+        k=columns['k'],
+        delta_squared=columns['delta_squared'],
+        z_lower=columns['z_lower'][starts] if 'z_lower' in columns else None,
+        z_upper=columns['z_upper'][starts] if 'z_upper' in columns else None,
+        z_tags=columns['tag'][starts] if 'tag' in columns else None,
+        k_lower=columns.get('k_lower'),
+        k_upper=columns.get('k_upper'),
+        )
+    return meta, ragged
+
+def _write_csv(dataset: DataSet, file) -> None:
+    ragged = dataset.ragged
+    for line in yaml.safe_dump(_header_dict(dataset), sort_keys=False).splitlines():
+        file.write(f'# {line}\n')
+    z_index = ragged.point_z_index()
+    # z_bin keeps adjacent z-bins with equal z and tag apart
+    columns = {'z_bin': z_index}
+    for column in CSV_COLUMNS[1:]:
+        field = 'z_tags' if column == 'tag' else column
+        if field == 'z' or field in ['k', 'delta_squared'] or ragged.has(field):
+            values = getattr(ragged, field)
+            columns[column] = values[z_index] if field in _Z_FIELDS + ['z_tags'] else values
+    pd.DataFrame(columns).to_csv(file, index=False, lineterminator='\n')
+
+def _read_npz(file) -> tuple[dict, RaggedData]:
+    with np.load(file, allow_pickle=False) as npz:
+        for member in ['z', 'offsets', 'k', 'delta_squared']:
+            if member not in npz.files:
+                raise ValueError(f"Mandatory array '{member}' is missing in npz file.")
+        meta = json.loads(str(npz['header'])) if 'header' in npz.files else {}
+        arrays = {field: npz[field] for field in _RAGGED_ARRAY_FIELDS if field in npz.files}
+    return meta, RaggedData(**arrays)
+
+def _write_npz(dataset: DataSet, file) -> None:
+    arrays = {field: getattr(dataset.ragged, field) for field in _RAGGED_ARRAY_FIELDS}
+    np.savez(file, header=np.array(json.dumps(_header_dict(dataset))), **arrays)
+
+def _yaml_float(value: float) -> str:
+    # Shortest round-tripping repr, spelled so that PyYAML reads it back as a float
+    if np.isnan(value):
+        return '.nan'
+    if np.isinf(value):
+        return '.inf' if value > 0 else '-.inf'
+    text = repr(float(value))
+    mantissa, _, exponent = text.partition('e')
+    if exponent and '.' not in mantissa:
+        text = f'{mantissa}.0e{exponent}'
+    return text
+
+def _write_yaml(dataset: DataSet, file) -> None:
+    d = dataset.ragged.to_dict()
+    def flow(values):
+        return '[' + ', '.join(_yaml_float(v) for v in values) + ']'
+    file.write(yaml.safe_dump(_header_dict(dataset), sort_keys=False))
+    file.write('data:\n')
+    for field in ['delta_squared', 'k', 'k_lower', 'k_upper']:
+        rows = ',\n         '.join(flow(row) for row in d[field])
+        file.write(f'    {field}:\n' + (f'        [{rows}]\n' if d[field] else ''))
+    for field in ['z', 'z_lower', 'z_upper']:
+        file.write(f'    {field}: {flow(d[field])}\n' if d[field] else f'    {field}:\n')
+    file.write(f"    z_tags: {json.dumps(d['z_tags'])}\n" if d['z_tags'] else '    z_tags:\n')
+
+def read_dataset(source, format: str = None, validation: str = 'fast') -> DataSet:
+    """
+    Read a dataset from a YAML, CSV or npz file. source is a path, or a binary file object 
+    (format is then required). The data is checked with validate_data in the given mode.
+    """
+    if format is None:
+        format = dataset_format(source)
+    if format not in DATASET_FORMATS:
+        raise ValueError(f"Unknown dataset format '{format}'. Use one of {DATASET_FORMATS}.")
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as file:
+            return read_dataset(file, format, validation)
+    
+    if format == 'yaml':
+        return load_dataset(source.read().decode('utf-8'), if_yaml_str=True, validation=validation)
+    elif format == 'csv':
+        meta, ragged = _read_csv(io.TextIOWrapper(source, encoding='utf-8', newline=''))
+    else:
+        meta, ragged = _read_npz(source)
+    validate_data(ragged.to_dict(), mode=validation)
+    return DataSet(data=ragged, **_header_fields(meta))
+
+def write_dataset(dataset: DataSet, path: str, format: str = None) -> None:
+    """
+    Write a dataset to a YAML, CSV or npz file, with the format taken from the extension by default.
+    """
+    if format is None:
+        format = dataset_format(path)
+    if format == 'yaml':
+        with open(path, 'w') as file:
+            _write_yaml(dataset, file)
+    elif format == 'csv':
+        with open(path, 'w', newline='') as file:
+            _write_csv(dataset, file)
+    elif format == 'npz':
+        with open(path, 'wb') as file:
+            _write_npz(dataset, file)
+    else:
+        raise ValueError(f"Unknown dataset format '{format}'. Use one of {DATASET_FORMATS}.")
+
+##################################################################
+#####                   Reduction functions                  #####
+##################################################################
+
+# Reducers map a RaggedData to a summary RaggedData, and are looked up by name in reduce_dataset
+REDUCERS = {}
+
+def register_reducer(name: str):
+    def decorator(func):
+        REDUCERS[name] = func
+        return func
+    return decorator
+
+def _z_groups(ragged: RaggedData) -> np.ndarray:
+    # Per-point group id of its z value, numbered in order of first appearance
+    _, first, inverse = np.unique(ragged.z, return_index=True, return_inverse=True)
+    relabel = np.empty(len(first), dtype=np.int64)
+    relabel[np.argsort(first)] = np.arange(len(first))
+    return relabel[inverse][ragged.point_z_index()]
+
+def _select_by_rank(ragged: RaggedData, point_group: np.ndarray, select) -> RaggedData:
+    """
+    Segmented selection in one sort: points are ranked by delta_squared within each group
+    (NaNs and negative group ids are dropped, ties go to the earlier point), and
+    select(rank, count) picks the points to keep. Each group becomes one output row,
+    taking its z metadata from the row of its best-ranked kept point.
+    """
+    dsq = ragged.delta_squared
+    idx = np.flatnonzero(~np.isnan(dsq) & (point_group >= 0))
+    order = idx[np.lexsort((idx, dsq[idx], point_group[idx]))]
+    groups = point_group[order]
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    counts = np.diff(np.r_[starts, len(order)])
+    rank = np.arange(len(order)) - np.repeat(starts, counts)
+    keep = select(rank, np.repeat(counts, counts))
+    chosen, chosen_groups = order[keep], groups[keep]
+    
+    # Best-ranked kept point of each group gives the row metadata
+    row_starts = np.flatnonzero(np.r_[True, chosen_groups[1:] != chosen_groups[:-1]]) if len(chosen) else np.zeros(0, dtype=np.int64)
+    best_rows = ragged.point_z_index()[chosen[row_starts]]
+    
+    # Points within each output row are ordered by k
+    points = chosen[np.lexsort((ragged.k[chosen], chosen_groups))]
+    return RaggedData(
+        z=ragged.z[best_rows],
+        z_lower=ragged.z_lower[best_rows],
+        z_upper=ragged.z_upper[best_rows],
+        z_tags=ragged.z_tags[best_rows],
+        offsets=np.r_[row_starts, len(chosen)],
+        k=ragged.k[points],
+        k_lower=ragged.k_lower[points],
+        k_upper=ragged.k_upper[points],
+        delta_squared=dsq[points],
+        )
+
+@register_reducer('lowest')
+def reduce_lowest(ragged: RaggedData) -> RaggedData:
+    # Lowest limit for each unique z
+    return _select_by_rank(ragged, _z_groups(ragged), lambda rank, count: rank == 0)
+
+@register_reducer('lowest_n')
+def reduce_lowest_n(ragged: RaggedData, n: int = 3) -> RaggedData:
+    # Lowest n limits for each unique z
+    return _select_by_rank(ragged, _z_groups(ragged), lambda rank, count: rank < n)
+
+@register_reducer('lowest_per_k_band')
+def reduce_lowest_per_k_band(ragged: RaggedData, k_edges=(1e-3, 1e-2, 1e-1, 1e0, 1e1, 1e2)) -> RaggedData:
+    # Lowest limit for each unique z in each k-band [k_edges[i], k_edges[i+1])
+    k_edges = np.asarray(k_edges, dtype=np.float64)
+    n_bands = len(k_edges) - 1
+    band = np.searchsorted(k_edges, ragged.k, side='right') - 1
+    in_band = (band >= 0) & (band < n_bands)
+    point_group = np.where(in_band, _z_groups(ragged) * n_bands + band, -1)
+    return _select_by_rank(ragged, point_group, lambda rank, count: rank == 0)
+
+@register_reducer('median')
+def reduce_median(ragged: RaggedData) -> RaggedData:
+    # Median limit for each unique z (the lower median for an even number of points)
+    return _select_by_rank(ragged, _z_groups(ragged), lambda rank, count: rank == (count - 1) // 2)
+
+@timed()
+def reduce_dataset(dataset: DataSet, reducer='lowest', **reducer_kwargs) -> DataSet:
+    """
+    Derive a summary DataSet from an already loaded one, without re-parsing.
+    reducer: name of a registered reducer (see REDUCERS) or a callable RaggedData -> RaggedData.
+    """
+    if isinstance(reducer, str):
+        if reducer not in REDUCERS:
+            raise ValueError(f"Unknown reducer '{reducer}'. Available reducers: {list(REDUCERS)}")
+        reducer = REDUCERS[reducer]
+    return DataSet(
+        telescope=dataset.telescope,
+        author=dataset.author,
+        year=dataset.year,
+        doi=dataset.doi,
+        notes=list(dataset.notes),
+        data=reducer(dataset.ragged, **reducer_kwargs)
+        )
+
+##################################################################
+#####                     Dataset catalog                    #####
+##################################################################
+
+_HEADER_FIELDS = ['telescope', 'author', 'year', 'doi', 'notes']
+
+@attrs.define(eq=False)
+class CatalogEntry:
+    name: str # file name without extension
+    telescope: str = ''
+    author: str = ''
+    year: int = 0
+    doi: str = ''
+    notes: list = attrs.field(factory=list)
+    
+    @property
+    def key(self) -> str:
+        return _dataset_key(self.author, self.year)
+
+def read_header(path: str) -> dict:
+    """
+    Read only the header fields (telescope, author, year, doi, notes) of a dataset YAML file,
+    stopping at the top-level 'data:' block.
+    """
+    lines = []
+    with open(path, 'r') as file:
+        for line in file:
+            if line.startswith('data:'):
+                break
+            lines.append(line)
+    return _header_fields(yaml.safe_load(''.join(lines)) or {})
+
+def _header_fields(meta: dict) -> dict:
+    # The header fields of a parsed YAML/JSON header, with defaults for missing ones
+    return {field: meta.get(field, [] if field == 'notes' else 0 if field == 'year' else '') 
+            for field in _HEADER_FIELDS}
+
+def _read_cache_headers(data_dir: str) -> dict:
+    # Header metadata of the compiled cache, reading only its JSON header member
+    try:
+        with np.load(os.path.join(data_dir, CATALOG_CACHE_FILE), allow_pickle=False) as npz:
+            header = json.loads(str(npz['header']))
+    except Exception:
+        return {}
+    return header['entries'] if header.get('version') == _CACHE_FORMAT_VERSION else {}
+
+@attrs.define
+class CatalogChange:
+    """
+    What DatasetCatalog.refresh found: the names of added, changed and removed files, and the
+    fingerprints of the memoized datasets that were dropped (e.g. to discard their plot traces).
+    """
+    version: int
+    added: list = attrs.field(factory=list)
+    changed: list = attrs.field(factory=list)
+    removed: list = attrs.field(factory=list)
+    stale_fingerprints: list = attrs.field(factory=list)
+    
+    def __bool__(self) -> bool:
+        return bool(self.added or self.changed or self.removed)
+
+class DatasetCatalog:
+    """
+    Registry of the datasets in a data directory. Only the header fields are read when the
+    catalog is created (from the compiled cache where it is up to date, else from the top of
+    each YAML file). The data of a dataset is parsed the first time it is requested, and memoized.
+    refresh() picks up added, changed and deleted files in place, bumping version.
+    Loaded datasets are read-only and meant to be shared, e.g. by all sessions of the app through
+    st.cache_resource; with mmap their arrays are views of a memory map of the compiled cache.
+    """
+    
+    def __init__(self, data_dir: str = DATA_DIR, mmap: bool = False):
+        self.data_dir = data_dir
+        self.mmap = mmap
+        self.version = 0
+        self._entries = {}
+        self._stamps = {} # (mtime_ns, size, sha256) of each file when its entry was read
+        self._datasets = {}
+        self._indexes = {} # (version, reducer) -> CatalogIndex over the whole catalog
+        self._lock = threading.RLock()
+        self._index_lock = threading.Lock()
+        self._last_refresh = time.monotonic()
+        cached = _read_cache_headers(data_dir)
+        for name in sorted(get_available_datasets(data_dir)):
+            self._read_entry(name, cached.get(name))
+            
+    def _read_entry(self, name: str, meta: dict = None, sha256: str = None) -> None:
+        path = os.path.join(self.data_dir, name + '.yaml')
+        stat = os.stat(path)
+        if meta is not None and meta['mtime_ns'] == stat.st_mtime_ns and meta['size'] == stat.st_size:
+            header, sha256 = {field: meta[field] for field in _HEADER_FIELDS}, meta['sha256']
+        else:
+            header = read_header(path)
+            if sha256 is None:
+                with open(path, 'rb') as file:
+                    sha256 = hashlib.sha256(file.read()).hexdigest()
+        self._entries[name] = CatalogEntry(name=name, **header)
+        self._stamps[name] = (stat.st_mtime_ns, stat.st_size, sha256)
+        
+    def _forget(self, name: str) -> list[str]:
+        # Drop the memoized datasets of a file, returning their fingerprints
+        keys = [key for key in self._datasets if key[0] == name]
+        return [self._datasets.pop(key).fingerprint for key in keys]
+    
+    def refresh(self, min_interval: float = 0) -> CatalogChange | None:
+        """
+        Poll the data directory and update the catalog in place: new files are added, deleted
+        ones removed, and files whose mtime/size and content hash changed get their header re-read 
+        and their memoized datasets dropped. Untouched files keep their loaded datasets.
+        Returns None without polling if the last refresh was less than min_interval seconds ago.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_refresh < min_interval:
+                return None
+            self._last_refresh = now
+            available = set(get_available_datasets(self.data_dir))
+            change = CatalogChange(version=self.version,
+                                   added=sorted(available - set(self._entries)),
+                                   removed=sorted(set(self._entries) - available))
+            for name in sorted(available & set(self._entries)):
+                path = os.path.join(self.data_dir, name + '.yaml')
+                stat = os.stat(path)
+                mtime_ns, size, sha256 = self._stamps[name]
+                if stat.st_mtime_ns == mtime_ns and stat.st_size == size:
+                    continue
+                with open(path, 'rb') as file:
+                    new_sha256 = hashlib.sha256(file.read()).hexdigest()
+                self._stamps[name] = (stat.st_mtime_ns, stat.st_size, new_sha256)
+                if new_sha256 != sha256:
+                    change.changed.append(name)
+                    
+            for name in change.removed:
+                change.stale_fingerprints += self._forget(name)
+                del self._entries[name], self._stamps[name]
+            for name in change.changed:
+                change.stale_fingerprints += self._forget(name)
+            for name in change.added:
+                self._read_entry(name)
+            for name in change.changed:
+                self._read_entry(name, sha256=self._stamps[name][2])
+            if change:
+                self._entries = dict(sorted(self._entries.items()))
+                self.version += 1
+                change.version = self.version
+            return change
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def __contains__(self, name: str) -> bool:
+        return name in self._entries
+    
+    def __iter__(self):
+        return iter(self.entries())
+    
+    def names(self) -> list[str]:
+        return list(self._entries)
+    
+    def entries(self) -> list[CatalogEntry]:
+        return list(self._entries.values())
+    
+    def entry(self, name: str) -> CatalogEntry:
+        if name not in self._entries:
+            raise ValueError(f"Dataset '{name}' not found. Available datasets: {self.names()}")
+        return self._entries[name]
+    
+    def is_loaded(self, name: str, reducer: str = None) -> bool:
+        return (name, reducer) in self._datasets
+    
+    def get(self, name: str, reducer: str = None) -> DataSet:
+        """
+        The dataset with the given name, optionally summarised by a registered reducer (e.g. 'lowest').
+        """
+        self.entry(name)
+        with self._lock:
+            if (name, reducer) not in self._datasets:
+                if reducer is None:
+                    header, ragged = _get_catalog_cache(self.data_dir, self.mmap).get(name)
+                    dataset = DataSet(data=ragged, **header)
+                else:
+                    dataset = reduce_dataset(self.get(name), reducer)
+                    _read_only(dataset.ragged)
+                self._datasets[(name, reducer)] = dataset
+            return self._datasets[(name, reducer)]
+
+    def load(self, names: list[str] | None = None, reducer: str = None, workers: int | None = None,
+             executor: str = 'process') -> dict[str, Exception]:
+        """
+        Load many datasets at once with load_datasets, memoizing them (and their reduction) as get would.
+        Returns the errors of the files that failed to load, by name.
+        """
+        names = self.names() if names is None else list(names)
+        for name in names:
+            self.entry(name)
+        with self._lock:
+            missing = [name for name in names if not self.is_loaded(name)]
+        errors = {}
+        for result in load_datasets(missing, workers=workers, executor=executor, data_dir=self.data_dir, mmap=self.mmap):
+            if result.ok:
+                with self._lock:
+                    self._datasets.setdefault((result.name, None), result.dataset)
+            else:
+                errors[result.name] = result.error
+        if reducer is not None:
+            for name in names:
+                if name not in errors:
+                    self.get(name, reducer)
+        return errors
+    
+    def index(self, reducer: str = None, workers: int | None = None, executor: str = 'process') -> 'CatalogIndex':
+        """
+        CatalogIndex over every dataset of the catalog (optionally reduced), built once per catalog
+        version and reducer, e.g. to pass to plot_eor_limits.plot. Datasets that fail to load are left out.
+        """
+        with self._index_lock:
+            key = (self.version, reducer)
+            if key not in self._indexes:
+                errors = self.load(reducer=reducer, workers=workers, executor=executor)
+                index = CatalogIndex.build([self.get(name, reducer) for name in self.names() if name not in errors])
+                self._indexes = {k: v for k, v in self._indexes.items() if k[0] == key[0]}
+                self._indexes[key] = index
+            return self._indexes[key]
+
+class CatalogOverlay:
+    """
+    Per-session view of a shared DatasetCatalog with extra datasets (e.g. uploads) layered on top.
+    The overlay only holds its own datasets; everything else is looked up in the shared catalog.
+    """
+    
+    def __init__(self, catalog: DatasetCatalog):
+        self.catalog = catalog
+        self._extra = {} # name -> {reducer: DataSet}
+        
+    def add(self, name: str, dataset: DataSet) -> None:
+        # Adding the same dataset again keeps its memoized reductions
+        if name not in self._extra or self._extra[name][None] is not dataset:
+            self._extra[name] = {None: dataset}
+        
+    def remove(self, name: str) -> None:
+        self._extra.pop(name, None)
+        
+    def extra_names(self) -> list[str]:
+        return list(self._extra)
+    
+    def names(self) -> list[str]:
+        return self.catalog.names() + self.extra_names()
+    
+    def __contains__(self, name: str) -> bool:
+        return name in self._extra or name in self.catalog
+    
+    def get(self, name: str, reducer: str = None) -> DataSet:
+        if name not in self._extra:
+            return self.catalog.get(name, reducer)
+        datasets = self._extra[name]
+        if reducer not in datasets:
+            datasets[reducer] = reduce_dataset(datasets[None], reducer)
+        return datasets[reducer]
+
+##################################################################
+#####                   Catalog range index                  #####
+##################################################################
+
+@attrs.define(eq=False)
+class CatalogIndex:
+    """
+    Sorted keys over a list of datasets: dataset years, z of every z-row and k of every point, both over
+    the whole catalog and within each row. Range queries use binary search, so their cost scales with
+    the number of rows selected and points returned.
+    """
+    datasets: list
+    year_sorted: np.ndarray
+    year_order: np.ndarray # dataset positions sorted by year
+    z_sorted: np.ndarray
+    z_order: np.ndarray # global row ids sorted by z
+    k_sorted: np.ndarray
+    k_order: np.ndarray # global point ids sorted by k
+    row_dataset: np.ndarray # dataset position of each global row
+    row_iz: np.ndarray # row within its dataset of each global row
+    point_row: np.ndarray # global row id of each global point
+    point_offset: np.ndarray # global point id of the first point of each dataset
+    row_k_keys: np.ndarray # (global row id, rank of k) of every point as row*N_points + rank, sorted
+    row_k_order: np.ndarray # global point ids in the order of row_k_keys
+    _positions: dict = attrs.field(factory=dict, repr=False)
+    
+    def __attrs_post_init__(self):
+        self._positions = {id(d): i for i, d in enumerate(self.datasets)}
+    
+    @classmethod
+    @timed('catalog_index')
+    def build(cls, datasets: list[DataSet]) -> 'CatalogIndex':
+        datasets = list(datasets)
+        raggeds = [d.ragged for d in datasets]
+        years = np.array([d.year for d in datasets], dtype=np.int64)
+        n_rows = np.array([r.n_z for r in raggeds], dtype=np.int64)
+        n_points = np.array([len(r.k) for r in raggeds], dtype=np.int64)
+        row_offset = np.concatenate([[0], np.cumsum(n_rows)])
+        z = np.concatenate([r.z for r in raggeds]) if raggeds else np.zeros(0)
+        k = np.concatenate([r.k for r in raggeds]) if raggeds else np.zeros(0)
+        point_row = np.concatenate([r.point_z_index() + offset for r, offset in zip(raggeds, row_offset)]) \
+                    if raggeds else np.zeros(0, dtype=np.int64)
+        year_order = np.argsort(years, kind='stable')
+        z_order = np.argsort(z, kind='stable')
+        k_order = np.argsort(k, kind='stable')
+        k_rank = np.empty(len(k), dtype=np.int64)
+        k_rank[k_order] = np.arange(len(k))
+        row_k_keys = point_row.astype(np.int64) * len(k) + k_rank
+        row_k_order = np.argsort(row_k_keys, kind='stable')
+        return cls(
+            datasets=datasets,
+            year_sorted=years[year_order],
+            year_order=year_order,
+            z_sorted=z[z_order],
+            z_order=z_order,
+            k_sorted=k[k_order],
+            k_order=k_order,
+            row_dataset=np.repeat(np.arange(len(datasets)), n_rows),
+            row_iz=np.arange(len(z)) - np.repeat(row_offset[:-1], n_rows),
+            point_row=point_row,
+            point_offset=np.concatenate([[0], np.cumsum(n_points)]),
+            row_k_keys=row_k_keys[row_k_order],
+            row_k_order=row_k_order,
+            )
+    
+    def position(self, dataset: DataSet) -> int:
+        # Position of a dataset object in the index, or -1 if it is not indexed
+        return self._positions.get(id(dataset), -1)
+    
+    def query(self, z_range: tuple = None, k_range: tuple = None, year_range: tuple = None,
+              subset: list[int] = None) -> list[tuple[int, int, np.ndarray]]:
+        """
+        Spans to draw for the given ranges (inclusive), as a list of (dataset position, z-row, point indices)
+        sorted by dataset and row, where the point indices are sorted and index the dataset's flat k arrays.
+        subset: restrict the query to these dataset positions.
+        """
+        def search(sorted_keys, value_range):
+            if value_range is None:
+                return 0, len(sorted_keys)
+            return (np.searchsorted(sorted_keys, value_range[0], side='left'), 
+                    np.searchsorted(sorted_keys, value_range[1], side='right'))
+        
+        # Allowed datasets and rows
+        lo, hi = search(self.year_sorted, year_range)
+        dataset_ok = np.zeros(len(self.datasets), dtype=bool)
+        dataset_ok[self.year_order[lo:hi]] = True
+        if subset is not None:
+            in_subset = np.zeros(len(self.datasets), dtype=bool)
+            in_subset[np.asarray(subset, dtype=np.int64)] = True
+            dataset_ok &= in_subset
+        lo, hi = search(self.z_sorted, z_range)
+        row_ok = np.zeros(len(self.row_dataset), dtype=bool)
+        rows = self.z_order[lo:hi]
+        row_ok[rows[dataset_ok[self.row_dataset[rows]]]] = True
+        
+        # Points within the k range on allowed rows, grouped by row. The k range is a range of k ranks,
+        # so with a row filter it is bisected within each allowed row instead of over the whole catalog
+        lo, hi = search(self.k_sorted, k_range)
+        if subset is not None or year_range is not None or z_range is not None:
+            rows = np.flatnonzero(row_ok)
+            n_points = len(self.k_sorted)
+            starts = np.searchsorted(self.row_k_keys, rows * n_points + lo, side='left')
+            stops = np.searchsorted(self.row_k_keys, rows * n_points + hi, side='left')
+            spans = []
+            for row, start, stop in zip(rows, starts, stops):
+                if start < stop:
+                    position = self.row_dataset[row]
+                    points = np.sort(self.row_k_order[start:stop])
+                    spans.append((int(position), int(self.row_iz[row]), points - self.point_offset[position]))
+            return spans
+        points = self.k_order[lo:hi]
+        points = np.sort(points[row_ok[self.point_row[points]]])
+        point_rows = self.point_row[points]
+        starts = np.flatnonzero(np.r_[True, point_rows[1:] != point_rows[:-1]]) if len(points) else []
+        spans = []
+        for start, stop in zip(starts, np.r_[starts[1:], len(points)].astype(np.int64) if len(points) else []):
+            row = point_rows[start]
+            position = self.row_dataset[row]
+            spans.append((int(position), int(self.row_iz[row]), points[start:stop] - self.point_offset[position]))
+        return spans
+
+##################################################################
+#####                   Envelope functions                   #####
+##################################################################
+
+ENVELOPE_Z_EDGES = np.arange(5.0, 30.0 + 0.25, 0.5)
+ENVELOPE_LOG_K_EDGES = np.arange(-3.0, 2.0 + 0.05, 0.1)
+
+@attrs.define(eq=False)
+class Envelope:
+    """
+    Tightest limit in every (z, log k) cell of a grid across several datasets.
+    delta_squared is NaN, and source is -1, for cells without any limit.
+    """
+    z_edges: np.ndarray
+    log_k_edges: np.ndarray
+    delta_squared: np.ndarray # shape (N_zbins, N_kbins)
+    source: np.ndarray # shape (N_zbins, N_kbins), index into keys
+    keys: list
+    
+    @property
+    def z_centres(self) -> np.ndarray:
+        return 0.5 * (self.z_edges[1:] + self.z_edges[:-1])
+    
+    @property
+    def k_centres(self) -> np.ndarray:
+        return 10**(0.5 * (self.log_k_edges[1:] + self.log_k_edges[:-1]))
+    
+    def source_keys(self, source: np.ndarray = None) -> np.ndarray:
+        source = self.source if source is None else source
+        keys = np.array(list(self.keys) + [''], dtype=object)
+        return keys[np.where(source >= 0, source, len(self.keys))]
+    
+    def along(self, axis: str = 'k') -> tuple[np.ndarray, np.ndarray]:
+        # Collapse the grid to a 1D envelope along k (min over z) or along z (min over k)
+        values = self.delta_squared if axis == 'k' else self.delta_squared.T
+        sources = self.source if axis == 'k' else self.source.T
+        filled = np.where(np.isnan(values), np.inf, values)
+        best = np.argmin(filled, axis=0)
+        cols = np.arange(values.shape[1])
+        envelope = filled[best, cols]
+        return np.where(np.isinf(envelope), np.nan, envelope), np.where(np.isinf(envelope), -1, sources[best, cols])
+
+def _bin_span(lower: np.ndarray, upper: np.ndarray, edges: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # First and last bin [edges[i], edges[i+1]) overlapping each closed interval [lower, upper]
+    first = np.searchsorted(edges, lower, side='right') - 1
+    last = np.maximum(first, np.searchsorted(edges, upper, side='left') - 1)
+    return np.maximum(first, 0), np.minimum(last, len(edges) - 2)
+
+@timed()
+def compute_envelope(datasets: list[DataSet], 
+                     z_edges: np.ndarray = ENVELOPE_Z_EDGES,
+                     log_k_edges: np.ndarray = ENVELOPE_LOG_K_EDGES,
+                     y_axis: str = 'delta_sq',
+                     use_bounds: bool = True,
+                     z_range: tuple = None,
+                     k_range: tuple = None,
+                     year_range: tuple = None) -> Envelope:
+    """
+    Bin every point of the datasets onto a (z, log k) grid and keep the lowest one per cell.
+    With use_bounds, a point covers every cell overlapping [z_lower, z_upper] x [k_lower, k_upper]
+    (falling back to z or k where a bound is missing), otherwise only the cell containing (z, k).
+    y_axis: 'delta_sq' or 'power', the quantity that is minimised.
+    """
+    z_edges = np.asarray(z_edges, dtype=np.float64)
+    log_k_edges = np.asarray(log_k_edges, dtype=np.float64)
+    n_zbins, n_kbins = len(z_edges) - 1, len(log_k_edges) - 1
+    
+    # Gather all points into flat arrays, tagged with their dataset index
+    datasets = [d for d in datasets if year_range is None or year_range[0] <= d.year <= year_range[1]]
+    keys = [d.key for d in datasets]
+    raggeds = [d.ragged for d in datasets]
+    rows = [r.point_z_index() for r in raggeds]
+    def gather(fields, per_z):
+        return np.concatenate([getattr(r, fields)[row] if per_z else getattr(r, fields) for r, row in zip(raggeds, rows)]) \
+               if raggeds else np.zeros(0)
+    z, z_lower, z_upper = gather('z', True), gather('z_lower', True), gather('z_upper', True)
+    k, k_lower, k_upper = gather('k', False), gather('k_lower', False), gather('k_upper', False)
+    y = gather('delta_squared', False)
+    if y_axis == 'power':
+        y = y * ((2*np.pi**2)/(k**3))
+    source = np.repeat(np.arange(len(raggeds)), [len(r.k) for r in raggeds])
+    
+    # Apply filters on the point centres
+    mask = ~np.isnan(y) & (k > 0)
+    if z_range is not None:
+        mask &= (z >= z_range[0]) & (z <= z_range[1])
+    if k_range is not None:
+        mask &= (k >= k_range[0]) & (k <= k_range[1])
+    if use_bounds:
+        z_lo, z_hi = np.where(np.isnan(z_lower), z, z_lower), np.where(np.isnan(z_upper), z, z_upper)
+        k_lo, k_hi = np.where(np.isnan(k_lower) | (k_lower <= 0), k, k_lower), np.where(np.isnan(k_upper), k, k_upper)
+    else:
+        z_lo, z_hi, k_lo, k_hi = z, z, k, k
+    z_lo, z_hi, k_lo, k_hi, y, source = (arr[mask] for arr in (z_lo, z_hi, k_lo, k_hi, y, source))
+    
+    # Range of cells covered by each point, dropping points entirely outside the grid
+    iz0, iz1 = _bin_span(z_lo, z_hi, z_edges)
+    ik0, ik1 = _bin_span(np.log10(k_lo), np.log10(k_hi), log_k_edges)
+    inside = (iz0 <= iz1) & (ik0 <= ik1)
+    iz0, iz1, ik0, ik1, y, source = (arr[inside] for arr in (iz0, iz1, ik0, ik1, y, source))
+    
+    # Expand each point into the cells it covers
+    nz, nk = iz1 - iz0 + 1, ik1 - ik0 + 1
+    n_cells = nz * nk
+    point = np.repeat(np.arange(len(y)), n_cells)
+    j = np.arange(len(point)) - np.repeat(np.cumsum(n_cells) - n_cells, n_cells)
+    cell = (iz0[point] + j // nk[point]) * n_kbins + (ik0[point] + j % nk[point])
+    
+    # Binned min: sort by (cell, y) and keep the first entry of every cell
+    order = np.lexsort((y[point], cell))
+    cell, point = cell[order], point[order]
+    first = np.r_[True, cell[1:] != cell[:-1]] if len(cell) else np.zeros(0, dtype=bool)
+    grid = np.full(n_zbins * n_kbins, np.nan)
+    grid_source = np.full(n_zbins * n_kbins, -1, dtype=np.int64)
+    grid[cell[first]] = y[point[first]]
+    grid_source[cell[first]] = source[point[first]]
+    
+    return Envelope(
+        z_edges=z_edges,
+        log_k_edges=log_k_edges,
+        delta_squared=grid.reshape(n_zbins, n_kbins),
+        source=grid_source.reshape(n_zbins, n_kbins),
+        keys=keys,
+        )
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Compile the data/ catalog into the binary cache.")
+    parser.add_argument('--data-dir', default=DATA_DIR, help="Directory containing the dataset YAML files.")
+    parser.add_argument('--check', nargs='+', metavar='FILE', 
+                        help="Instead of compiling, validate these YAML files and report every violation.")
+    parser.add_argument('--mode', default='strict', choices=VALIDATION_MODES, help="Validation mode for --check.")
+    parser.add_argument('--workers', type=int, default=None, 
+                        help="Number of worker processes for compiling (default: one per CPU).")
+    args = parser.parse_args()
+    if args.check:
+        n_failed = 0
+        for path in args.check:
+            try:
+                with open(path, 'r') as file:
+                    data_dict = yaml.safe_load(file).get('data', {})
+                process_data(data_dict)
+                validate_data(data_dict, mode=args.mode)
+            except (OSError, ValueError, AttributeError, yaml.YAMLError) as e:
+                n_failed += 1
+                print(f"{path}: FAILED")
+                for violation in getattr(e, 'violations', [str(e)]):
+                    print(f"    {violation}")
+        print(f"{len(args.check) - n_failed}/{len(args.check)} files passed ({args.mode} validation).")
+        raise SystemExit(1 if n_failed else 0)
+    n_changed, errors = compile_catalog(args.data_dir, workers=args.workers)
+    for fname, error in errors.items():
+        print(f"{fname}: FAILED")
+        for violation in getattr(error, 'violations', [str(error)]):
+            print(f"    {violation}")
+    print(f"Compiled {len(get_available_datasets(args.data_dir)) - len(errors)} datasets ({n_changed} rebuilt) "
+          f"into {os.path.join(args.data_dir, CATALOG_CACHE_FILE)}")
+    raise SystemExit(1 if errors else 0)
@@ -0,0 +1,236 @@
+import sys
+import attrs
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+import eor_limits
+import query_eor_limits
+
+##################################################################
+#####                      Model grids                       #####
+##################################################################
+
+def _to_axis(arr) -> np.ndarray:
+    return np.asarray(arr, dtype=float).ravel()
+
+def _to_values(arr) -> np.ndarray:
+    # Keep memory-mapped arrays as they are, so chunks are only read when evaluated
+    return arr if isinstance(arr, np.ndarray) and arr.dtype.kind == 'f' else np.asarray(arr, dtype=float)
+
+@attrs.define(eq=False)
+class ModelGrid:
+    """
+    Theory power spectra Δ² [mK²] of many models on a common grid: values has shape (N_models, N_z, N_k),
+    with increasing z and k axes of at least two points each.
+    path: the .npz file the grid was memory-mapped from, if any (worker processes map it themselves).
+    """
+    values: np.ndarray = attrs.field(converter=_to_values)
+    z: np.ndarray = attrs.field(converter=_to_axis)
+    k: np.ndarray = attrs.field(converter=_to_axis)
+    labels: list = None
+    path: str = None
+
+    def __attrs_post_init__(self):
+        if self.values.ndim != 3 or self.values.shape[1:] != (len(self.z), len(self.k)):
+            raise ValueError("values must have shape (N_models, N_z, N_k), matching the z and k axes.")
+        if len(self.z) < 2 or len(self.k) < 2 or np.any(np.diff(self.z) <= 0) or np.any(np.diff(self.k) <= 0) \
+                or self.k[0] <= 0:
+            raise ValueError("z and k must be strictly increasing with at least two points, and k positive.")
+        if self.labels is None:
+            self.labels = [f'model {i}' for i in range(len(self))]
+        self.labels = [str(label) for label in self.labels]
+        if len(self.labels) != len(self):
+            raise ValueError("labels must have one entry per model.")
+
+    def __len__(self) -> int:
+        return self.values.shape[0]
+
+    def select(self, indices) -> 'ModelGrid':
+        """
+        The models at the given indices (or boolean mask), e.g. to overlay them on a plot.
+        """
+        indices = np.arange(len(self))[indices]
+        return ModelGrid(values=self.values[indices], z=self.z, k=self.k, labels=[self.labels[i] for i in indices])
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> 'ModelGrid':
+        """
+        Read a grid saved with save(). With mmap, values stay on disk and are read chunk by chunk.
+        """
+        with np.load(path) as npz:
+            z, k = npz['z'], npz['k']
+            labels = list(npz['labels']) if 'labels' in npz.files else None
+            if not mmap:
+                return cls(values=npz['values'], z=z, k=k, labels=labels)
+        with open(path, 'rb') as file:
+            values = eor_limits._mmap_npz(file, ['values'])['values']
+        return cls(values=values, z=z, k=k, labels=labels, path=path)
+
+    def save(self, path: str) -> None:
+        # Uncompressed, so that load() can memory-map the values
+        np.savez(path, values=self.values, z=self.z, k=self.k, labels=np.array(self.labels, dtype=str))
+
+def _interpolation_weights(grid: ModelGrid, z: np.ndarray, log_k: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Bilinear interpolation in (z, log10 k) of the grid at the given points, as the flat (z, k) grid
+    indices and weights of the 4 corners of each point, both of shape (N_points, 4).
+    Also returns the mask of the points inside the grid; the others get zero weights.
+    """
+    grid_log_k = np.log10(grid.k)
+    inside = (z >= grid.z[0]) & (z <= grid.z[-1]) & (log_k >= grid_log_k[0]) & (log_k <= grid_log_k[-1])
+    iz = np.clip(np.searchsorted(grid.z, z, side='right') - 1, 0, len(grid.z) - 2)
+    ik = np.clip(np.searchsorted(grid_log_k, log_k, side='right') - 1, 0, len(grid.k) - 2)
+    tz = np.clip((z - grid.z[iz]) / (grid.z[iz+1] - grid.z[iz]), 0, 1)
+    tk = np.clip((log_k - grid_log_k[ik]) / (grid_log_k[ik+1] - grid_log_k[ik]), 0, 1)
+    n_k = len(grid.k)
+    indices = np.stack([iz*n_k + ik, iz*n_k + ik+1, (iz+1)*n_k + ik, (iz+1)*n_k + ik+1], axis=1)
+    weights = np.stack([(1-tz)*(1-tk), (1-tz)*tk, tz*(1-tk), tz*tk], axis=1) * inside[:, None]
+    return np.where(inside[:, None], indices, 0), weights, inside
+
+##################################################################
+#####                    Exclusion engine                    #####
+##################################################################
+
+# Upper bound on the number of interpolated values held at once (N_models in a chunk x N_points x 4 corners)
+MAX_CHUNK_VALUES = 20_000_000
+
+@attrs.define
+class ExclusionResult:
+    """
+    How each model compares to each dataset: ratio is the largest model/limit ratio over the limits
+    of the dataset inside the model grid (NaN if there are none), and z, k are where it is reached.
+    A model violates a dataset where ratio > 1. Arrays have shape (N_models, N_datasets).
+    """
+    labels: list
+    names: list
+    ratio: np.ndarray
+    z: np.ndarray
+    k: np.ndarray
+
+    @property
+    def violated(self) -> np.ndarray:
+        return self.ratio > 1
+
+    @property
+    def excluded(self) -> np.ndarray:
+        # Models violating at least one dataset
+        return self.violated.any(axis=1)
+
+    def to_frame(self) -> pd.DataFrame:
+        # One row per (model, dataset)
+        n_models, n_datasets = self.ratio.shape
+        return pd.DataFrame({
+            'model': np.repeat(self.labels, n_datasets),
+            'dataset': np.tile(self.names, n_models),
+            'violated': self.violated.ravel(),
+            'ratio': self.ratio.ravel(),
+            'z': self.z.ravel(),
+            'k': self.k.ravel(),
+        })
+
+@attrs.define(eq=False)
+class _Problem:
+    # Everything a worker needs to evaluate a chunk of models against the limits
+    indices: np.ndarray # (N_points, 4) flat grid indices of the corners of each limit point
+    weights: np.ndarray # (N_points, 4)
+    limits: np.ndarray # limit of each point
+    z: np.ndarray
+    k: np.ndarray
+    segments: np.ndarray # points of dataset i span segments[i]:segments[i+1]
+    path: str = None # memory-mapped model file, if the chunks are not sent with the tasks
+
+_worker_state = {}
+
+def _init_worker(problem: _Problem) -> None:
+    _worker_state['problem'] = problem
+    _worker_state['values'] = ModelGrid.load(problem.path).values if problem.path is not None else None
+
+def _evaluate_chunk(task: tuple) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Ratios of a chunk of models to the limits: the largest ratio per dataset and the point it is reached at.
+    """
+    start, stop, values = task
+    problem = _worker_state['problem']
+    if values is None:
+        values = _worker_state['values'][start:stop]
+    values = np.asarray(values, dtype=float).reshape(stop - start, -1)
+    ratio = np.einsum('mpc,pc->mp', values[:, problem.indices], problem.weights) / problem.limits
+    ratio[np.isnan(ratio)] = -np.inf
+    n_datasets = len(problem.segments) - 1
+    best, worst = np.full((stop - start, n_datasets), np.nan), np.full((stop - start, n_datasets), -1)
+    for i in range(n_datasets):
+        s, e = problem.segments[i], problem.segments[i+1]
+        if s < e:
+            worst[:, i] = s + np.argmax(ratio[:, s:e], axis=1)
+            best[:, i] = ratio[np.arange(stop - start), worst[:, i]]
+    worst[best == -np.inf] = -1
+    best[best == -np.inf] = np.nan
+    return best, worst
+
+@eor_limits.timed('exclusion')
+def compute_exclusion(models: ModelGrid, index: query_eor_limits.LimitIndex, workers: int | None = 1,
+                      chunk_size: int = None) -> ExclusionResult:
+    """
+    Compare every model of a grid to every limit of a LimitIndex (e.g. query_eor_limits.get_limit_index(catalog)).
+    The models are interpolated bilinearly in (z, log10 k) onto each limit point, and evaluated in
+    chunks of chunk_size models (by default as many as fit in MAX_CHUNK_VALUES), in worker
+    processes unless workers == 1.
+    """
+    # Limit points inside the model grid, grouped by dataset
+    point_row = np.repeat(np.arange(len(index.row_z)), np.diff(index.row_offsets))
+    z, log_k = index.row_z[point_row], index.log_k
+    indices, weights, inside = _interpolation_weights(models, z, log_k)
+    point_dataset = index.row_dataset[point_row]
+    order = np.flatnonzero(inside)[np.argsort(point_dataset[inside], kind='stable')]
+    segments = np.searchsorted(point_dataset[order], np.arange(len(index.names) + 1))
+    problem = _Problem(indices=indices[order], weights=weights[order], limits=index.delta_squared[order],
+                       z=z[order], k=10**log_k[order], segments=segments, path=models.path)
+
+    n_models = len(models)
+    if chunk_size is None:
+        chunk_size = max(1, MAX_CHUNK_VALUES // max(1, 4 * len(order)))
+    elif chunk_size < 1:
+        raise ValueError("chunk_size must be a positive integer.")
+    starts = range(0, n_models, chunk_size)
+    def tasks():
+        for start in starts:
+            stop = min(start + chunk_size, n_models)
+            yield start, stop, None if models.path is not None else models.values[start:stop]
+
+    ratio = np.full((n_models, len(index.names)), np.nan)
+    worst = np.full((n_models, len(index.names)), -1)
+    if workers == 1 or len(starts) <= 1:
+        _worker_state.update(problem=problem, values=models.values)
+        results = map(_evaluate_chunk, tasks())
+        for start, (chunk_ratio, chunk_worst) in zip(starts, results):
+            ratio[start:start + chunk_size], worst[start:start + chunk_size] = chunk_ratio, chunk_worst
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(problem,)) as pool:
+            for start, (chunk_ratio, chunk_worst) in zip(starts, pool.map(_evaluate_chunk, tasks())):
+                ratio[start:start + chunk_size], worst[start:start + chunk_size] = chunk_ratio, chunk_worst
+    # Where no limit is inside the grid (possibly none at all), there is no constraint
+    found = worst >= 0
+    z, k = np.full(ratio.shape, np.nan), np.full(ratio.shape, np.nan)
+    z[found], k[found] = problem.z[worst[found]], problem.k[worst[found]]
+    return ExclusionResult(labels=list(models.labels), names=list(index.names), ratio=ratio, z=z, k=k)
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Check a grid of theory models against every limit in the catalog.")
+    parser.add_argument('models', help="Model grid .npz with 'values' (N_models, N_z, N_k), 'z', 'k' and optional 'labels'.")
+    parser.add_argument('--lowest-only', action='store_true', help="Only use the lowest limit per z-bin.")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: one per CPU).")
+    parser.add_argument('--chunk-size', type=int, default=None, help="Models evaluated per chunk.")
+    parser.add_argument('--data-dir', default=eor_limits.DATA_DIR)
+    parser.add_argument('--output', default=None, help="CSV of every (model, dataset) comparison.")
+    args = parser.parse_args()
+
+    models = ModelGrid.load(args.models)
+    index = query_eor_limits.get_limit_index(eor_limits.DatasetCatalog(args.data_dir),
+                                             reducer='lowest' if args.lowest_only else None)
+    for name, error in index.errors.items():
+        print(f"{name}: skipped, {error}", file=sys.stderr)
+    result = compute_exclusion(models, index, workers=args.workers, chunk_size=args.chunk_size)
+    if args.output:
+        result.to_frame().to_csv(args.output, index=False)
+    print(f"{result.excluded.sum()}/{len(models)} models violate at least one limit.")
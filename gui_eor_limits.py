@@ -1,4 +1,7 @@
 import tomllib
+import hashlib
+import io
+import contextlib
 import streamlit as st
 import pandas as pd
 import plot_eor_limits
@@ -12,6 +15,15 @@ with open(".streamlit/config.toml", "rb") as f:
     backgroundColor = config.get("backgroundColor")
     secondaryBackgroundColor = config.get("secondaryBackgroundColor")
 
+# Number of plotted points above which fast rendering switches to WebGL
+WEBGL_THRESHOLD = 5000
+# Points per redshift slice that fast rendering decimates dense spectra to
+FAST_MAX_POINTS = 1000
+# Seconds between polls of the data directory for added, changed or deleted files
+CATALOG_REFRESH_INTERVAL = 10
+# Number of parsed uploads kept per session
+UPLOAD_CACHE_SIZE = 16
+
 def _apply_css():
 
     def _color_to_rgba(color, alpha):
@@ -51,139 +63,211 @@ def _apply_css():
         unsafe_allow_html=True,
     )
 
-@st.cache_data
+@st.cache_resource
+def load_catalog():
+    # Shared by all sessions without copying; only dataset headers are read here, data is parsed 
+    # on first selection into read-only arrays memory-mapped from the compiled cache
+    return eor_limits.DatasetCatalog(mmap=True)
+
+def get_overlay():
+    # This session's view of the shared catalog, holding only the session's uploads. If the shared
+    # catalog was rebuilt (e.g. its resource cache was cleared), the uploads are layered on the new one
+    # again from the session's upload cache, which the rows of the datasets table refer to
+    overlay = st.session_state.get('catalog_overlay')
+    if overlay is None or overlay.catalog is not load_catalog():
+        overlay = st.session_state['catalog_overlay'] = eor_limits.CatalogOverlay(load_catalog())
+        upload_cache = st.session_state.get('upload_cache')
+        for row in st.session_state.get('upload_rows', []):
+            cached = upload_cache.get(row['name'].removeprefix('upload:')) if upload_cache is not None else None
+            if cached is not None and cached[0] is not None:
+                overlay.add(row['name'], cached[0])
+    return overlay
+
+def refresh_catalog():
+    # Reload only the changed files of the shared catalog (at most once per interval across all
+    # sessions) and drop the plot traces of the datasets they replace
+    change = load_catalog().refresh(min_interval=CATALOG_REFRESH_INTERVAL)
+    if change:
+        plot_eor_limits.discard_traces(change.stale_fingerprints)
+
 def load_datasets():
-    fnames = eor_limits.get_available_datasets()
+    catalog = load_catalog()
     list_datasets = []
-    for fname in fnames:
-        draw = eor_limits.load_dataset(fname)
-        dlowest = eor_limits.load_dataset_lowest_limits(fname)
+    for entry in catalog.entries():
         list_datasets.append({
-            'fname': f"{draw.author}{draw.year}" if 'HERA' not in draw.author else f'HERA{draw.year}',
-            'telescope': draw.telescope,
-            'year': draw.year,
-            'doi': draw.doi,
-            'dataset_raw': draw,
-            'dataset_lowest': dlowest,
-            'checkbox': None
+            'fname': entry.key,
+            'name': entry.name,
+            'telescope': entry.telescope,
+            'year': entry.year,
+            'doi': entry.doi
         })
     df_datasets = pd.DataFrame(list_datasets)
     return df_datasets
 
-def main():
+def get_datasets_table():
+    # Catalog and upload rows sorted by telescope and year, rebuilt only when either changes
+    upload_rows = st.session_state.get('upload_rows', [])
+    version = (load_catalog().version, tuple(row['name'] for row in upload_rows))
+    cached = st.session_state.get('datasets_table')
+    if cached is None or cached[0] != version:
+        df_datasets = pd.concat([load_datasets(), pd.DataFrame(upload_rows)]) if upload_rows else load_datasets()
+        df_datasets = df_datasets.sort_values(by=['telescope', 'year']).reset_index(drop=True)
+        cached = st.session_state['datasets_table'] = (version, df_datasets)
+    return cached[1]
 
-    # Page configuration
-    st.set_page_config(page_title="21-cm Power Spectrum Limits Plotter",
-                       page_icon="📡",
-                       layout='wide')
+def get_dataset(row, lowest_only):
+    # Uploads come from the session overlay, catalog datasets are loaded on first use
+    return get_overlay().get(row['name'], 'lowest' if lowest_only else None)
 
-    _apply_css()
-    
-    st.markdown(
-        f'''
-        <div style="padding: 0.15rem 0 0.5rem 0;">
-            <div style="font-size: 3rem; font-weight: 800; line-height: 1.05; color:{primaryColor}">📡 21-cm Power Spectrum Limits Plotter</div>
-            <div style="font-size: 0.95rem; opacity: 0.75; margin-top: 0.35rem"> by Jiten Dhandha, last updated 25 June 2026</div>
-            <div style="margin-top: 0.75rem; margin-bottom: 1rem; line-height: 1.55;">
-                An interactive tool to visualize published 21-cm power spectrum upper limits from interferometric experiments.
-                Select datasets from the sidebar and customize the plot using the options below. Hover over the data points
-                for more info, click on legend items to toggle visibility, and double-click to isolate a dataset.
-            </div>
-        </div>
-        ''',
-        unsafe_allow_html=True,
-    )
-    
-    # Sidebar for dataset selection
-    with st.sidebar:
-        
-        # Load existing datasets
-        if 'df_datasets' not in st.session_state:
-            df_datasets = load_datasets()
-        
-        # Upload own dataset
-        st.markdown('<div class="app-section-title">Upload your own data</div>', unsafe_allow_html=True)
-        uploaded_datasets = st.file_uploader("For data protection, hover over info icon", type=['yaml'], 
-                                             help="""
-                                             Uploaded datasets are stored in-memory on the server for processing during your session. 
-                                             They are not saved anywhere permanently, and not accessible to any other app users. 
-                                             Only the main author (Jiten Dhandha) has access to the server logs, 
-                                             which do not display the contents of uploaded files.
-                                             """,
-                                             accept_multiple_files=True)
-        for uploaded_dataset in uploaded_datasets:
-            upload_data = uploaded_dataset.getvalue().decode('utf-8')
-            try:
-                user_dataset = eor_limits.load_dataset(upload_data, if_yaml_str=True)
-                user_dataset_lowest = eor_limits.load_dataset_lowest_limits(upload_data, if_yaml_str=True)
-                st.success(f"Successfully loaded dataset: {user_dataset.author}{user_dataset.year}")
-                df_datasets = pd.concat([
-                    df_datasets,
-                    pd.DataFrame([{
-                        'fname': f"{user_dataset.author}{user_dataset.year}" if 'HERA' not in user_dataset.author else f'HERA{user_dataset.year}',
-                        'telescope': user_dataset.telescope,
-                        'year': user_dataset.year,
-                        'doi': user_dataset.doi,
-                        'dataset_raw': user_dataset,
-                        'dataset_lowest': user_dataset_lowest,
-                        'checkbox': None
-                    }])
-                ])
-            except Exception as e:
-                st.error(f"Failed to load dataset: {e}")
-                
-        # Sort datasets by telescope and year
-        df_datasets = df_datasets.sort_values(by=['telescope', 'year']).reset_index(drop=True)
+def get_selection_index(datasets):
+    # Range index over the selected datasets only (never the whole catalog, which would load every
+    # dataset), kept until the selection changes. The cached index holds the datasets, so their ids stay unique
+    key = tuple(id(dataset) for dataset in datasets)
+    cached = st.session_state.get('selection_index')
+    if cached is None or cached[0] != key:
+        cached = st.session_state['selection_index'] = (key, eor_limits.CatalogIndex.build(datasets))
+    return cached[1]
 
-        # Dataset selection checkboxes
-        st.markdown('<div class="app-section-title">Select datasets</div>', unsafe_allow_html=True)
+def load_upload(upload_bytes, upload_name):
+    # Uploads are parsed once per session and then looked up by content hash on every rerun
+    cache = st.session_state.setdefault('upload_cache', eor_limits.LRUCache(UPLOAD_CACHE_SIZE))
+    key = hashlib.sha256(upload_bytes).hexdigest()
+    result = cache.get(key)
+    if result is None:
+        try:
+            dataset = eor_limits.read_dataset(io.BytesIO(upload_bytes), format=eor_limits.dataset_format(upload_name),
+                                              validation='strict')
+            result = (dataset, None)
+        except Exception as e:
+            result = (None, e)
+        cache.put(key, result)
+    return key, result
+
+def on_upload():
+    # Parse the uploader's files only when they change, not on every rerun
+    overlay = get_overlay()
+    upload_rows, upload_messages, upload_keys = [], [], set()
+    uploads = st.session_state['uploads'] or []
+    # At most UPLOAD_CACHE_SIZE uploads are kept, so neither the upload cache nor the overlay grows past it
+    for uploaded_dataset in uploads[UPLOAD_CACHE_SIZE:]:
+        upload_messages.append(('warning', f"Skipped {uploaded_dataset.name}: "
+                                           f"at most {UPLOAD_CACHE_SIZE} uploads are kept per session."))
+    for uploaded_dataset in uploads[:UPLOAD_CACHE_SIZE]:
+        key, (user_dataset, error) = load_upload(uploaded_dataset.getvalue(), uploaded_dataset.name)
+        upload_keys.add(key)
+        if error is not None:
+            upload_messages.append(('error', f"Failed to load dataset: {error}"))
+        else:
+            upload_messages.append(('success', f"Successfully loaded dataset: {user_dataset.author}{user_dataset.year}"))
+            overlay.add(f'upload:{key}', user_dataset)
+            upload_rows.append({
+                'fname': user_dataset.key,
+                'name': f'upload:{key}',
+                'telescope': user_dataset.telescope,
+                'year': user_dataset.year,
+                'doi': user_dataset.doi
+            })
+    st.session_state['upload_rows'] = upload_rows
+    st.session_state['upload_messages'] = upload_messages
+
+    # Forget uploads that were removed from the uploader, in both the cache and the overlay
+    upload_cache = st.session_state.get('upload_cache')
+    if upload_cache is not None:
+        for key in upload_cache.keys():
+            if key not in upload_keys:
+                upload_cache.pop(key)
+    for name in overlay.extra_names():
+        if name.removeprefix('upload:') not in upload_keys:
+            overlay.remove(name)
+
+def on_select_all(names, key):
+    # Set the selection checkboxes of names (and, for the global toggle, the telescope toggles) to key's value
+    value = st.session_state[key]
+    for name in names:
+        st.session_state[f'select:{name}'] = value
+    if key == 'select_all':
+        for telescope_key in list(st.session_state):
+            if telescope_key.startswith('select_all_'):
+                st.session_state[telescope_key] = value
+
+def select_datasets(df_datasets):
+    st.markdown('<div class="app-section-title">Select datasets</div>', unsafe_allow_html=True)
+    with st.container(horizontal=True, gap="xsmall"):
+        st.markdown("Select/Deselect all")
+        st.checkbox("", key="select_all", on_change=on_select_all, args=(list(df_datasets['name']), 'select_all'))
+    for telescope_name, df_telescope in df_datasets.groupby('telescope', sort=False):
         with st.container(horizontal=True, gap="xsmall"):
-            st.markdown("Select/Deselect all")
-            select_all = st.checkbox("", value=False, key="select_all")
-        select_all_telescope = {}
-        for idx, row in df_datasets.iterrows():
-            if idx == 1 or df_datasets.iloc[idx]['telescope'] != df_datasets.iloc[idx-1]['telescope']:
-                with st.container(horizontal=True, gap="xsmall"):
-                    telescope_name = df_datasets.iloc[idx]['telescope']
-                    st.markdown(f'<div class="app-telescope-heading">{telescope_name}</div>', unsafe_allow_html=True)
-                    select_all_telescope[telescope_name] = st.checkbox(f"", value=False, key=f"select_all_{telescope_name}")
+            st.markdown(f'<div class="app-telescope-heading">{telescope_name}</div>', unsafe_allow_html=True)
+            st.checkbox("", key=f"select_all_{telescope_name}", on_change=on_select_all,
+                        args=(list(df_telescope['name']), f"select_all_{telescope_name}"))
+        for row in df_telescope.itertuples():
             with st.container(horizontal=True, gap="xsmall"):
-                df_datasets.at[idx, 'checkbox'] = st.checkbox(row['fname'], 
-                                                value=select_all or select_all_telescope[row['telescope']])
-                if row['doi']: # Add DOI link if available
-                    st.markdown(f"<a href='https://doi.org/{row['doi']}' target='_blank' style='text-decoration: none;'>🔗</a>", 
+                st.checkbox(row.fname, key=f"select:{row.name}")
+                if row.doi: # Add DOI link if available
+                    st.markdown(f"<a href='https://doi.org/{row.doi}' target='_blank' style='text-decoration: none;'>🔗</a>",
                                 unsafe_allow_html=True)
-    
+    return df_datasets[[bool(st.session_state.get(f'select:{name}')) for name in df_datasets['name']]]
+
+def performance_shown():
+    # The performance panel is hidden unless timing is enabled or the page is opened with ?perf=1
+    return eor_limits.timing_enabled() or st.query_params.get('perf') == '1'
+
+@contextlib.contextmanager
+def record_rerun(name):
+    # Spans of one part of the current run, collected in session_state for the performance panel
+    if not performance_shown():
+        yield
+        return
+    with eor_limits.record_spans() as spans:
+        with eor_limits.span(name):
+            yield
+    st.session_state.setdefault('rerun_spans', []).extend(spans)
+
+@st.fragment
+def plot_panel(selected):
+    # Reruns on its own when a plotting option changes, so only the figure is rebuilt. The performance
+    # panel is drawn here too, so it shows the spans of full reruns and of these partial ones alike.
+    with record_rerun('plot_panel'):
+        _plot_panel(selected)
+    if performance_shown():
+        show_performance(st.session_state.pop('rerun_spans', []))
+
+def _plot_panel(selected):
+
     # Two columns: left for options, right for plot
     columns = st.columns([1,3])
     bottom_left_cell = columns[0].container(border=True, height="stretch", vertical_alignment="center")
     cont_plot = columns[1].container(border=True, height="stretch", vertical_alignment="center")
-    
+
     # Options area
     with bottom_left_cell:
         st.markdown('<div class="app-section-title">Plotting options</div>', unsafe_allow_html=True)
         plot_type = st.radio(
-            "Plot type:", 
-            options=['line', 'scatter'],
-            format_func=lambda x: 'Line plot' if x=='line' else 'Scatter plot',
+            "Plot type:",
+            options=['line', 'scatter', 'envelope', 'envelope_map'],
+            format_func=lambda x: {'line': 'Line plot', 'scatter': 'Scatter plot',
+                                   'envelope': 'Tightest-limit envelope', 'envelope_map': 'Envelope heatmap ($k$, $z$)'}[x],
         )
         x_axis = st.radio(
-            "$x$ axis:", 
+            "$x$ axis:",
             options=['k', 'z'],
             format_func=lambda x: 'Wavenumber $k$' if x=='k' else 'Redshift $z$',
         )
         x_axis_errors = st.toggle("Show $x$ axis error bars", value=False)
         x_axis_log = st.toggle("Logarithmic $x$ axis", value=(x_axis=='k'))
         y_axis = st.radio(
-            "$y$ axis:", 
+            "$y$ axis:",
             options=['delta_sq', 'power'],
             format_func=lambda x: 'Dimensionless $\Delta^2(k)$' if x=='delta_sq' else 'Power $P(k)$',
         )
         lowest_only = st.toggle("Show only lowest limits per $z$-bin", value=False)
+        fast_rendering = st.toggle("Fast rendering", value=False,
+                                   help="Merge the redshifts of each dataset into a single trace, use WebGL for large plots, "
+                                        "and draw only the lowest points of very dense spectra.")
         z_range = st.slider("$z$ range", min_value=5.0, max_value=30.0, value=(5.0,30.0), step=0.1)
         log_k_range = st.slider("$\log(k)$ range", min_value=-3.0, max_value=2.0, value=(-3.0,2.0), step=0.1)
         year_range = st.slider("Year range", min_value=2010, max_value=2030, value=(2010,2030), step=1)
-        
+
     # Custom plot kwargs (needed first for plot_kwargs_dict to be defined)
     with st.expander("Customize plot appearance"):
         st.markdown("Provide a Python dictionary to customize the appearance of each dataset. \
@@ -195,12 +279,21 @@ def main():
         except Exception as e:
             st.warning(f"Invalid plot_kwargs_dict: {e}")
             plot_kwargs_dict = {}
-    
+
+    # Load the selected catalog datasets in one parallel batch, dropping any that fail; threads, since a
+    # process pool per rerun costs more than the loads it parallelizes
+    load_errors = load_catalog().load([name for name in selected['name'] if name in load_catalog()],
+                                      reducer='lowest' if lowest_only else None, executor='thread')
+    for name, error in load_errors.items():
+        st.error(f"Failed to load dataset {name}: {error}")
+    selected = selected[~selected['name'].isin(list(load_errors))]
+
     # Plot area
     with cont_plot:
         st.markdown('<div class="app-section-title">Plot area</div>', unsafe_allow_html=True)
+        datasets = [get_dataset(row, lowest_only) for idx, row in selected.iterrows()]
         fig = plot_eor_limits.plot(
-            [row['dataset_lowest' if lowest_only else 'dataset_raw'] for idx, row in df_datasets.iterrows() if row['checkbox']],
+            datasets,
             plot_type=plot_type,
             x_axis=x_axis,
             x_axis_log=x_axis_log,
@@ -209,17 +302,94 @@ def main():
             z_range=z_range,
             k_range=(10**log_k_range[0], 10**log_k_range[1]),
             year_range=year_range,
-            plot_kwargs_dict=plot_kwargs_dict
+            plot_kwargs_dict=plot_kwargs_dict,
+            render_mode='merged' if fast_rendering else 'per_z',
+            webgl_threshold=WEBGL_THRESHOLD if fast_rendering else None,
+            max_points=FAST_MAX_POINTS if fast_rendering else None,
+            index=get_selection_index(datasets)
         )
-        st.plotly_chart(fig, width="stretch", height="stretch")
-
-    # Show raw data
-    with st.expander("Show raw data of selected datasets"):
-        for idx, row in df_datasets.iterrows():
-            if row['checkbox']:
-                st.markdown(f'<div class="app-telescope-heading">{row["fname"]}</div>', unsafe_allow_html=True)
-                st.dataframe(row['dataset_lowest' if lowest_only else 'dataset_raw'].data)
-            
-        
+        with eor_limits.span('plotly_chart'):
+            st.plotly_chart(fig, width="stretch", height="stretch")
+
+    raw_data(selected, lowest_only)
+
+@st.fragment
+def raw_data(selected, lowest_only):
+    # The tables are only built while the expander is open; opening or closing it reruns just this fragment
+    expander = st.expander("Show raw data of selected datasets", key="raw_data", on_change="rerun")
+    if not expander.open:
+        return
+    with expander:
+        for idx, row in selected.iterrows():
+            st.markdown(f'<div class="app-telescope-heading">{row["fname"]}</div>', unsafe_allow_html=True)
+            st.dataframe(get_dataset(row, lowest_only).data)
+
+def main():
+
+    # Page configuration
+    st.set_page_config(page_title="21-cm Power Spectrum Limits Plotter",
+                       page_icon="📡",
+                       layout='wide')
+
+    _apply_css()
+
+    st.markdown(
+        f'''
+        <div style="padding: 0.15rem 0 0.5rem 0;">
+            <div style="font-size: 3rem; font-weight: 800; line-height: 1.05; color:{primaryColor}">📡 21-cm Power Spectrum Limits Plotter</div>
+            <div style="font-size: 0.95rem; opacity: 0.75; margin-top: 0.35rem"> by Jiten Dhandha, last updated 25 June 2026</div>
+            <div style="margin-top: 0.75rem; margin-bottom: 1rem; line-height: 1.55;">
+                An interactive tool to visualize published 21-cm power spectrum upper limits from interferometric experiments.
+                Select datasets from the sidebar and customize the plot using the options below. Hover over the data points
+                for more info, click on legend items to toggle visibility, and double-click to isolate a dataset.
+            </div>
+        </div>
+        ''',
+        unsafe_allow_html=True,
+    )
+
+    # Sidebar for dataset selection; a full rerun is only triggered from here, by uploads and
+    # dataset toggles, and reuses the parsed uploads and the sorted table from session_state
+    with record_rerun('sidebar'), st.sidebar:
+
+        # Load existing datasets
+        refresh_catalog()
+
+        # Upload own dataset
+        st.markdown('<div class="app-section-title">Upload your own data</div>', unsafe_allow_html=True)
+        st.file_uploader("For data protection, hover over info icon", type=['yaml', 'csv', 'npz'],
+                         help="""
+                         Uploaded datasets are stored in-memory on the server for processing during your session.
+                         They are not saved anywhere permanently, and not accessible to any other app users.
+                         Only the main author (Jiten Dhandha) has access to the server logs,
+                         which do not display the contents of uploaded files.
+                         """,
+                         accept_multiple_files=True, key='uploads', on_change=on_upload)
+        for kind, message in st.session_state.get('upload_messages', []):
+            getattr(st, kind)(message)
+
+        # Dataset selection checkboxes
+        selected = select_datasets(get_datasets_table())
+
+    plot_panel(selected)
+
+def show_performance(spans):
+    # Timings of this rerun and cache statistics, for finding slow stages in production
+    with st.expander("Performance"):
+        if spans:
+            df_spans = pd.DataFrame(spans)
+            st.markdown("Time per stage in the last run (of the whole page, or of the plot alone):")
+            st.dataframe(df_spans.groupby('span')['ms'].agg(['count', 'sum', 'max']).sort_values('sum', ascending=False))
+            st.markdown("All spans, in order of completion:")
+            st.dataframe(df_spans)
+        caches = {'Plot traces': plot_eor_limits.trace_cache_stats()}
+        if 'upload_cache' in st.session_state:
+            caches['Uploads'] = st.session_state['upload_cache'].stats()
+        for stats in caches.values():
+            lookups = stats['hits'] + stats['misses']
+            stats['hit_rate'] = stats['hits'] / lookups if lookups else None
+        st.markdown("Cache statistics:")
+        st.dataframe(pd.DataFrame(caches).T)
+    
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,3 +1,4 @@
+import json
 import numpy as np
 import matplotlib as mpl
 import plotly.express as px
@@ -10,8 +11,316 @@ def _gradient_colors(base_color, n):
     factors = np.linspace(1.5, 0.5, n) # lighter to darker
     return [f'rgb({int(255*min(1, rgb[0]*f))}, {int(255*min(1, rgb[1]*f))}, {int(255*min(1, rgb[2]*f))})' for f in factors]
 
+def _update_layout(fig, x_axis, x_axis_log, y_axis):
+    fig.update_layout(
+        xaxis = dict(
+            type='log' if x_axis_log else 'linear', exponentformat='e',
+            title='k [h/Mpc]' if x_axis == 'k' else 'Redshift z',
+        ),
+        yaxis = dict(
+            type='log', exponentformat='e',
+            title='Δ² [mK²]' if y_axis == 'delta_sq' else 'P(k) [mK²/(h/Mpc)³]',
+        ),
+        legend=dict(
+            font=dict(size=10),
+        )
+    )
+    return fig
+
+# Envelope of the tightest limits across all datasets, as a curve or a (k, z) heatmap
+
+ENVELOPE_PLOT_TYPES = ['envelope', 'envelope_map']
+
+@eor_limits.timed('plot_envelope')
+def _plot_envelope(datasets, plot_type, x_axis, x_axis_log, x_axis_errors, y_axis, 
+                   z_range, k_range, year_range, envelope_bins, kwargs):
+    
+    z_edges, log_k_edges = envelope_bins if envelope_bins is not None \
+                           else (eor_limits.ENVELOPE_Z_EDGES, eor_limits.ENVELOPE_LOG_K_EDGES)
+    envelope = eor_limits.compute_envelope(datasets, z_edges=z_edges, log_k_edges=log_k_edges, y_axis=y_axis,
+                                           z_range=z_range, k_range=k_range, year_range=year_range)
+    fig = go.Figure()
+    y_label = 'Δ²' if y_axis == 'delta_sq' else 'P(k)'
+    
+    if plot_type == 'envelope_map':
+        with np.errstate(divide='ignore'):
+            log_values = np.log10(envelope.delta_squared)
+        fig.add_trace(go.Heatmap(x=envelope.k_centres, y=envelope.z_centres, z=log_values,
+                      text=envelope.source_keys(),
+                      hovertemplate=f'k=%{{x:.3g}}, z=%{{y:.2f}}<br>log10 {y_label}=%{{z:.2f}}<br>%{{text}}<extra></extra>',
+                      colorscale=kwargs.get('colorscale', 'Viridis'),
+                      colorbar=dict(title=f'log10 {y_label}')))
+        _update_layout(fig, 'k', x_axis_log, y_axis)
+        fig.update_layout(yaxis=dict(type='linear', title='Redshift z'))
+        return fig
+    
+    # 1D envelope along the chosen x axis
+    values, sources = envelope.along(x_axis)
+    if x_axis == 'k':
+        x = envelope.k_centres
+        x_lower, x_upper = 10**envelope.log_k_edges[:-1], 10**envelope.log_k_edges[1:]
+    elif x_axis == 'z':
+        x = envelope.z_centres
+        x_lower, x_upper = envelope.z_edges[:-1], envelope.z_edges[1:]
+    else:
+        raise ValueError("Invalid x_axis. Use 'k' or 'z'.")
+    error_x = dict(type='data',symmetric=False,array=x_upper-x, arrayminus=x-x_lower) if x_axis_errors else None
+    color = kwargs.get('color', px.colors.qualitative.Plotly[0])
+    fig.add_trace(go.Scatter(x=x, y=values, mode='lines+markers',
+                  error_x=error_x,
+                  name='Envelope',
+                  text=envelope.source_keys(sources),
+                  hovertemplate='x=%{x:.3g}, y=%{y:.3g}<br>%{text}<extra></extra>',
+                  marker=dict(kwargs.get('marker', dict(symbol='triangle-down',size=8,)), color=color),
+                  line=dict(kwargs.get('line', dict(shape='hvh')), color=color),
+                  connectgaps=False))
+    return _update_layout(fig, x_axis, x_axis_log, y_axis)
+
+# Filtering and trace building for the line and scatter plot types
+
+RENDER_MODES = ['per_z', 'merged']
+
+def _dataset_slices(dataset, spans, x_axis, x_axis_errors, y_axis):
+    """
+    Arrays of the redshift slices of a dataset to draw, as a list of dicts with keys
+    iz, z, z_tag, x, y, k and error_x (None if x axis errors are not shown).
+    spans: list of (z-row, point indices) from CatalogIndex.query; points of a row that are
+    skipped over are drawn as NaN gaps.
+    """
+    data = dataset.ragged
+    slices = []
+    
+    # Loop over redshifts
+    for iz, points in spans:
+        
+        # Get data for this redshift, masking points outside the range
+        row = slice(points[0], points[-1] + 1)
+        mask = np.zeros(row.stop - row.start, dtype=bool)
+        mask[points - row.start] = True
+        k_vals = data.k[row]
+        if y_axis == 'delta_sq':
+            y = data.delta_squared[row]
+        elif y_axis == 'power':
+            y = data.delta_squared[row] * ((2*np.pi**2)/(k_vals**3))
+        else:
+            raise ValueError("Invalid y_axis. Use 'delta_sq' or 'power'.")
+        
+        # Check what the x axis is
+        if x_axis == 'k':
+            x, x_lower, x_upper = k_vals, data.k_lower[row], data.k_upper[row]
+        elif x_axis == 'z':
+            ones = np.ones_like(y)
+            x, x_lower, x_upper = data.z[iz] * ones, data.z_lower[iz] * ones, data.z_upper[iz] * ones
+        else:
+            raise ValueError("Invalid x_axis. Use 'k' or 'z'.")
+        if not mask.all():
+            x, x_lower, x_upper, y = (np.where(mask, arr, np.nan) for arr in (x, x_lower, x_upper, y))
+        
+        # x axis errors
+        if x_axis_errors:
+            error_x = dict(type='data',symmetric=False,array=x_upper-x, arrayminus=x-x_lower)
+        else:
+            error_x = None
+        
+        slices.append(dict(iz=iz, z=data.z[iz], z_tag=data.z_tags[iz], x=x, y=y, k=k_vals, error_x=error_x))
+    return slices
+
+def _decimate_slice(sl, max_points, x_axis_log):
+    """
+    Reduce a slice to at most max_points points by splitting its x range (in log10 x on a log axis)
+    into max_points equal bins and keeping the point with the lowest y in each bin, since the
+    lowest limit is the one that matters. If all points share one x (x_axis='z'), the bins split
+    the log10 k range instead. Kept points are real data points, in their original order,
+    and NaN gaps between them are preserved.
+    """
+    x, y = sl['x'], sl['y']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        xs = np.log10(x) if x_axis_log else x
+    valid = np.isfinite(xs) & np.isfinite(y)
+    finite = np.flatnonzero(valid)
+    if len(finite) <= max_points:
+        return sl
+    xs = xs[finite]
+    if xs.min() == xs.max():
+        with np.errstate(divide='ignore', invalid='ignore'):
+            xs = np.log10(sl['k'][finite])
+        if not np.isfinite(xs).all() or xs.min() == xs.max():
+            return sl
+    edges = np.linspace(xs.min(), xs.max(), max_points + 1)
+    bins = np.clip(np.searchsorted(edges, xs, side='right') - 1, 0, max_points - 1)
+    order = np.lexsort((y[finite], bins))
+    lowest = order[np.r_[True, bins[order][1:] != bins[order][:-1]]]
+    keep = finite[np.sort(lowest)]
+    
+    # Points that were NaN between two kept points become a single NaN gap
+    gaps = np.cumsum(~valid)
+    take = np.insert(keep, np.flatnonzero(gaps[keep[1:]] != gaps[keep[:-1]]) + 1, -1)
+    def select(arr):
+        return np.where(take >= 0, arr[np.maximum(take, 0)], np.nan)
+    error_x = sl['error_x']
+    if error_x is not None:
+        error_x = dict(error_x, array=select(error_x['array']), arrayminus=select(error_x['arrayminus']))
+    return dict(sl, x=select(x), y=select(y), k=select(sl['k']), error_x=error_x)
+
+def _default_marker(kwargs):
+    return kwargs.get('marker', dict(symbol='triangle-down',size=8,))
+
+def _default_line(kwargs):
+    return kwargs.get('line', dict(shape='linear'))
+
+def _per_z_traces(dataset, slices, color_gradient, kwargs, mode, trace_type):
+    # One trace per redshift, each with its own legend entry that toggles only that redshift
+    traces = []
+    for sl in slices:
+        color = color_gradient[sl['iz']]
+        z_tag_val = f"({sl['z_tag']})" if sl['z_tag'] else ""
+        traces.append(trace_type(x=sl['x'], y=sl['y'], mode=mode,
+                      error_x=sl['error_x'],
+                      name=f"{dataset.key}, z={sl['z']} {z_tag_val}",
+                      marker=dict(_default_marker(kwargs), color=color),
+                      line=dict(_default_line(kwargs), color=color)))
+    return traces
+
+def _merged_traces(dataset, slices, color_gradient, base_color, kwargs, mode, trace_type):
+    # All redshifts of a dataset in one trace, separated by NaNs. Per-point marker colours
+    # index into a discrete colorscale built from the redshift gradient.
+    if not slices:
+        return []
+    def join(arrays):
+        return np.concatenate([part for arr in arrays for part in (arr, [np.nan])][:-1])
+    x = join([sl['x'] for sl in slices])
+    y = join([sl['y'] for sl in slices])
+    z = join([np.full(len(sl['x']), sl['z']) for sl in slices]).astype(np.float32)
+    color_index = np.nan_to_num(join([np.full(len(sl['x']), sl['iz'], dtype=np.float64) for sl in slices])).astype(np.uint16)
+    n_colors = len(color_gradient)
+    colorscale = [[i / max(1, n_colors - 1), color] for i, color in enumerate(color_gradient)]
+    if n_colors == 1:
+        colorscale.append([1, color_gradient[0]])
+    if slices[0]['error_x'] is not None:
+        error_x = dict(type='data',symmetric=False,
+                       array=join([sl['error_x']['array'] for sl in slices]),
+                       arrayminus=join([sl['error_x']['arrayminus'] for sl in slices]))
+    else:
+        error_x = None
+    if any(sl['z_tag'] for sl in slices):
+        text = [tag for sl in slices for tag in [f"({sl['z_tag']})"] * len(sl['x']) + ['']][:-1]
+    else:
+        text = None
+    return [trace_type(x=x, y=y, mode=mode,
+            error_x=error_x,
+            name=dataset.key,
+            legendgroup=dataset.key,
+            customdata=z,
+            text=text,
+            hovertemplate='z=%{customdata} %{text}<br>x=%{x}, y=%{y}' if text else 'z=%{customdata}<br>x=%{x}, y=%{y}',
+            marker=dict(_default_marker(kwargs), color=color_index, colorscale=colorscale, cmin=0, cmax=max(1, n_colors - 1)),
+            line=dict(_default_line(kwargs), color=base_color),
+            connectgaps=False)]
+
+# Traces of each dataset are memoized on the dataset content plus the options that affect its traces
+
+TRACE_CACHE_SIZE = 512
+_trace_cache = eor_limits.LRUCache(maxsize=TRACE_CACHE_SIZE)
+
+def _as_range(value_range):
+    return None if value_range is None else tuple(float(v) for v in value_range)
+
+def _dataset_traces(dataset, spans, base_color, kwargs, mode, render_mode, trace_type, 
+                    x_axis, x_axis_log, x_axis_errors, y_axis, z_range, k_range, max_points, use_cache):
+    key = (dataset.fingerprint, base_color, json.dumps(kwargs, sort_keys=True, default=str), mode, render_mode, 
+           trace_type.__name__, x_axis, x_axis_errors, y_axis, _as_range(z_range), _as_range(k_range),
+           max_points, x_axis_log if max_points is not None else None)
+    traces = _trace_cache.get(key) if use_cache else None
+    if traces is None:
+        with eor_limits.span('plot_traces', dataset=dataset.key):
+            slices = _dataset_slices(dataset, spans, x_axis, x_axis_errors, y_axis)
+            if max_points is not None:
+                slices = [_decimate_slice(sl, max_points, x_axis_log) for sl in slices]
+            color_gradient = _gradient_colors(base_color, dataset.ragged.n_z)
+            if render_mode == 'per_z':
+                traces = _per_z_traces(dataset, slices, color_gradient, kwargs, mode, trace_type)
+            else:
+                traces = _merged_traces(dataset, slices, color_gradient, base_color, kwargs, mode, trace_type)
+        if use_cache:
+            _trace_cache.put(key, traces)
+    return traces
+
+def clear_trace_cache():
+    _trace_cache.clear()
+
+def discard_traces(fingerprints):
+    # Drop the cached traces of datasets that are no longer current (e.g. after a catalog refresh)
+    fingerprints = set(fingerprints)
+    stale = [key for key in _trace_cache.keys() if key[0] in fingerprints]
+    for key in stale:
+        _trace_cache.pop(key)
+    return len(stale)
+
+def trace_cache_stats():
+    return _trace_cache.stats()
+
+# Theory models overlaid on the limits, e.g. a selection of an exclusion_eor_limits.ModelGrid
+
+def _model_traces(models, x_axis, y_axis, z_range, k_range, plot_kwargs_dict):
+    """
+    One dashed trace per model, with the grid slices along the x axis separated by NaNs: a curve over k
+    at every grid redshift in z_range, or over z at every grid wavenumber in k_range.
+    models: any object with values of shape (N_models, N_z, N_k), z and k axes and labels
+    """
+    z_mask = np.ones(len(models.z), dtype=bool) if z_range is None else (models.z >= z_range[0]) & (models.z <= z_range[1])
+    k_mask = np.ones(len(models.k), dtype=bool) if k_range is None else (models.k >= k_range[0]) & (models.k <= k_range[1])
+    z, k = models.z[z_mask], models.k[k_mask]
+    if x_axis == 'k':
+        x, other = np.broadcast_to(k, (len(z), len(k))), np.broadcast_to(z[:, None], (len(z), len(k)))
+        hovertemplate = 'z=%{customdata:.3g}<br>x=%{x}, y=%{y}'
+    elif x_axis == 'z':
+        x, other = np.broadcast_to(z, (len(k), len(z))), np.broadcast_to(k[:, None], (len(k), len(z)))
+        hovertemplate = 'k=%{customdata:.3g}<br>x=%{x}, y=%{y}'
+    else:
+        raise ValueError("Invalid x_axis. Use 'k' or 'z'.")
+    def join(arr):
+        # Rows of a 2D array as one NaN-separated 1D array
+        return np.concatenate([arr, np.full((len(arr), 1), np.nan)], axis=1).ravel()[:-1] if arr.size else arr.ravel()
+    
+    traces = []
+    base_colors = px.colors.qualitative.Dark24
+    for idx, label in enumerate(models.labels):
+        y = np.asarray(models.values[idx])[np.ix_(z_mask, k_mask)]
+        if y_axis == 'power':
+            y = y * ((2*np.pi**2)/(k**3))
+        elif y_axis != 'delta_sq':
+            raise ValueError("Invalid y_axis. Use 'delta_sq' or 'power'.")
+        if x_axis == 'z':
+            y = y.T
+        kwargs = plot_kwargs_dict.get(label, {})
+        color = kwargs.get('color', base_colors[idx % len(base_colors)])
+        traces.append(go.Scatter(x=join(x), y=join(y), mode='lines',
+                      name=label,
+                      legendgroup=label,
+                      customdata=join(other),
+                      hovertemplate=hovertemplate,
+                      line=dict(kwargs.get('line', dict(dash='dash')), color=color),
+                      connectgaps=False))
+    return traces
+
 # Main plotting function for EoR limits using Plotly
 
+# Options of plot() that figure specs (render_eor_limits) and plot requests (serve_eor_limits) may set
+PLOT_OPTIONS = ['plot_type', 'x_axis', 'x_axis_log', 'x_axis_errors', 'y_axis', 'z_range', 'k_range',
+                'year_range', 'plot_kwargs_dict', 'envelope_bins', 'render_mode', 'max_points']
+
+def _check_plot_kwargs(plot_kwargs_dict):
+    # Each entry is a dict of Plotly properties whose marker and line are dicts themselves
+    if not isinstance(plot_kwargs_dict, dict):
+        raise ValueError("plot_kwargs_dict must be a dict.")
+    for key, kwargs in plot_kwargs_dict.items():
+        if not isinstance(kwargs, dict):
+            raise ValueError(f"plot_kwargs_dict['{key}'] must be a dict.")
+        for field in ['marker', 'line']:
+            if not isinstance(kwargs.get(field, {}), dict):
+                raise ValueError(f"plot_kwargs_dict['{key}']['{field}'] must be a dict.")
+
+@eor_limits.timed()
 def plot(datasets, 
         plot_type = 'line', 
         x_axis = 'k', 
@@ -21,128 +330,99 @@ def plot(datasets,
         z_range = None,
         k_range = None,
         year_range = None,
-        plot_kwargs_dict = {}):
+        plot_kwargs_dict = {},
+        envelope_bins = None,
+        render_mode = 'per_z',
+        webgl_threshold = None,
+        use_cache = True,
+        index = None,
+        max_points = None,
+        models = None):
     """
     Plot multiple datasets on the same figure.
     datasets: list of dataset objects
+    plot_type: 'line', 'scatter', or 'envelope'/'envelope_map' for the tightest limit across all datasets
+    x_axis_errors: draw x error bars down to k_lower and up to k_upper (z_lower and z_upper on a z axis)
     plot_kwargs_dict: dict of dicts, keys are dataset identifiers, values are Plotly marker/line dicts
+                      (the key 'envelope' styles the envelope plot types)
+    envelope_bins: (z_edges, log_k_edges) of the envelope grid, defaults to eor_limits.ENVELOPE_*_EDGES
+    render_mode: 'per_z' for one trace per redshift, or 'merged' for one NaN-separated trace per dataset
+    webgl_threshold: if given, use WebGL (go.Scattergl) traces when the datasets hold more points than this
+    use_cache: reuse the traces of datasets whose content and relevant options did not change
+    index: prebuilt eor_limits.CatalogIndex, e.g. DatasetCatalog.index() over the whole catalog; datasets
+           not in it (or all of them, if not provided) are indexed on the fly
+    max_points: if given, draw at most this many points per redshift slice, keeping the lowest point
+                in each of max_points bins along the x axis (the datasets themselves are not changed)
+    models: theory models to draw over the limits, e.g. grid.select(indices) of an exclusion_eor_limits.ModelGrid
+            (plot_kwargs_dict styles them by label)
     """
     if not isinstance(datasets, (list, tuple)):
         datasets = [datasets]
-    if not isinstance(plot_kwargs_dict, dict):
-        raise ValueError("plot_kwargs_dict must be a dict.")
+    _check_plot_kwargs(plot_kwargs_dict)
+    # Ensure all datasets have an entry
+    for dataset in datasets:
+        key = dataset.key
+        if key not in plot_kwargs_dict:
+            plot_kwargs_dict[key] = {}
+
+    if plot_type in ENVELOPE_PLOT_TYPES:
+        if models is not None and plot_type == 'envelope_map':
+            raise ValueError("models cannot be overlaid on an envelope_map plot.")
+        fig = _plot_envelope(datasets, plot_type, x_axis, x_axis_log, x_axis_errors, y_axis,
+                             z_range, k_range, year_range, envelope_bins, plot_kwargs_dict.get('envelope', {}))
+        if models is not None:
+            fig.add_traces(_model_traces(models, x_axis, y_axis, z_range, k_range, plot_kwargs_dict))
+        return fig
+
+    # Plot type
+    if plot_type == 'line':
+        mode = 'lines+markers'
+    elif plot_type == 'scatter':
+        mode = 'markers'
     else:
-        # Ensure all datasets have an entry
-        for dataset in datasets:
-            key = f'{dataset.author}{dataset.year}' if 'HERA' not in dataset.author else f'HERA{dataset.year}'
-            if key not in plot_kwargs_dict:
-                plot_kwargs_dict[key] = {}
+        raise ValueError("Invalid plot_type. Use 'line', 'scatter', 'envelope' or 'envelope_map'.")
+    if render_mode not in RENDER_MODES:
+        raise ValueError(f"Invalid render_mode. Use one of {RENDER_MODES}.")
+    if max_points is not None and max_points < 1:
+        raise ValueError("max_points must be a positive integer.")
 
+    # The trace type depends on the total size of the selected datasets
+    base_colors = px.colors.qualitative.Plotly
+    n_points = sum(len(dataset.ragged.k) for dataset in datasets)
+    trace_type = go.Scattergl if webgl_threshold is not None and n_points > webgl_threshold else go.Scatter
+    
+    # Spans of points to draw, grouped by dataset: from the catalog index for the datasets it holds,
+    # and from a small index built here over the others (e.g. uploads)
+    positions = [index.position(dataset) if index is not None else -1 for dataset in datasets]
+    spans = [[] for dataset in datasets]
+    indexed = {position: idx for idx, position in enumerate(positions) if position >= 0}
+    if indexed:
+        for position, iz, points in index.query(z_range, k_range, year_range, subset=list(indexed)):
+            spans[indexed[position]].append((iz, points))
+    missing = [idx for idx, position in enumerate(positions) if position < 0]
+    if missing:
+        extra_index = eor_limits.CatalogIndex.build([datasets[idx] for idx in missing])
+        for position, iz, points in extra_index.query(z_range, k_range, year_range):
+            spans[missing[position]].append((iz, points))
+    
     # Make square figure
     fig = go.Figure()
-    base_colors = px.colors.qualitative.Plotly
     
     # Loop over datasets
     for idx, dataset in enumerate(datasets):
         
-        #Retrieve data
-        data = dataset.data
-        y_arr = data.delta_squared
+        # Skip datasets filtered out entirely (e.g. by the year range)
+        if not spans[idx]:
+            continue
         
         # Plotting parameters 
-        key = f'{dataset.author}{dataset.year}' if 'HERA' not in dataset.author else f'HERA{dataset.year}'
-        kwargs = plot_kwargs_dict.get(key, {})
+        kwargs = plot_kwargs_dict.get(dataset.key, {})
         base_color = kwargs.get('color', base_colors[idx % len(base_colors)]) # default color
-        color_gradient = _gradient_colors(base_color, len(data.z))
         
-        # Loop over redshifts
-        for iz in range(len(data.z)):
-            
-            # Get data for this redshift
-            if y_axis == 'delta_sq':
-                y = y_arr[iz]
-            elif y_axis == 'power':
-                y = y_arr[iz] * ((2*np.pi**2)/(data.k[iz]**3))
-            z_vals = float(data.z[iz]) * np.ones_like(y)
-            z_lower_vals = data.z_lower[iz] * np.ones_like(y) if data.z_lower.size > 0 else None
-            z_upper_vals = data.z_upper[iz] * np.ones_like(y) if data.z_upper.size > 0 else None
-            k_vals = data.k[iz]
-            k_upper_vals = data.k_lower[iz] if data.k_lower.size > 0 else None
-            k_lower_vals = data.k_upper[iz] if data.k_upper.size > 0 else None
-            z_tag_val = f'({data.z_tags[iz]})' if data.z_tags.size > 0 else ""
-            
-            # Apply z range filter
-            if z_range is not None and (z_vals[0] < z_range[0] or z_vals[0] > z_range[1]):
-                continue
-            # Apply year range filter
-            if year_range is not None and (dataset.year is not None) and (dataset.year < year_range[0] or dataset.year > year_range[1]):
-                continue
-            # Apply k range filter
-            if k_range is not None:
-                k_mask = (k_vals >= k_range[0]) & (k_vals <= k_range[1])
-                if not np.any(k_mask):
-                    continue
-                k_vals = np.where(k_mask, k_vals, np.nan)
-                k_upper_vals = np.where(k_mask, k_upper_vals, np.nan) if k_upper_vals is not None else None
-                k_lower_vals = np.where(k_mask, k_lower_vals, np.nan) if k_lower_vals is not None else None
-                z_vals = np.where(k_mask, z_vals, np.nan)
-                z_lower_vals = np.where(k_mask, z_lower_vals, np.nan) if z_lower_vals is not None else None
-                z_upper_vals = np.where(k_mask, z_upper_vals, np.nan) if z_upper_vals is not None else None
-                y = np.where(k_mask, y, np.nan)
-            
-            # Check what the x axis is
-            if x_axis == 'k':
-                x = k_vals
-                x_lower = k_lower_vals
-                x_upper = k_upper_vals
-            elif x_axis == 'z':
-                x = z_vals
-                x_lower = z_lower_vals
-                x_upper = z_upper_vals
-            else:
-                raise ValueError("Invalid x_axis. Use 'k' or 'z'.")
-            
-            # x axis errors
-            if x_axis_errors and (x_lower is not None or x_upper is not None):
-                error_x = dict(type='data',symmetric=False,array=x_upper-x, arrayminus=x-x_lower)
-            else:
-                error_x = None
-                
-            # Plotting label and style
-            color = color_gradient[iz]
-            marker_kwargs = kwargs.get('marker', dict(symbol='triangle-down',size=8,)) # default marker
-            line_kwargs = kwargs.get('line', dict(shape='linear')) # default line
-            marker_kwargs['color'] = color # color set separately
-            line_kwargs['color'] = color # color set separately
-            label = f'{key}, z={z_vals[0]} {z_tag_val}'
-            
-            # Plot type
-            if plot_type == 'line':
-                mode = 'lines+markers'
-            elif plot_type == 'scatter':
-                mode = 'markers'
-            else:
-                raise ValueError("Invalid plot_type. Use 'line' or 'scatter'.")
-            
-            # Finally add the trace to the plot
-            fig.add_trace(go.Scatter(x=x, y=y, mode=mode,
-                        error_x=error_x,
-                        name=label,
-                        marker=marker_kwargs,
-                        line=line_kwargs)
-                        )
+        fig.add_traces(_dataset_traces(dataset, spans[idx], base_color, kwargs, mode, render_mode, trace_type,
+                                       x_axis, x_axis_log, x_axis_errors, y_axis, z_range, k_range, max_points, use_cache))
     
-    fig.update_layout(
-        xaxis = dict(
-            type='log' if x_axis_log else 'linear', exponentformat='e',
-            title='k [h/Mpc]' if x_axis == 'k' else 'Redshift z',
-        ),
-        yaxis = dict(
-            type='log', exponentformat='e',
-            title='Δ² [mK²]' if y_axis == 'delta_sq' else 'P(k) [mK²/(h/Mpc)³]',
-        ),
-        legend=dict(
-            font=dict(size=10),
-        )
-    )
-    return fig
+    if models is not None:
+        fig.add_traces(_model_traces(models, x_axis, y_axis, z_range, k_range, plot_kwargs_dict))
+    
+    return _update_layout(fig, x_axis, x_axis_log, y_axis)
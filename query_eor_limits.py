@@ -0,0 +1,322 @@
+import sys
+import threading
+import weakref
+import attrs
+import numpy as np
+import pandas as pd
+import eor_limits
+
+##################################################################
+#####                     Point index                        #####
+##################################################################
+
+# Default half-widths of the query boxes: half the envelope bin widths
+DEFAULT_Z_TOL = 0.25
+DEFAULT_LOG_K_TOL = 0.05
+# Maximum number of (query, row) pairs evaluated at once, bounding the memory of batch queries
+MAX_PAIRS = 1_000_000
+QUERY_TYPES = ['nearest', 'lowest', 'interpolate']
+
+@attrs.define
+class QueryResult:
+    """
+    Matches of a batch query, one per query point. dataset is the identifier of the matching dataset
+    ('' where nothing matched) and iz its z-row; z, k and delta_squared are those of the matching point
+    (k is the query k for interpolated limits). distance is only set by nearest queries.
+    """
+    dataset: np.ndarray
+    iz: np.ndarray
+    z: np.ndarray
+    k: np.ndarray
+    delta_squared: np.ndarray
+    distance: np.ndarray
+
+    @property
+    def found(self) -> np.ndarray:
+        return self.dataset != ''
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame({field: getattr(self, field) for field in ['dataset', 'iz', 'z', 'k', 'delta_squared', 'distance']})
+
+def _query_points(z, k) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Query arrays as float (z, log10 k) and the mask of the queries that can match anything
+    z, k = np.broadcast_arrays(np.asarray(z, dtype=float), np.asarray(k, dtype=float))
+    z, k = z.ravel(), k.ravel()
+    ok = np.isfinite(z) & np.isfinite(k) & (k > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_k = np.log10(k)
+    return z, log_k, ok
+
+def _pair_chunks(counts: np.ndarray, max_pairs: int = MAX_PAIRS):
+    # Slices of consecutive queries whose counts sum to at most max_pairs (or a single query if it alone is larger)
+    cumulative = np.concatenate([[0], np.cumsum(counts)])
+    start = 0
+    while start < len(counts):
+        stop = max(np.searchsorted(cumulative, cumulative[start] + max_pairs, side='right') - 1, start + 1)
+        yield slice(start, stop)
+        start = stop
+
+@attrs.define(eq=False)
+class LimitIndex:
+    """
+    Every positive, finite limit of a list of datasets, indexed in (z, log10 k) for vectorized batch queries.
+    Points are stored as rows (the z-rows of the datasets) sorted by z, each sorted by log k. A query
+    first bounds the rows by z with a binary search, then binary searches log k within each candidate row.
+    """
+    names: list # dataset identifier of each dataset position
+    row_z: np.ndarray # z of each row, sorted
+    row_dataset: np.ndarray # dataset position of each row
+    row_iz: np.ndarray # z-row within its dataset of each row
+    row_offsets: np.ndarray # row i spans points row_offsets[i]:row_offsets[i+1]
+    log_k: np.ndarray
+    delta_squared: np.ndarray
+    version: int = None # catalog version the index was built from
+    errors: dict = attrs.field(factory=dict) # datasets that failed to load, by name
+    _key: np.ndarray = attrs.field(default=None, init=False, repr=False)
+    _stride: float = attrs.field(default=None, init=False, repr=False)
+    _log_k_min: float = attrs.field(default=None, init=False, repr=False)
+    _rank: np.ndarray = attrs.field(default=None, init=False, repr=False)
+    _by_rank: np.ndarray = attrs.field(default=None, init=False, repr=False)
+
+    def __attrs_post_init__(self):
+        # One sorted search key over all points: row * stride + log k, with a margin between rows
+        # so that clipped queries never cross into a neighbouring row
+        n_rows = len(self.row_z)
+        self._log_k_min = float(self.log_k.min()) if len(self.log_k) else 0.0
+        self._stride = (float(self.log_k.max()) - self._log_k_min if len(self.log_k) else 0.0) + 2.0
+        point_row = np.repeat(np.arange(n_rows), np.diff(self.row_offsets))
+        self._key = point_row * self._stride + (self.log_k - self._log_k_min)
+        self._by_rank = np.argsort(self.delta_squared, kind='stable')
+        self._rank = np.empty(len(self._by_rank), dtype=np.int64)
+        self._rank[self._by_rank] = np.arange(len(self._by_rank))
+
+    @classmethod
+    @eor_limits.timed('limit_index')
+    def build(cls, datasets: list[eor_limits.DataSet], names: list[str] = None, **kwargs) -> 'LimitIndex':
+        """
+        Index the given datasets, identified by names (default: the dataset keys, e.g. 'HERA2023').
+        """
+        datasets = list(datasets)
+        names = [d.key for d in datasets] if names is None else list(names)
+        if len(names) != len(datasets):
+            raise ValueError("names must have the same length as datasets.")
+        raggeds = [d.ragged for d in datasets]
+        n_rows = np.array([r.n_z for r in raggeds], dtype=np.int64)
+        row_offset = np.concatenate([[0], np.cumsum(n_rows)])
+        def concat(arrays, dtype=float):
+            return np.concatenate(arrays) if arrays else np.zeros(0, dtype=dtype)
+        z = concat([r.z for r in raggeds])
+        k = concat([r.k for r in raggeds])
+        delta_squared = concat([r.delta_squared for r in raggeds])
+        point_row = concat([r.point_z_index() + offset for r, offset in zip(raggeds, row_offset)], dtype=np.int64)
+
+        # Keep the finite positive limits on rows with a finite z, sorted by (row z, row, log k)
+        ok = np.isfinite(k) & (k > 0) & np.isfinite(delta_squared) & (delta_squared > 0) & np.isfinite(z[point_row])
+        log_k, delta_squared, point_row = np.log10(k[ok]), delta_squared[ok], point_row[ok]
+        order = np.lexsort((log_k, point_row, z[point_row]))
+        log_k, delta_squared, point_row = log_k[order], delta_squared[order], point_row[order]
+        starts = np.flatnonzero(np.r_[True, point_row[1:] != point_row[:-1]]) if len(point_row) else np.zeros(0, dtype=np.int64)
+        rows = point_row[starts]
+        return cls(
+            names=names,
+            row_z=z[rows],
+            row_dataset=np.repeat(np.arange(len(datasets)), n_rows)[rows],
+            row_iz=(np.arange(len(z)) - np.repeat(row_offset[:-1], n_rows))[rows],
+            row_offsets=np.append(starts, len(point_row)).astype(np.int64),
+            log_k=log_k,
+            delta_squared=delta_squared,
+            **kwargs
+            )
+
+    @classmethod
+    def from_catalog(cls, catalog: eor_limits.DatasetCatalog, reducer: str = None, workers: int | None = None,
+                     executor: str = 'process') -> 'LimitIndex':
+        """
+        Index every dataset of a catalog (optionally reduced, e.g. 'lowest'), identified by catalog name.
+        Datasets that fail to load are left out and listed in errors.
+        """
+        version = catalog.version
+        errors = catalog.load(reducer=reducer, workers=workers, executor=executor)
+        names = [name for name in catalog.names() if name not in errors]
+        return cls.build([catalog.get(name, reducer) for name in names], names, version=version, errors=errors)
+
+    def __len__(self) -> int:
+        return len(self.log_k)
+
+    def _row_window(self, z: np.ndarray, z_tol) -> tuple[np.ndarray, np.ndarray]:
+        # Range of rows within z_tol of each query (empty for a negative z_tol)
+        lo = np.searchsorted(self.row_z, z - z_tol, side='left')
+        return lo, np.maximum(lo, np.searchsorted(self.row_z, z + z_tol, side='right'))
+
+    def _search(self, rows: np.ndarray, log_k: np.ndarray, side: str = 'left') -> np.ndarray:
+        # Position of log_k among the points of each row, as a global point index
+        offset = np.clip(log_k - self._log_k_min, -0.5, self._stride - 1.5)
+        return np.searchsorted(self._key, rows * self._stride + offset, side=side)
+
+    def _nearest_in_rows(self, rows: np.ndarray, log_k: np.ndarray) -> np.ndarray:
+        # Point of each (non-empty) row closest in log k
+        position = self._search(rows, log_k)
+        below = np.maximum(position - 1, self.row_offsets[rows])
+        above = np.minimum(position, self.row_offsets[rows + 1] - 1)
+        return np.where(np.abs(self.log_k[below] - log_k) <= np.abs(self.log_k[above] - log_k), below, above)
+
+    def _pairs(self, lo: np.ndarray, hi: np.ndarray, queries: np.ndarray):
+        # Chunks of (query, row) pairs for the row range [lo, hi) of each query
+        counts = hi - lo
+        for chunk in _pair_chunks(counts):
+            q = np.repeat(queries[chunk], counts[chunk])
+            starts = np.repeat(lo[chunk] - np.cumsum(counts[chunk]) + counts[chunk], counts[chunk])
+            yield q, starts + np.arange(len(q))
+
+    def _result(self, n: int, queries: np.ndarray, points: np.ndarray, rows: np.ndarray,
+                k: np.ndarray = None, delta_squared: np.ndarray = None, distance: np.ndarray = None) -> QueryResult:
+        result = QueryResult(dataset=np.full(n, '', dtype=object), iz=np.full(n, -1, dtype=np.int64),
+                             z=np.full(n, np.nan), k=np.full(n, np.nan), delta_squared=np.full(n, np.nan),
+                             distance=np.full(n, np.nan))
+        result.dataset[queries] = np.array(self.names, dtype=object)[self.row_dataset[rows]]
+        result.iz[queries] = self.row_iz[rows]
+        result.z[queries] = self.row_z[rows]
+        result.k[queries] = 10**self.log_k[points] if k is None else k
+        result.delta_squared[queries] = self.delta_squared[points] if delta_squared is None else delta_squared
+        if distance is not None:
+            result.distance[queries] = distance
+        result.dataset = result.dataset.astype(str)
+        return result
+
+    def _point_rows(self, points: np.ndarray) -> np.ndarray:
+        return np.searchsorted(self.row_offsets, points, side='right') - 1
+
+    def nearest(self, z, k, z_scale: float = 1.0, log_k_scale: float = 1.0, max_distance: float = np.inf) -> QueryResult:
+        """
+        Closest limit to each (z, k) point, with the distance sqrt((dz/z_scale)^2 + (dlog10k/log_k_scale)^2).
+        Points further than max_distance from every limit get no match.
+        """
+        z, log_k, ok = _query_points(z, k)
+        queries = np.flatnonzero(ok) if len(self) else np.zeros(0, dtype=np.int64)
+        zq, lq = z[queries], log_k[queries]
+        def distance(rows, points, zq, lq):
+            return np.hypot((self.row_z[rows] - zq) / z_scale, (self.log_k[points] - lq) / log_k_scale)
+
+        # Candidate from the row closest in z, whose distance bounds the rows worth searching
+        i = np.searchsorted(self.row_z, zq)
+        below, above = np.maximum(i - 1, 0), np.minimum(i, len(self.row_z) - 1)
+        rows = np.where(np.abs(self.row_z[below] - zq) <= np.abs(self.row_z[above] - zq), below, above)
+        best_point = self._nearest_in_rows(rows, lq)
+        best = distance(rows, best_point, zq, lq)
+
+        # Closest point over all rows within that bound
+        lo, hi = self._row_window(zq, np.minimum(best, max_distance) * z_scale)
+        for q, rows in self._pairs(lo, hi, np.arange(len(queries))):
+            points = self._nearest_in_rows(rows, lq[q])
+            d = distance(rows, points, zq[q], lq[q])
+            order = np.lexsort((d, q))
+            first = order[np.r_[True, q[order][1:] != q[order][:-1]]] if len(q) else order
+            better = d[first] < best[q[first]]
+            best[q[first][better]], best_point[q[first][better]] = d[first][better], points[first][better]
+        found = best <= max_distance
+        return self._result(len(z), queries[found], best_point[found], self._point_rows(best_point[found]),
+                            distance=best[found])
+
+    def lowest(self, z, k, z_tol: float = DEFAULT_Z_TOL, log_k_tol: float = DEFAULT_LOG_K_TOL) -> QueryResult:
+        """
+        Lowest limit within the box |dz| <= z_tol, |dlog10k| <= log_k_tol around each (z, k) point.
+        """
+        z, log_k, ok = _query_points(z, k)
+        queries = np.flatnonzero(ok)
+        zq, lq = z[queries], log_k[queries]
+        best = np.full(len(queries), len(self), dtype=np.int64) # lowest rank found, len(self) if none
+        ranks = np.append(self._rank, len(self))
+        lo, hi = self._row_window(zq, z_tol)
+        for q, rows in self._pairs(lo, hi, np.arange(len(queries))):
+            starts, stops = self._search(rows, lq[q] - log_k_tol, 'left'), self._search(rows, lq[q] + log_k_tol, 'right')
+            nonempty = starts < stops
+            if not nonempty.any():
+                continue
+            q, starts, stops = q[nonempty], starts[nonempty], stops[nonempty]
+            # Minimum rank over each point range; reduceat also reduces the gaps between ranges, which are skipped
+            lowest = np.minimum.reduceat(ranks, np.stack([starts, stops], axis=1).ravel())[::2]
+            np.minimum.at(best, q, lowest)
+        found = best < len(self)
+        points = self._by_rank[best[found]]
+        return self._result(len(z), queries[found], points, self._point_rows(points))
+
+    def interpolate(self, z, k, z_tol: float = DEFAULT_Z_TOL) -> QueryResult:
+        """
+        Lowest limit at each k among the rows within z_tol of z, interpolating every row linearly in
+        (log10 k, log10 delta_squared) between its neighbouring points. Rows are not extrapolated.
+        """
+        z, log_k, ok = _query_points(z, k)
+        queries = np.flatnonzero(ok)
+        zq, lq = z[queries], log_k[queries]
+        best = np.full(len(queries), np.inf)
+        best_row = np.zeros(len(queries), dtype=np.int64)
+        log_delta_squared = np.log10(self.delta_squared)
+        lo, hi = self._row_window(zq, z_tol)
+        for q, rows in self._pairs(lo, hi, np.arange(len(queries))):
+            above = self._search(rows, lq[q])
+            exact = (above < self.row_offsets[rows + 1]) & (self.log_k[np.minimum(above, len(self) - 1)] == lq[q])
+            inside = exact | ((above > self.row_offsets[rows]) & (above < self.row_offsets[rows + 1]))
+            q, rows, above, exact = q[inside], rows[inside], above[inside], exact[inside]
+            below = np.where(exact, above, above - 1)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                t = np.where(exact, 0.0, (lq[q] - self.log_k[below]) / (self.log_k[above] - self.log_k[below]))
+            value = log_delta_squared[below] + t * (log_delta_squared[above] - log_delta_squared[below])
+            order = np.lexsort((value, q))
+            first = order[np.r_[True, q[order][1:] != q[order][:-1]]] if len(q) else order
+            better = value[first] < best[q[first]]
+            best[q[first][better]], best_row[q[first][better]] = value[first][better], rows[first][better]
+        found = np.isfinite(best)
+        return self._result(len(z), queries[found], self.row_offsets[best_row[found]], best_row[found],
+                            k=10**lq[found], delta_squared=10**best[found])
+
+    def query(self, query_type: str, z, k, **kwargs) -> QueryResult:
+        if query_type not in QUERY_TYPES:
+            raise ValueError(f"Invalid query_type '{query_type}'. Use one of {QUERY_TYPES}.")
+        return getattr(self, query_type)(z, k, **kwargs)
+
+##################################################################
+#####                  Per-version index cache               #####
+##################################################################
+
+_indexes = weakref.WeakKeyDictionary() # catalog -> {(version, reducer): LimitIndex}
+_indexes_lock = threading.Lock()
+
+def get_limit_index(catalog: eor_limits.DatasetCatalog, reducer: str = None, workers: int | None = None,
+                    executor: str = 'process') -> LimitIndex:
+    """
+    The LimitIndex of a catalog, built once per catalog version (and reducer) and shared by all callers.
+    Call catalog.refresh() first to pick up changed data files.
+    """
+    with _indexes_lock:
+        indexes = _indexes.setdefault(catalog, {})
+        key = (catalog.version, reducer)
+        if key not in indexes:
+            index = LimitIndex.from_catalog(catalog, reducer=reducer, workers=workers, executor=executor)
+            # Indexes of older versions are dropped; the version is the one the index was built from
+            indexes.clear()
+            indexes[(index.version, reducer)] = index
+            key = (index.version, reducer)
+        return indexes[key]
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Look up the published limits at a list of (z, k) points.")
+    parser.add_argument('points', help="CSV file with 'z' and 'k' columns.")
+    parser.add_argument('--query', default='nearest', choices=QUERY_TYPES, help="Query type (default: nearest).")
+    parser.add_argument('--z-tol', type=float, default=DEFAULT_Z_TOL, help="Half-width in z of lowest/interpolate queries.")
+    parser.add_argument('--log-k-tol', type=float, default=DEFAULT_LOG_K_TOL, help="Half-width in log10 k of lowest queries.")
+    parser.add_argument('--lowest-only', action='store_true', help="Only index the lowest limit per z-bin.")
+    parser.add_argument('--data-dir', default=eor_limits.DATA_DIR)
+    parser.add_argument('--output', default=None, help="CSV output path (default: print to stdout).")
+    args = parser.parse_args()
+
+    points = pd.read_csv(args.points)
+    index = get_limit_index(eor_limits.DatasetCatalog(args.data_dir), reducer='lowest' if args.lowest_only else None)
+    for name, error in index.errors.items():
+        print(f"{name}: skipped, {error}", file=sys.stderr)
+    kwargs = {'nearest': {}, 'lowest': {'z_tol': args.z_tol, 'log_k_tol': args.log_k_tol},
+              'interpolate': {'z_tol': args.z_tol}}[args.query]
+    result = index.query(args.query, points['z'], points['k'], **kwargs).to_frame()
+    result.insert(0, 'query_k', points['k'].to_numpy())
+    result.insert(0, 'query_z', points['z'].to_numpy())
+    result.to_csv(args.output if args.output else sys.stdout, index=False)
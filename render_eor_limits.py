@@ -0,0 +1,247 @@
+import os
+import sys
+import numpy as np
+import yaml
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
+import plot_eor_limits
+import eor_limits
+
+##################################################################
+#####                      Figure specs                      #####
+##################################################################
+
+# A spec file (YAML or JSON) is either a list of figure specs, or a dict with 'figures' and optional
+# 'defaults' applied to every figure. Each spec has an 'output' path whose extension picks the format,
+# the options of plot_eor_limits.plot, and the keys below, e.g.
+#
+#   defaults: {x_axis_log: true, lowest_only: true}
+#   figures:
+#     - {output: hera_mwa.pdf, datasets: [HERA2023, Trott2020], z_range: [6, 9]}
+#     - {output: all_k.png, plot_type: scatter, title: All limits}
+#
+FIGURE_FORMATS = ['png', 'pdf', 'svg', 'html']
+PLOT_OPTIONS = plot_eor_limits.PLOT_OPTIONS
+SPEC_OPTIONS = {
+    'output': None,
+    'datasets': 'all',      # catalog dataset names, or 'all'
+    'lowest_only': False,   # plot only the lowest limit per z-bin
+    'title': None,
+    'size': [8, 6],         # inches for static formats, x100 pixels for HTML
+    'dpi': 200,
+    'legend': True,
+}
+
+def read_specs(path: str) -> list[dict]:
+    """
+    Read a spec file into a list of complete figure specs, with defaults applied and options checked.
+    """
+    with open(path, 'r') as file:
+        content = yaml.safe_load(file) # JSON is valid YAML
+    if isinstance(content, dict):
+        defaults, figures = content.get('defaults', {}), content.get('figures', [])
+    else:
+        defaults, figures = {}, content
+    if not isinstance(figures, list):
+        raise ValueError("Spec file must hold a list of figures, or a dict with a 'figures' list.")
+    specs = []
+    for i, figure in enumerate(figures):
+        spec = {**SPEC_OPTIONS, **defaults, **figure}
+        unknown = set(spec) - set(SPEC_OPTIONS) - set(PLOT_OPTIONS)
+        if unknown:
+            raise ValueError(f"Figure {i}: unknown options {sorted(unknown)}.")
+        if not spec['output']:
+            raise ValueError(f"Figure {i}: 'output' is missing.")
+        if _format(spec['output']) not in FIGURE_FORMATS:
+            raise ValueError(f"Figure {i}: unsupported format of '{spec['output']}'. Use one of {FIGURE_FORMATS}.")
+        specs.append(spec)
+    return specs
+
+def _format(output: str) -> str:
+    return os.path.splitext(output)[1].lstrip('.').lower()
+
+def _dataset_keys(spec: dict, names: list[str]) -> list[tuple]:
+    # (name, reducer) of each dataset of a figure, as used by DatasetCatalog.get
+    selected = names if spec['datasets'] == 'all' else spec['datasets']
+    reducer = 'lowest' if spec['lowest_only'] else None
+    return [(name, reducer) for name in selected]
+
+##################################################################
+#####              Plotly to matplotlib conversion           #####
+##################################################################
+
+_SYMBOLS = {'circle': 'o', 'square': 's', 'diamond': 'D', 'cross': 'P', 'x': 'x', 'star': '*',
+            'triangle-up': '^', 'triangle-down': 'v', 'triangle-left': '<', 'triangle-right': '>',
+            'pentagon': 'p', 'hexagon': 'h'}
+_DASHES = {'solid': '-', 'dash': '--', 'dot': ':', 'dashdot': '-.', 'longdash': '--'}
+_SHAPES = {'hv': 'steps-post', 'vh': 'steps-pre', 'hvh': 'steps-mid'}
+
+def _mpl_color(color):
+    # Plotly 'rgb(r, g, b)' / 'rgba(r, g, b, a)' strings to matplotlib tuples, other colours as they are
+    if isinstance(color, str) and color.startswith('rgb'):
+        values = [float(v) for v in color[color.index('(')+1:color.index(')')].split(',')]
+        return tuple([v / 255 for v in values[:3]] + values[3:])
+    return color
+
+def _marker_colors(marker):
+    # A single colour, or one colour per point when the colours index into a colorscale
+    color = marker.color
+    if color is None or isinstance(color, str):
+        return _mpl_color(color)
+    values = np.asarray(color, dtype=np.float64)
+    positions = np.array([float(position) for position, _ in marker.colorscale])
+    colors = [_mpl_color(c) for _, c in marker.colorscale]
+    cmin = marker.cmin if marker.cmin is not None else np.nanmin(values)
+    cmax = marker.cmax if marker.cmax is not None else np.nanmax(values)
+    scaled = (values - cmin) / (cmax - cmin) if cmax > cmin else np.zeros_like(values)
+    nearest = np.abs(scaled[:, None] - positions[None, :]).argmin(axis=1)
+    return [matplotlib.colors.to_rgba(colors[i]) for i in nearest]
+
+def _float_array(values) -> np.ndarray:
+    return np.asarray(values if values is not None else [], dtype=np.float64)
+
+def _draw_scatter(ax, trace) -> None:
+    x, y = _float_array(trace.x), _float_array(trace.y)
+    mode = trace.mode or 'lines+markers'
+    line_color = _mpl_color(trace.line.color)
+    marker_colors = _marker_colors(trace.marker) if trace.marker.color is not None else line_color
+    label = trace.name if trace.showlegend is not False else None
+    marker = _SYMBOLS.get(str(trace.marker.symbol).replace('-open', ''), 'o')
+    marker_size = 0.75 * (trace.marker.size if isinstance(trace.marker.size, (int, float)) else 6)
+
+    per_point = isinstance(marker_colors, list)
+    if trace.error_x is not None and trace.error_x.array is not None:
+        upper = _float_array(trace.error_x.array)
+        lower = _float_array(trace.error_x.arrayminus) if trace.error_x.arrayminus is not None else upper
+        ax.errorbar(x, y, xerr=np.abs([lower, upper]), fmt='none', ecolor=line_color if per_point else marker_colors, elinewidth=0.8)
+
+    plot_kwargs = dict(linestyle=_DASHES.get(trace.line.dash, '-'), drawstyle=_SHAPES.get(trace.line.shape, 'default'),
+                       linewidth=trace.line.width or 1.5)
+    if 'lines' in mode and 'markers' in mode and not per_point:
+        ax.plot(x, y, color=line_color, marker=marker, markersize=marker_size, markerfacecolor=marker_colors,
+                markeredgecolor=marker_colors, label=label, **plot_kwargs)
+        return
+    if 'lines' in mode:
+        ax.plot(x, y, color=line_color, label=label, **plot_kwargs)
+        label = None
+    if 'markers' in mode:
+        ax.scatter(x, y, c=marker_colors if per_point else [marker_colors], marker=marker, s=marker_size**2, label=label)
+
+def _draw_heatmap(fig, ax, trace) -> None:
+    x, y = _float_array(trace.x), _float_array(trace.y)
+    z = np.ma.masked_invalid(np.asarray(trace.z, dtype=np.float64))
+    colorscale = trace.colorscale
+    cmap = 'viridis'
+    if isinstance(colorscale, str) and colorscale.lower() in plt.colormaps():
+        cmap = colorscale.lower()
+    mesh = ax.pcolormesh(x, y, z, shading='nearest', cmap=cmap)
+    fig.colorbar(mesh, ax=ax, label=trace.colorbar.title.text if trace.colorbar.title else None)
+
+def to_matplotlib(fig, size=(8, 6), dpi: int = 200, title: str = None, legend: bool = True):
+    """
+    Redraw a figure made by plot_eor_limits.plot with matplotlib: scatter traces (lines, markers,
+    per-point marker colours and x error bars), heatmaps, axis types and titles.
+    """
+    mpl_fig, ax = plt.subplots(figsize=tuple(size), dpi=dpi)
+    for trace in fig.data:
+        if trace.type == 'heatmap':
+            _draw_heatmap(mpl_fig, ax, trace)
+        elif trace.type in ['scatter', 'scattergl']:
+            _draw_scatter(ax, trace)
+    layout = fig.layout
+    ax.set_xscale('log' if layout.xaxis.type == 'log' else 'linear')
+    ax.set_yscale('log' if layout.yaxis.type == 'log' else 'linear')
+    ax.set_xlabel(layout.xaxis.title.text or '')
+    ax.set_ylabel(layout.yaxis.title.text or '')
+    if title:
+        ax.set_title(title)
+    handles, labels = ax.get_legend_handles_labels()
+    if legend and handles:
+        ax.legend(handles, labels, fontsize='x-small', loc='center left', bbox_to_anchor=(1.02, 0.5),
+                  ncol=1 + len(handles) // 40, frameon=False)
+    return mpl_fig
+
+##################################################################
+#####                      Batch renderer                    #####
+##################################################################
+
+def render_figure(spec: dict, datasets: dict, names: list[str], output_dir: str = '.') -> str:
+    """
+    Render one figure spec, with datasets looked up in a {(name, reducer): DataSet} dict.
+    Returns the path written.
+    """
+    figure_datasets = []
+    for key in _dataset_keys(spec, names):
+        if key not in datasets:
+            raise ValueError(f"Dataset '{key[0]}' could not be loaded.")
+        figure_datasets.append(datasets[key])
+    plot_options = {option: spec[option] for option in PLOT_OPTIONS if option in spec}
+    plot_options['plot_kwargs_dict'] = dict(plot_options.get('plot_kwargs_dict') or {})
+    fig = plot_eor_limits.plot(figure_datasets, **plot_options)
+
+    path = os.path.join(output_dir, spec['output'])
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if _format(path) == 'html':
+        width, height = spec['size']
+        fig.update_layout(title=spec['title'], width=int(100*width), height=int(100*height))
+        fig.write_html(path)
+    else:
+        mpl_fig = to_matplotlib(fig, size=spec['size'], dpi=spec['dpi'], title=spec['title'], legend=spec['legend'])
+        mpl_fig.savefig(path, bbox_inches='tight')
+        plt.close(mpl_fig)
+    return path
+
+# Set in every worker process by the pool initializer, so the datasets are sent once per worker
+_worker_state = {}
+
+def _init_worker(datasets: dict, names: list[str], output_dir: str) -> None:
+    _worker_state.update(datasets=datasets, names=names, output_dir=output_dir)
+
+def _render_safe(spec: dict) -> tuple[str, Exception | None]:
+    try:
+        return render_figure(spec, **_worker_state), None
+    except Exception as e:
+        return spec['output'], e
+
+def render_batch(specs: list[dict], workers: int | None = None, output_dir: str = '.',
+                 data_dir: str = eor_limits.DATA_DIR) -> list[tuple[str, Exception | None]]:
+    """
+    Render figure specs in parallel processes. Every dataset used by any figure is loaded once,
+    up front, and shared with the workers. Returns (output path, error or None) per spec, in order.
+    """
+    catalog = eor_limits.DatasetCatalog(data_dir)
+    keys = {key for spec in specs for key in _dataset_keys(spec, catalog.names())}
+    errors = catalog.load([name for name, _ in keys if name in catalog], workers=workers)
+    datasets = {}
+    for name, reducer in keys:
+        if name in catalog and name not in errors:
+            datasets[(name, reducer)] = catalog.get(name, reducer)
+
+    _init_worker(datasets, catalog.names(), output_dir)
+    if workers == 1 or len(specs) <= 1:
+        return [_render_safe(spec) for spec in specs]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(datasets, catalog.names(), output_dir)) as pool:
+        return list(pool.map(_render_safe, specs))
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Render a batch of EoR limit figures from a YAML/JSON spec file.")
+    parser.add_argument('specs', help="YAML or JSON file with the figure specs.")
+    parser.add_argument('--output-dir', default='.', help="Directory the spec output paths are relative to.")
+    parser.add_argument('--workers', type=int, default=None, help="Number of worker processes (default: one per CPU).")
+    parser.add_argument('--data-dir', default=eor_limits.DATA_DIR, help="Directory containing the dataset YAML files.")
+    args = parser.parse_args()
+
+    specs = read_specs(args.specs)
+    n_failed = 0
+    for path, error in render_batch(specs, workers=args.workers, output_dir=args.output_dir, data_dir=args.data_dir):
+        if error is None:
+            print(f"{path}: written")
+        else:
+            n_failed += 1
+            print(f"{path}: FAILED ({error})")
+    print(f"{len(specs) - n_failed}/{len(specs)} figures rendered.")
+    sys.exit(1 if n_failed else 0)
@@ -0,0 +1,278 @@
+import sys
+import json
+import math
+import asyncio
+import hashlib
+import urllib.parse
+import yaml
+import numpy as np
+import plotly.utils
+from concurrent.futures import ThreadPoolExecutor
+import plot_eor_limits
+import eor_limits
+
+##################################################################
+#####                     Response bodies                    #####
+##################################################################
+
+# Endpoints (GET or HEAD, all returning JSON):
+#   /datasets                              catalog entries and the catalog version
+#   /datasets/<name>?lowest_only=true      header and data of one dataset
+#   /plot?datasets=HERA2023,Trott2020&plot_type=scatter&z_range=[6,10]
+#                                          Plotly figure of plot_eor_limits.plot; option values are
+#                                          YAML/JSON, datasets is 'all' (default) or a comma-separated list
+#
+RESPONSE_CACHE_SIZE = 256
+# Seconds between polls of the data directory for changed files
+CATALOG_REFRESH_INTERVAL = 10
+
+def _json_safe(value):
+    # Arrays and floats with NaN/inf replaced by null, which plain JSON lacks
+    if isinstance(value, np.ndarray):
+        value = value.tolist()
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _json_safe(v) for k, v in value.items()}
+    return value
+
+def _json_bytes(obj) -> bytes:
+    return json.dumps(obj, separators=(',', ':'), allow_nan=False).encode()
+
+def _parse_option(value: str):
+    try:
+        return yaml.safe_load(value) # JSON is valid YAML
+    except yaml.YAMLError:
+        raise ValueError(f"Invalid option value '{value}'.")
+
+def _parse_bool(params: dict, name: str) -> bool:
+    value = _parse_option(params.get(name, 'false'))
+    if not isinstance(value, bool):
+        raise ValueError(f"Invalid {name} '{params[name]}'. Use true or false.")
+    return value
+
+# Accepted values of each plot option, checked before plotting so that bad requests get a 400
+PLOT_TYPES = ['line', 'scatter'] + plot_eor_limits.ENVELOPE_PLOT_TYPES
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _is_range(value) -> bool:
+    return value is None or (isinstance(value, list) and len(value) == 2 and all(_is_number(v) for v in value)
+                             and value[0] <= value[1])
+
+def _is_plot_kwargs(value) -> bool:
+    try:
+        plot_eor_limits._check_plot_kwargs(value)
+    except ValueError:
+        return False
+    return True
+
+def _is_edges(value) -> bool:
+    return isinstance(value, list) and len(value) >= 2 and all(_is_number(v) for v in value) \
+           and all(a < b for a, b in zip(value[:-1], value[1:]))
+
+_PLOT_OPTION_CHECKS = {
+    'plot_type': (lambda v: v in PLOT_TYPES, f"one of {PLOT_TYPES}"),
+    'x_axis': (lambda v: v in ['k', 'z'], "one of ['k', 'z']"),
+    'x_axis_log': (lambda v: isinstance(v, bool), "true or false"),
+    'x_axis_errors': (lambda v: isinstance(v, bool), "true or false"),
+    'y_axis': (lambda v: v in ['delta_sq', 'power'], "one of ['delta_sq', 'power']"),
+    'z_range': (_is_range, "null or [min, max]"),
+    'k_range': (_is_range, "null or [min, max]"),
+    'year_range': (_is_range, "null or [min, max]"),
+    'plot_kwargs_dict': (lambda v: v is None or _is_plot_kwargs(v),
+                         "null or a mapping of dataset keys to dicts of Plotly properties (marker and line as dicts)"),
+    'envelope_bins': (lambda v: v is None or (isinstance(v, list) and len(v) == 2 and all(_is_edges(e) for e in v)),
+                      "null or [z_edges, log_k_edges] of increasing numbers"),
+    'render_mode': (lambda v: v in plot_eor_limits.RENDER_MODES, f"one of {plot_eor_limits.RENDER_MODES}"),
+    'max_points': (lambda v: v is None or (isinstance(v, int) and not isinstance(v, bool) and v >= 1),
+                   "null or a positive integer"),
+}
+
+def _plot_options(params: dict) -> dict:
+    options = {}
+    for option in plot_eor_limits.PLOT_OPTIONS:
+        if option in params:
+            value = _parse_option(params[option])
+            check, accepted = _PLOT_OPTION_CHECKS[option]
+            if not check(value):
+                raise ValueError(f"Invalid {option} '{params[option]}'. Use {accepted}.")
+            options[option] = value
+    return options
+
+def datasets_body(catalog: eor_limits.DatasetCatalog, params: dict) -> bytes:
+    return _json_bytes({
+        'version': catalog.version,
+        'datasets': [dict(name=entry.name, key=entry.key, telescope=entry.telescope, author=entry.author,
+                          year=entry.year, doi=entry.doi, notes=entry.notes) for entry in catalog.entries()],
+    })
+
+def dataset_body(catalog: eor_limits.DatasetCatalog, name: str, params: dict) -> bytes:
+    dataset = catalog.get(name, 'lowest' if _parse_bool(params, 'lowest_only') else None)
+    return _json_bytes({
+        'name': name,
+        'key': dataset.key,
+        'telescope': dataset.telescope,
+        'author': dataset.author,
+        'year': dataset.year,
+        'doi': dataset.doi,
+        'notes': dataset.notes,
+        'data': _json_safe(dataset.ragged.to_dict()),
+    })
+
+def plot_body(catalog: eor_limits.DatasetCatalog, params: dict) -> bytes:
+    unknown = set(params) - set(plot_eor_limits.PLOT_OPTIONS) - {'datasets', 'lowest_only'}
+    if unknown:
+        raise ValueError(f"Unknown options {sorted(unknown)}. Use datasets, lowest_only or one of {plot_eor_limits.PLOT_OPTIONS}.")
+    names = params.get('datasets', 'all')
+    names = catalog.names() if names == 'all' else [name for name in names.split(',') if name]
+    reducer = 'lowest' if _parse_bool(params, 'lowest_only') else None
+    options = _plot_options(params)
+    # Threads, as this already runs in the service's thread pool
+    errors = catalog.load(names, reducer=reducer, executor='thread')
+    if errors:
+        raise ValueError("; ".join(f"Dataset '{name}' could not be loaded: {error}" for name, error in errors.items()))
+    options['plot_kwargs_dict'] = dict(options.get('plot_kwargs_dict') or {})
+    index = catalog.index(reducer, executor='thread') # shared by every plot of this catalog version
+    fig = plot_eor_limits.plot([catalog.get(name, reducer) for name in names], index=index, **options)
+    return json.dumps(fig.to_plotly_json(), cls=plotly.utils.PlotlyJSONEncoder, separators=(',', ':')).encode()
+
+##################################################################
+#####                      HTTP service                      #####
+##################################################################
+
+_REASONS = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+            500: 'Internal Server Error'}
+
+class NotFound(ValueError):
+    pass
+
+class LimitsService:
+    """
+    Read-only JSON HTTP service over a DatasetCatalog, on asyncio streams. Bodies are built in a
+    thread pool and cached by (catalog version, path, query parameters) with a content-hash ETag, so
+    unchanged resources are answered with 304 Not Modified. Concurrent requests for the same
+    uncached resource share one build.
+    """
+
+    def __init__(self, catalog: eor_limits.DatasetCatalog = None, workers: int | None = None,
+                 cache_size: int = RESPONSE_CACHE_SIZE, refresh_interval: float = CATALOG_REFRESH_INTERVAL):
+        self.catalog = eor_limits.DatasetCatalog() if catalog is None else catalog
+        self.refresh_interval = refresh_interval
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._cache = eor_limits.LRUCache(maxsize=cache_size) # key -> (etag, body)
+        self._in_flight = {} # key -> future of (etag, body)
+
+    def _build(self, path: str, params: dict) -> bytes:
+        parts = path.strip('/').split('/')
+        if parts == ['datasets']:
+            return datasets_body(self.catalog, params)
+        if len(parts) == 2 and parts[0] == 'datasets':
+            name = urllib.parse.unquote(parts[1])
+            if name not in self.catalog:
+                raise NotFound(f"Dataset '{name}' not found.")
+            return dataset_body(self.catalog, name, params)
+        if parts == ['plot']:
+            return plot_body(self.catalog, params)
+        raise NotFound(f"No resource at '{path}'.")
+
+    def _refresh(self) -> None:
+        change = self.catalog.refresh(min_interval=self.refresh_interval)
+        if change:
+            plot_eor_limits.discard_traces(change.stale_fingerprints)
+
+    async def _response(self, path: str, params: dict) -> tuple[str, bytes]:
+        # (etag, body), from the cache, from a build already in flight, or built now
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._refresh)
+        key = (self.catalog.version, path, tuple(sorted(params.items())))
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+        if key not in self._in_flight:
+            async def build():
+                try:
+                    with eor_limits.span('serve_build', path=path):
+                        body = await loop.run_in_executor(self._executor, self._build, path, params)
+                    response = (f'"{hashlib.sha1(body).hexdigest()}"', body)
+                    self._cache.put(key, response)
+                    return response
+                finally:
+                    del self._in_flight[key]
+            self._in_flight[key] = asyncio.ensure_future(build())
+        return await asyncio.shield(self._in_flight[key])
+
+    async def handle(self, method: str, target: str, headers: dict) -> tuple[int, dict, bytes]:
+        """
+        Answer one request: returns (status, response headers, body). headers have lower-case names.
+        """
+        if method not in ['GET', 'HEAD']:
+            return 405, {'Allow': 'GET, HEAD'}, _json_bytes({'error': f"Method {method} not allowed."})
+        url = urllib.parse.urlsplit(target)
+        params = dict(urllib.parse.parse_qsl(url.query, keep_blank_values=True))
+        try:
+            etag, body = await self._response(url.path, params)
+        except NotFound as e:
+            return 404, {}, _json_bytes({'error': str(e)})
+        except ValueError as e:
+            return 400, {}, _json_bytes({'error': str(e)})
+        except Exception as e:
+            return 500, {}, _json_bytes({'error': f"{type(e).__name__}: {e}"})
+        response_headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+        if etag in [tag.strip() for tag in headers.get('if-none-match', '').split(',')]:
+            return 304, response_headers, b''
+        return 200, response_headers, body
+
+    async def _client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # HTTP/1.1 with keep-alive; request bodies are not used and are skipped
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, version = request_line.decode('latin-1').split()
+                headers = {}
+                while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                if int(headers.get('content-length', 0)):
+                    await reader.readexactly(int(headers['content-length']))
+                status, response_headers, body = await self.handle(method, target, headers)
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                head = [f'HTTP/1.1 {status} {_REASONS[status]}', 'Content-Type: application/json',
+                        f'Content-Length: {len(body)}', f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+                head += [f'{name}: {value}' for name, value in response_headers.items()]
+                writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + (body if method != 'HEAD' else b''))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ValueError, ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 8000) -> asyncio.Server:
+        return await asyncio.start_server(self._client, host, port)
+
+async def _main(host: str, port: int, data_dir: str, workers: int | None) -> None:
+    service = LimitsService(eor_limits.DatasetCatalog(data_dir), workers=workers)
+    server = await service.serve(host, port)
+    print(f"Serving {len(service.catalog)} datasets on http://{host}:{port}", file=sys.stderr)
+    async with server:
+        await server.serve_forever()
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Serve the catalog and plot figures as JSON over HTTP.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--data-dir', default=eor_limits.DATA_DIR)
+    parser.add_argument('--workers', type=int, default=None, help="Threads building responses.")
+    args = parser.parse_args()
+    try:
+        asyncio.run(_main(args.host, args.port, args.data_dir, args.workers))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,27 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+# The modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import eor_limits
+
+def make_dataset(z, k, delta_squared=None, author='Test', year=2020, **fields):
+    # DataSet from per-row k (and delta_squared, default 1) lists; fields are passed to RaggedData as they are
+    delta_squared = [[1.0]*len(row) for row in k] if delta_squared is None else delta_squared
+    flat = lambda rows: np.array([v for row in rows for v in row], dtype=float)
+    ragged = eor_limits.RaggedData(z=z, offsets=np.concatenate([[0], np.cumsum([len(row) for row in k])]),
+                                   k=flat(k), delta_squared=flat(delta_squared), **fields)
+    return eor_limits.DataSet(telescope='Test', author=author, year=year, data=ragged)
+
+def write_yaml(data_dir, name, z, k, delta_squared, year=2020):
+    rows = lambda rows: '[' + ', '.join('[' + ', '.join(str(v) for v in row) + ']' for row in rows) + ']'
+    with open(os.path.join(data_dir, name + '.yaml'), 'w') as file:
+        file.write(f"telescope: Test\nauthor: {name[:-4]}\nyear: {year}\ndata:\n"
+                   f"  z: {list(z)}\n  k: {rows(k)}\n  delta_squared: {rows(delta_squared)}\n")
+
+@pytest.fixture
+def data_dir(tmp_path):
+    write_yaml(tmp_path, 'Good2020', [8, 9], [[0.1, 0.2], [0.1, 0.3, 0.5]], [[10, 20], [30, 40, 50]])
+    return str(tmp_path)
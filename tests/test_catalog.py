@@ -0,0 +1,65 @@
+import os
+import numpy as np
+import pytest
+import eor_limits
+from conftest import write_yaml
+
+def touch(path):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+def test_refresh_ignores_touched_files(data_dir):
+    catalog = eor_limits.DatasetCatalog(data_dir)
+    dataset = catalog.get('Good2020')
+    touch(os.path.join(data_dir, 'Good2020.yaml'))
+    assert not catalog.refresh()
+    assert catalog.get('Good2020') is dataset and catalog.version == 0
+
+def test_refresh_picks_up_edits(data_dir):
+    catalog = eor_limits.DatasetCatalog(data_dir)
+    dataset = catalog.get('Good2020')
+    write_yaml(data_dir, 'Good2020', [8], [[0.1]], [[5]], year=2021)
+    write_yaml(data_dir, 'New2022', [9], [[0.2]], [[6]])
+    change = catalog.refresh()
+    assert change.changed == ['Good2020'] and change.added == ['New2022']
+    assert change.stale_fingerprints == [dataset.fingerprint]
+    assert catalog.entry('Good2020').year == 2021 and catalog.get('Good2020').ragged.n_z == 1
+
+def test_cache_writes_are_batched(data_dir, monkeypatch):
+    for i in range(3):
+        write_yaml(data_dir, f'More{2021 + i}', [8], [[0.1]], [[1]])
+    cache = eor_limits._CatalogCache(data_dir)
+    writes = []
+    write = cache._write
+    monkeypatch.setattr(cache, '_write', lambda: writes.append(1) or write())
+    for name in ['Good2020', 'More2021', 'More2022', 'More2023']:
+        cache.get(name)
+    assert len(writes) == 1
+    cache.flush()
+    assert len(writes) == 2
+    assert sorted(eor_limits._CatalogCache(data_dir).entries) == ['Good2020', 'More2021', 'More2022', 'More2023']
+
+def test_compile_skips_broken_files(data_dir):
+    with open(os.path.join(data_dir, 'Broken2021.yaml'), 'w') as file:
+        file.write("data: [")
+    n_changed, errors = eor_limits.compile_catalog(data_dir)
+    assert n_changed == 1 and list(errors) == ['Broken2021']
+    np.testing.assert_array_equal(eor_limits.load_dataset('Good2020', data_dir=data_dir).ragged.offsets, [0, 2, 5])
+
+def test_load_reports_errors_by_name(data_dir):
+    write_yaml(data_dir, 'Bad2021', [8, 9], [[0.1]], [[1]])
+    catalog = eor_limits.DatasetCatalog(data_dir)
+    errors = catalog.load(executor='thread')
+    assert list(errors) == ['Bad2021'] and catalog.is_loaded('Good2020')
+    with pytest.raises(ValueError, match="not found"):
+        catalog.get('Missing2000')
+
+def test_lru_cache():
+    cache = eor_limits.LRUCache(maxsize=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert cache.keys() == ['a', 'c'] and cache.get('b') is None
+    assert cache.pop('a') == 1 and cache.pop('a', 'gone') == 'gone'
+    assert cache.stats() == {'size': 1, 'maxsize': 2, 'hits': 1, 'misses': 1}
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+import eor_limits
+from conftest import make_dataset
+
+@pytest.fixture
+def datasets():
+    return [make_dataset([8.0, 10.0], [[0.1, 0.2, 0.4], [0.2, 0.3]], author='A', year=2015),
+            make_dataset([9.0, 12.0, 14.0], [[0.3, 0.1], [], [0.05, 0.2]], author='B', year=2020),
+            make_dataset([7.0], [[0.1, 0.2]], author='C', year=2025)]
+
+def brute_force(datasets, z_range=None, k_range=None, year_range=None, subset=None):
+    spans = []
+    for position, dataset in enumerate(datasets):
+        if (subset is not None and position not in subset) or \
+                (year_range is not None and not year_range[0] <= dataset.year <= year_range[1]):
+            continue
+        data = dataset.ragged
+        for iz in range(data.n_z):
+            row = data.row_slice(iz)
+            inside = np.ones(row.stop - row.start, dtype=bool) if k_range is None else \
+                     (data.k[row] >= k_range[0]) & (data.k[row] <= k_range[1])
+            if (z_range is None or z_range[0] <= data.z[iz] <= z_range[1]) and inside.any():
+                spans.append((position, iz, np.flatnonzero(inside) + row.start))
+    return spans
+
+@pytest.mark.parametrize('query', [
+    {}, {'k_range': (0.1, 0.2)}, {'z_range': (8.0, 12.0)}, {'year_range': (2016, 2030)},
+    {'subset': [1]}, {'subset': []}, {'subset': [0, 2], 'k_range': (0.15, 1.0)},
+    {'z_range': (9.0, 9.0), 'k_range': (0.3, 0.3)}, {'k_range': (1.0, 2.0)}])
+def test_query_matches_brute_force(datasets, query):
+    spans = eor_limits.CatalogIndex.build(datasets).query(**query)
+    expected = brute_force(datasets, **query)
+    assert [span[:2] for span in spans] == [span[:2] for span in expected]
+    for span, expected_span in zip(spans, expected):
+        np.testing.assert_array_equal(span[2], expected_span[2])
+
+def test_position(datasets):
+    index = eor_limits.CatalogIndex.build(datasets[:2])
+    assert [index.position(d) for d in datasets] == [0, 1, -1]
+
+def test_empty_index():
+    assert eor_limits.CatalogIndex.build([]).query(z_range=(5, 10), k_range=(0.1, 1)) == []
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+import eor_limits
+from conftest import make_dataset
+
+Z_EDGES = [6.0, 8.0, 10.0]
+LOG_K_EDGES = [-2.0, -1.0, 0.0]
+
+@pytest.fixture
+def datasets():
+    return [make_dataset([7.0, 9.0], [[0.05, 0.5], [0.5]], [[40.0, 30.0], [20.0]], author='A', year=2015),
+            make_dataset([7.0], [[0.5]], [[10.0]], author='B', year=2020)]
+
+def envelope(datasets, **kwargs):
+    return eor_limits.compute_envelope(datasets, z_edges=Z_EDGES, log_k_edges=LOG_K_EDGES, **kwargs)
+
+def test_lowest_limit_per_cell(datasets):
+    result = envelope(datasets)
+    np.testing.assert_array_equal(result.delta_squared, [[40.0, 10.0], [np.nan, 20.0]])
+    assert result.source_keys().tolist() == [['A2015', 'B2020'], ['', 'A2015']]
+
+def test_along(datasets):
+    values, sources = envelope(datasets).along('k')
+    np.testing.assert_array_equal(values, [40.0, 10.0])
+    np.testing.assert_array_equal(sources, [0, 1])
+    values, sources = envelope(datasets).along('z')
+    np.testing.assert_array_equal(values, [10.0, 20.0])
+
+def test_filters(datasets):
+    assert envelope(datasets, year_range=(2010, 2016)).delta_squared[0, 1] == 30.0
+    assert np.isnan(envelope(datasets, z_range=(8.5, 10.0)).delta_squared[0]).all()
+    assert np.isnan(envelope(datasets, k_range=(0.1, 1.0)).delta_squared[:, 0]).all()
+
+def test_power(datasets):
+    result = envelope(datasets, y_axis='power')
+    assert result.delta_squared[0, 1] == pytest.approx(10.0 * 2*np.pi**2 / 0.5**3)
+
+def test_bounds_spread_over_cells():
+    dataset = make_dataset([7.0], [[0.5]], [[5.0]], z_lower=[7.0], z_upper=[9.0], k_lower=[0.05], k_upper=[0.5])
+    np.testing.assert_array_equal(envelope([dataset]).delta_squared, np.full((2, 2), 5.0))
+    assert np.isnan(envelope([dataset], use_bounds=False).delta_squared).sum() == 3
+
+def test_points_outside_grid_and_no_datasets(datasets):
+    assert np.isnan(envelope([make_dataset([20.0], [[100.0]])]).delta_squared).all()
+    result = envelope([])
+    assert result.keys == [] and (result.source == -1).all()
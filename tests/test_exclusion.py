@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+import exclusion_eor_limits
+import query_eor_limits
+from conftest import make_dataset
+
+@pytest.fixture
+def index():
+    return query_eor_limits.LimitIndex.build([make_dataset([8.0], [[0.1, 0.2]], [[100.0, 10.0]]),
+                                              make_dataset([20.0], [[0.1]], [[1.0]])], names=['A', 'B'])
+
+def grid(values, z=(6.0, 10.0), k=(0.05, 0.5)):
+    values = np.broadcast_to(np.asarray(values, dtype=float)[:, None, None], (len(values), len(z), len(k)))
+    return exclusion_eor_limits.ModelGrid(values=values, z=z, k=k)
+
+@pytest.mark.parametrize('workers, chunk_size', [(1, None), (1, 1), (2, 1)])
+def test_ratios_and_worst_points(index, workers, chunk_size):
+    result = exclusion_eor_limits.compute_exclusion(grid([5.0, 50.0]), index, workers=workers, chunk_size=chunk_size)
+    np.testing.assert_allclose(result.ratio[:, 0], [0.5, 5.0])
+    np.testing.assert_allclose(result.k[:, 0], [0.2, 0.2])
+    assert result.excluded.tolist() == [False, True]
+    # B is at z=20, outside the grid
+    assert np.isnan(result.ratio[:, 1]).all() and np.isnan(result.z[:, 1]).all()
+
+def test_no_limit_inside_grid(index):
+    result = exclusion_eor_limits.compute_exclusion(grid([5.0, 50.0], z=(30.0, 40.0)), index)
+    assert np.isnan(result.ratio).all() and np.isnan(result.z).all() and np.isnan(result.k).all()
+    assert not result.excluded.any()
+    assert len(result.to_frame()) == 4
+
+def test_grid_shape_is_checked():
+    with pytest.raises(ValueError, match="values must have shape"):
+        exclusion_eor_limits.ModelGrid(values=np.zeros((1, 2, 3)), z=[6.0, 10.0], k=[0.1, 0.2])
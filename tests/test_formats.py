@@ -0,0 +1,45 @@
+import io
+import numpy as np
+import pytest
+import eor_limits
+
+@pytest.fixture
+def dataset():
+    # Two adjacent z-bins with the same z and tag, each with increasing k
+    ragged = eor_limits.RaggedData(z=[8.0, 8.0, 9.5], offsets=[0, 2, 4, 5], k=[0.1, 0.2 + 1e-9, 0.1, 0.3, 0.2],
+                                   delta_squared=[1e3, 2e3, 3e3, 4e3, 1.0/3], z_lower=[7.5, 7.5, 9.0],
+                                   z_upper=[8.5, 8.5, 10.0], k_lower=[0.05, 0.15, 0.05, 0.25, np.nan])
+    return eor_limits.DataSet(telescope='Test', author='Round', year=2024, doi='10.0/x', notes=['a note'], data=ragged)
+
+def assert_same(a, b):
+    assert (a.telescope, a.author, a.year, a.doi, a.notes) == (b.telescope, b.author, b.year, b.doi, b.notes)
+    for field in eor_limits._RAGGED_ARRAY_FIELDS:
+        np.testing.assert_array_equal(getattr(a.ragged, field), getattr(b.ragged, field), err_msg=field)
+
+@pytest.mark.parametrize('format', eor_limits.DATASET_FORMATS)
+def test_round_trip(dataset, tmp_path, format):
+    path = str(tmp_path / f'Round2024.{format}')
+    eor_limits.write_dataset(dataset, path)
+    assert_same(eor_limits.read_dataset(path, validation='strict'), dataset)
+
+def test_csv_without_z_bin_groups_consecutive_equal_z():
+    text = "# author: Old\n# year: 2020\nz,k,delta_squared,tag\n8,0.1,1,a\n8,0.2,2,a\n8,0.1,3,b\n9,0.1,4,b\n"
+    dataset = eor_limits.read_dataset(io.BytesIO(text.encode()), format='csv', validation='strict')
+    np.testing.assert_array_equal(dataset.ragged.offsets, [0, 2, 3, 4])
+    assert list(dataset.ragged.z_tags) == ['a', 'b', 'b']
+
+def test_csv_unknown_column():
+    with pytest.raises(ValueError, match="Unknown CSV columns"):
+        eor_limits.read_dataset(io.BytesIO(b"z,k,delta_squared,power\n8,0.1,1,2\n"), format='csv')
+
+@pytest.mark.parametrize('offsets', [[0, 5, 2, 3], [0, 2, 3], [1, 2, 3, 3]])
+def test_bad_offsets_are_rejected(offsets):
+    with pytest.raises(ValueError, match="offsets"):
+        eor_limits.RaggedData(z=[7.0, 8.0, 9.0], offsets=offsets, k=[0.1, 0.2, 0.3], delta_squared=[1.0, 2.0, 3.0])
+
+def test_npz_with_decreasing_offsets_is_rejected():
+    file = io.BytesIO()
+    np.savez(file, z=[7.0, 8.0, 9.0], offsets=[0, 5, 2, 3], k=[0.1, 0.2, 0.3], delta_squared=[1.0, 2.0, 3.0])
+    file.seek(0)
+    with pytest.raises(ValueError, match="never decrease"):
+        eor_limits.read_dataset(file, format='npz', validation='strict')
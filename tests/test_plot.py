@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+import eor_limits
+import plot_eor_limits
+
+@pytest.fixture
+def dataset():
+    ragged = eor_limits.RaggedData(z=[8.0, 9.0], offsets=[0, 2, 3], k=[0.2, 0.4, 0.3], delta_squared=[10.0, 20.0, 30.0],
+                                   z_lower=[7.5, 8.0], z_upper=[8.5, 10.0], k_lower=[0.1, 0.35, 0.25], k_upper=[0.5, 0.6, 0.4])
+    return eor_limits.DataSet(telescope='Test', author='Plot', year=2024, data=ragged)
+
+@pytest.mark.parametrize('render_mode', plot_eor_limits.RENDER_MODES)
+def test_k_error_bars_point_from_k_to_its_bounds(dataset, render_mode):
+    # array is the distance up to k_upper and arrayminus the distance down to k_lower
+    # (the original plot() had them swapped)
+    fig = plot_eor_limits.plot([dataset], x_axis_errors=True, render_mode=render_mode, use_cache=False)
+    array = np.concatenate([np.asarray(trace.error_x.array, dtype=float) for trace in fig.data])
+    minus = np.concatenate([np.asarray(trace.error_x.arrayminus, dtype=float) for trace in fig.data])
+    finite = np.isfinite(array)
+    np.testing.assert_allclose(array[finite], [0.3, 0.2, 0.1])
+    np.testing.assert_allclose(minus[finite], [0.1, 0.05, 0.05])
+
+def test_z_error_bars(dataset):
+    fig = plot_eor_limits.plot([dataset], x_axis='z', x_axis_errors=True, use_cache=False)
+    np.testing.assert_allclose(np.asarray(fig.data[1].error_x.array, dtype=float), [1.0])
+    np.testing.assert_allclose(np.asarray(fig.data[1].error_x.arrayminus, dtype=float), [1.0])
+
+def slice_of(x, y, k=None):
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    return dict(iz=0, z=8.0, z_tag='', x=x, y=y, k=x if k is None else np.asarray(k, dtype=float), error_x=None)
+
+def test_decimation_keeps_lowest_point_per_bin():
+    k = np.logspace(-2, 1, 1000)
+    y = np.ones(1000)
+    y[[10, 500]] = [0.5, 0.1]
+    decimated = plot_eor_limits._decimate_slice(slice_of(k, y), 10, x_axis_log=True)
+    assert len(decimated['x']) == 10
+    assert {0.5, 0.1} <= set(decimated['y'])
+    assert np.all(np.diff(decimated['x']) > 0)
+
+def test_decimation_along_k_on_a_z_axis():
+    k = np.logspace(-2, 1, 1000)
+    decimated = plot_eor_limits._decimate_slice(slice_of(np.full(1000, 8.0), np.ones(1000), k), 20, x_axis_log=False)
+    assert len(decimated['x']) == 20 and len(decimated['k']) == 20
+    # Nothing to bin along if k is constant too
+    sl = slice_of(np.full(50, 8.0), np.ones(50), np.ones(50))
+    assert plot_eor_limits._decimate_slice(sl, 20, x_axis_log=False) is sl
+
+def test_decimation_keeps_nan_gaps():
+    x = np.arange(1.0, 101.0)
+    y = np.ones(100)
+    y[40:60] = np.nan
+    decimated = plot_eor_limits._decimate_slice(slice_of(x, y), 10, x_axis_log=False)
+    assert np.isnan(decimated['y']).sum() == 1
+    assert np.isfinite(decimated['y']).sum() <= 10
+
+def test_small_slices_are_not_decimated():
+    sl = slice_of([1.0, 2.0], [1.0, 1.0])
+    assert plot_eor_limits._decimate_slice(sl, 5, x_axis_log=False) is sl
+
+@pytest.mark.parametrize('options, message', [({'render_mode': 'fast'}, "render_mode"), ({'max_points': 0}, "max_points"),
+                                              ({'plot_type': 'bar'}, "plot_type"), ({'plot_kwargs_dict': []}, "must be a dict"),
+                                              ({'plot_kwargs_dict': {'Plot2024': {'marker': 3}}}, r"\['marker'\] must be a dict")])
+def test_invalid_options(dataset, options, message):
+    with pytest.raises(ValueError, match=message):
+        plot_eor_limits.plot([dataset], **options)
+
+def test_traces_are_reused_until_discarded(dataset):
+    cache = plot_eor_limits._trace_cache
+    plot_eor_limits.plot([dataset], plot_kwargs_dict={})
+    hits, misses = cache.hits, cache.misses
+    plot_eor_limits.plot([dataset], plot_kwargs_dict={})
+    assert (cache.hits, cache.misses) == (hits + 1, misses)
+    plot_eor_limits.discard_traces([dataset.fingerprint])
+    plot_eor_limits.plot([dataset], plot_kwargs_dict={})
+    assert cache.misses == misses + 1
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+import eor_limits
+
+@pytest.mark.parametrize('expr, value', [('21**2', 441.0), ('-1.5e3/2', -750.0), ('(1+2)*3', 9.0), (' +4 ', 4.0),
+                                         ('2**-1', 0.5), ('1e2', 100.0)])
+def test_expressions(expr, value):
+    assert eor_limits._eval_expression(expr) == value
+
+@pytest.mark.parametrize('expr', ['nan', 'NaN', 'inf', '-Inf'])
+def test_special_names(expr):
+    value = eor_limits._eval_expression(expr)
+    assert np.isnan(value) or np.isinf(value)
+
+@pytest.mark.parametrize('expr', ["__import__('os')", 'x', 'abs(-1)', '1 if 1 else 2', 'True', '[1]', '2 % 3'])
+def test_unsafe_expressions_are_rejected(expr):
+    with pytest.raises(ValueError, match="only numbers"):
+        eor_limits._eval_expression(expr)
+
+def test_parse_errors_locate_the_item():
+    with pytest.raises(ValueError, match=r"'1/0' in field 'k' at row 2, column 1"):
+        eor_limits._parse_numeric([1, '1/0'], 'k', row=2)
+    with pytest.raises(ValueError, match=r"'10\*\*10\*\*10'"):
+        eor_limits._parse_numeric(['10**10**10'], 'z')
+    with pytest.raises(ValueError, match="in field 'z' at index 0"):
+        eor_limits._parse_numeric(['open'], 'z')
+
+def test_parse_numeric():
+    np.testing.assert_array_equal(eor_limits._parse_numeric([1, '2', '3**2', None], 'k'), [1.0, 2.0, 9.0, np.nan])
+    assert eor_limits._parse_numeric('2*4', 'z') == 8.0
+
+def test_process_data():
+    d = {'z': ['7+1', 9], 'k': [[0.1, '0.2'], ['1/4']], 'delta_squared': [['1e3', 2e3], [None]], 'z_tags': ['a', 'b']}
+    eor_limits.process_data(d)
+    assert d['z'] == [8.0, 9.0] and d['k_lower'] == [] and d['z_lower'] == []
+    np.testing.assert_array_equal(d['k'][1], [0.25])
+    assert np.isnan(d['delta_squared'][1][0])
+
+def test_process_data_mandatory_fields():
+    with pytest.raises(ValueError, match="'delta_squared' is missing"):
+        eor_limits.process_data({'z': [8], 'k': [[0.1]]})
+    with pytest.raises(ValueError, match="k must be a 2D array"):
+        eor_limits.process_data({'z': [8], 'k': 0.1, 'delta_squared': [[1]]})
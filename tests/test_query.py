@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+import eor_limits
+import query_eor_limits
+from conftest import make_dataset
+
+@pytest.fixture
+def index():
+    return query_eor_limits.LimitIndex.build([
+        make_dataset([8.0, 9.0], [[0.1, 1.0], [0.1]], [[100.0, 10000.0], [50.0]]),
+        make_dataset([8.1], [[0.1, 0.2, -1.0]], [[80.0, np.nan, 1.0]])], names=['A', 'B'])
+
+def test_invalid_points_are_not_indexed(index):
+    assert len(index) == 4
+
+def test_nearest(index):
+    result = index.nearest([8.0, 9.2, np.nan], [0.1, 0.1, 0.1])
+    assert result.dataset.tolist() == ['A', 'A', '']
+    assert result.iz.tolist()[:2] == [0, 1]
+    assert result.distance[0] == 0 and result.distance[1] == pytest.approx(0.2)
+    assert not index.nearest([8.5], [0.1], max_distance=0.01).found.any()
+    assert not index.nearest([8.0], [0.1], max_distance=-1).found.any()
+
+def test_lowest(index):
+    result = index.lowest([8.0, 8.05, 20.0], [0.1, 0.1, 0.1], z_tol=0.2)
+    assert result.dataset.tolist() == ['B', 'B', ''] and result.delta_squared[0] == 80.0
+    assert index.lowest([8.0], [0.1], z_tol=0.01).delta_squared[0] == 100.0
+    assert not index.lowest([8.0], [0.1], z_tol=-1).found.any()
+
+def test_interpolate(index):
+    result = index.interpolate([8.0, 8.0, 8.0], [10**-0.5, 0.05, 1.0], z_tol=0.01)
+    assert result.delta_squared[0] == pytest.approx(1000.0)
+    assert result.found.tolist() == [True, False, True] and result.delta_squared[2] == pytest.approx(10000.0)
+
+def test_query_type(index):
+    with pytest.raises(ValueError, match="Invalid query_type"):
+        index.query('highest', [8.0], [0.1])
+
+def test_catalog_index_is_shared_per_version(data_dir):
+    catalog = eor_limits.DatasetCatalog(data_dir)
+    index = query_eor_limits.get_limit_index(catalog, executor='thread')
+    assert query_eor_limits.get_limit_index(catalog) is index
+    assert index.names == ['Good2020'] and len(index) == 5
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+import eor_limits
+from conftest import make_dataset
+
+@pytest.fixture
+def dataset():
+    # Two rows at z=8 (e.g. two fields), one at z=9 with a NaN
+    return make_dataset([8.0, 9.0, 8.0], [[0.1, 0.2, 0.3], [0.1, 0.5], [0.15, 2.0]],
+                        [[30.0, 10.0, 20.0], [np.nan, 5.0], [15.0, 1.0]], z_tags=['a', 'b', 'c'])
+
+def rows(dataset):
+    data = dataset.ragged
+    return [(data.z[iz], data.z_tags[iz], data.k[data.row_slice(iz)].tolist(), data.delta_squared[data.row_slice(iz)].tolist())
+            for iz in range(data.n_z)]
+
+def test_lowest(dataset):
+    assert rows(eor_limits.reduce_dataset(dataset, 'lowest')) == [(8.0, 'c', [2.0], [1.0]), (9.0, 'b', [0.5], [5.0])]
+
+def test_lowest_n_keeps_k_order(dataset):
+    assert rows(eor_limits.reduce_dataset(dataset, 'lowest_n', n=3))[0] == (8.0, 'c', [0.15, 0.2, 2.0], [15.0, 10.0, 1.0])
+
+def test_lowest_per_k_band(dataset):
+    reduced = eor_limits.reduce_dataset(dataset, 'lowest_per_k_band', k_edges=[0.01, 1.0, 10.0])
+    assert [row[2:] for row in rows(reduced)] == [([0.2], [10.0]), ([2.0], [1.0]), ([0.5], [5.0])]
+
+def test_median(dataset):
+    assert [row[3] for row in rows(eor_limits.reduce_dataset(dataset, 'median'))] == [[15.0], [5.0]]
+
+def test_header_is_kept_and_source_unchanged(dataset):
+    reduced = eor_limits.reduce_dataset(dataset, 'lowest')
+    assert (reduced.key, reduced.telescope) == (dataset.key, dataset.telescope)
+    assert dataset.ragged.n_z == 3
+
+def test_unknown_reducer(dataset):
+    with pytest.raises(ValueError, match="Unknown reducer 'highest'"):
+        eor_limits.reduce_dataset(dataset, 'highest')
+
+def test_empty_dataset():
+    assert eor_limits.reduce_dataset(make_dataset([], []), 'lowest').ragged.n_z == 0
@@ -0,0 +1,57 @@
+import asyncio
+import json
+import pytest
+import eor_limits
+import serve_eor_limits
+from conftest import write_yaml
+
+@pytest.fixture
+def service(data_dir):
+    write_yaml(data_dir, 'Other2022', [7], [[0.2, 0.4]], [[5, 6]], year=2022)
+    return serve_eor_limits.LimitsService(eor_limits.DatasetCatalog(data_dir), workers=2, refresh_interval=0)
+
+def get(service, target, **headers):
+    return asyncio.run(service.handle('GET', target, headers))
+
+def test_etag_and_not_modified(service):
+    status, headers, body = get(service, '/datasets')
+    assert status == 200 and [d['name'] for d in json.loads(body)['datasets']] == ['Good2020', 'Other2022']
+    status, revalidated, body = get(service, '/datasets', **{'if-none-match': f'"x", {headers["ETag"]}'})
+    assert (status, body, revalidated['ETag']) == (304, b'', headers['ETag'])
+    assert get(service, '/datasets', **{'if-none-match': '"stale"'})[0] == 200
+
+def test_etag_changes_with_the_catalog(service, data_dir):
+    etag = get(service, '/datasets/Other2022')[1]['ETag']
+    write_yaml(data_dir, 'Other2022', [7], [[0.2]], [[5]], year=2022)
+    status, headers, body = get(service, '/datasets/Other2022')
+    assert headers['ETag'] != etag and json.loads(body)['data']['k'] == [[0.2]]
+
+def test_plot(service):
+    status, headers, body = get(service, '/plot?datasets=Good2020,Other2022&plot_type=scatter&z_range=[6,8]')
+    assert status == 200 and len(json.loads(body)['data']) == 2
+
+def test_concurrent_requests_share_one_build(service):
+    builds = []
+    build = service._build
+    service._build = lambda *args: builds.append(args) or build(*args)
+    async def burst():
+        return await asyncio.gather(*[service.handle('GET', '/plot?x_axis=z', {}) for _ in range(10)])
+    responses = asyncio.run(burst())
+    assert len(builds) == 1 and len({body for _, _, body in responses}) == 1
+
+@pytest.mark.parametrize('target, status', [
+    ('/datasets/Missing2000', 404), ('/nothing', 404), ('/plot?foo=1', 400), ('/plot?z_range=foo', 400),
+    ('/plot?max_points=0', 400), ('/plot?plot_kwargs_dict={Good2020: 5}', 400),
+    ('/plot?plot_kwargs_dict={Good2020: {marker: 3}}', 400), ('/plot?datasets=Good2020&lowest_only=maybe', 400),
+    ('/plot?datasets=Missing2000', 400)])
+def test_errors(service, target, status):
+    response_status, headers, body = get(service, target.replace(' ', '%20'))
+    assert response_status == status and 'error' in json.loads(body) and 'ETag' not in headers
+
+def test_errors_are_not_cached(service):
+    get(service, '/plot?z_range=foo')
+    assert service._cache.stats()['size'] == 0
+
+def test_method_not_allowed(service):
+    status, headers, body = asyncio.run(service.handle('POST', '/datasets', {}))
+    assert status == 405 and headers['Allow'] == 'GET, HEAD'
@@ -0,0 +1,40 @@
+import pytest
+import eor_limits
+from conftest import write_yaml
+
+def data(k, **fields):
+    return dict(z=[7, 8, 9][:len(k)], k=k, delta_squared=[[1.0]*len(row) for row in k], **fields)
+
+@pytest.mark.parametrize('k', [[[0.1, 0.2], [0.3], []], [[], [0.1, 0.2]], [[0.1], [], [0.2]]])
+def test_strict_accepts_empty_k_rows(k):
+    eor_limits.validate_data(data(k), mode='strict')
+
+def test_strict_reports_decreasing_k_next_to_empty_row():
+    with pytest.raises(eor_limits.DataValidationError, match="row 2, column 1"):
+        eor_limits.validate_data(data([[0.1, 0.2], [], [0.3, 0.1]]), mode='strict')
+
+def test_strict_allows_k_to_restart_at_row_boundaries():
+    eor_limits.validate_data(data([[0.1, 0.5], [0.1, 0.5]]), mode='strict')
+
+def test_strict_collects_every_violation():
+    with pytest.raises(eor_limits.DataValidationError) as error:
+        eor_limits.validate_data(data([[-0.1, -0.2]], k_lower=[[0.5, 0.5]]), mode='strict')
+    assert len(error.value.violations) == 3
+
+def test_fast_only_checks_shapes():
+    eor_limits.validate_data(data([[0.2, 0.1]]), mode='fast')
+    with pytest.raises(eor_limits.DataValidationError, match="one row per z"):
+        eor_limits.validate_data(dict(z=[7, 8], k=[[0.1]], delta_squared=[[1.0]]), mode='fast')
+
+def test_invalid_mode():
+    with pytest.raises(ValueError, match="Invalid validation mode"):
+        eor_limits.validate_data(data([[0.1]]), mode='lenient')
+
+@pytest.mark.parametrize('use_cache', [True, False])
+def test_load_dataset_strict_is_not_bypassed_by_cache(data_dir, use_cache):
+    write_yaml(data_dir, 'Bad2021', [8], [[0.2, 0.1]], [[1, 2]], year=2021)
+    assert eor_limits.load_dataset('Bad2021', data_dir=data_dir).year == 2021
+    with pytest.raises(eor_limits.DataValidationError):
+        eor_limits.load_dataset('Bad2021', validation='strict', use_cache=use_cache, data_dir=data_dir)
+    with pytest.raises(eor_limits.DataValidationError):
+        eor_limits.load_dataset_lowest_limits('Bad2021', validation='strict', use_cache=use_cache, data_dir=data_dir)